@@ -25,8 +25,9 @@ ENTRY_TOP_N = 3  # 進場條件: 綜合評分前N名 <<<--- 在這裡修改
 EXIT_THRESHOLD = 4  # 離場條件: 排名跌出前N名
 
 # ===== 回測期間設定 =====
-START_DATE = "2024-06-01"  # 開始日期 (修改為有數據的日期)
-END_DATE = "2024-06-05"  # 結束日期 - 延長至3天以看到完整回測效果
+# 可用環境變量 DEFAULT_START_DATE / DEFAULT_END_DATE 覆蓋（例如 minimum_test.py 的子進程模式）
+START_DATE = os.environ.get("DEFAULT_START_DATE", "2024-06-01")  # 開始日期 (修改為有數據的日期)
+END_DATE = os.environ.get("DEFAULT_END_DATE", "2024-06-05")  # 結束日期 - 延長至3天以看到完整回測效果
 # 移除CSV依賴，全部使用數據庫
 
 
@@ -1198,8 +1199,15 @@ class FundingRateBacktest:
             print(f"\n🏆 最佳策略: {best_strategy['strategy']} (報酬率: {best_strategy['total_roi']:.2%})")
 
 
-# 使用範例
-if __name__ == "__main__":
+def main(start_date=None, end_date=None):
+    """
+    執行回測（可由其他腳本在同一進程內直接調用）
+    :param start_date: 開始日期 'YYYY-MM-DD'，默認使用 START_DATE
+    :param end_date: 結束日期 'YYYY-MM-DD'，默認使用 END_DATE
+    """
+    start_date = start_date or START_DATE
+    end_date = end_date or END_DATE
+
     print("\n" + "="*70)
     print("🚀 智能策略回測系統")
     print("="*70)
@@ -1216,11 +1224,11 @@ if __name__ == "__main__":
     )
 
     # 互動式策略選擇（從數據庫）
-    selected_strategies = backtest.interactive_strategy_selection(START_DATE, END_DATE)
+    selected_strategies = backtest.interactive_strategy_selection(start_date, end_date)
     
     if not selected_strategies:
         print("❌ 沒有選擇任何策略，程式結束")
-        exit(0)
+        return
 
     # 顯示當前參數設定
     print("\n" + "="*70)
@@ -1234,7 +1242,7 @@ if __name__ == "__main__":
     print(f"- 最大持倉數: {MAX_POSITIONS}")
     print(f"- 進場條件: 綜合評分前{ENTRY_TOP_N}名")
     print(f"- 離場條件: 排名跌出前{EXIT_THRESHOLD}名")
-    print(f"- 回測期間: {START_DATE} 至 {END_DATE}")
+    print(f"- 回測期間: {start_date} 至 {end_date}")
     print(f"- 選擇的策略: {selected_strategies}")
     print("- 💾 數據源: 數據庫 (策略排行榜表)")
     print("=" * 70)
@@ -1244,8 +1252,13 @@ if __name__ == "__main__":
         # 單一策略回測
         strategy = selected_strategies[0]
         print(f"\n🎯 執行單一策略回測: {strategy}")
-        backtest.run_backtest(strategy, START_DATE, END_DATE)
+        backtest.run_backtest(strategy, start_date, end_date)
     else:
         # 多策略回測
         print(f"\n🎯 執行多策略回測: {len(selected_strategies)} 個策略")
-        backtest.run_multiple_backtests(selected_strategies, START_DATE, END_DATE)
\ No newline at end of file
+        backtest.run_multiple_backtests(selected_strategies, start_date, end_date)
+
+
+# 使用範例
+if __name__ == "__main__":
+    main()
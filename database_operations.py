@@ -76,7 +76,40 @@ class DatabaseManager(FundingRateDB):
             
             print(f"✅ 插入資金費率歷史數據: {len(data_to_insert)} 條")
             return len(data_to_insert)
-    
+
+    def insert_funding_rate_history_rows(self, rows: List[tuple], batch_size: int = 5000) -> int:
+        """
+        批量插入資金費率歷史數據（不經 DataFrame，單一事務 + executemany）
+
+        Args:
+            rows: (timestamp_utc, symbol, exchange, funding_rate) 元組列表，
+                  timestamp_utc 為 '%Y-%m-%d %H:%M:%S' 字符串，funding_rate 無值時為 None
+            batch_size: 每批 executemany 的記錄數，限制單批內存
+
+        Returns:
+            插入的記錄數
+        """
+        if not rows:
+            print("⚠️ 無數據，跳過插入")
+            return 0
+
+        with self.get_connection() as conn:
+            try:
+                for i in range(0, len(rows), batch_size):
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO funding_rate_history
+                        (timestamp_utc, symbol, exchange, funding_rate)
+                        VALUES (?, ?, ?, ?)
+                    ''', rows[i:i + batch_size])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ 批量插入資金費率歷史數據失敗，已回滾: {e}")
+                raise
+
+        print(f"✅ 插入資金費率歷史數據: {len(rows)} 條")
+        return len(rows)
+
     def get_funding_rate_history(self, symbol: str = None, exchange: str = None, 
                                start_date: str = None, end_date: str = None, 
                                limit: int = None) -> pd.DataFrame:
@@ -130,11 +163,7 @@ class DatabaseManager(FundingRateDB):
             """SQLite性能優化設置"""
             print("⚡ 啟用SQLite高級優化...")
             
-            # WAL模式 - 允許同時讀寫，大幅提升並發性能
-            conn.execute("PRAGMA journal_mode = WAL")
-            
-            # 同步模式優化 - 減少磁盤同步，提升寫入速度
-            conn.execute("PRAGMA synchronous = NORMAL")  # 從FULL改為NORMAL，性能提升3-5倍
+            # WAL 模式與 synchronous = NORMAL 已在 get_connection() 建立連接時設定
             
             # 緩存大小優化 - 使用更大內存緩存
             conn.execute("PRAGMA cache_size = -64000")  # 64MB緩存（負數表示KB）
@@ -866,33 +895,66 @@ class DatabaseManager(FundingRateDB):
         
         return pd.read_sql_query(query, self.get_connection(), params=params)
     
+    def get_market_caps_version(self) -> tuple:
+        """
+        市值表的數據版本 (記錄數, 最大 id, 最大 updated_at)，單一聚合查詢；
+        INSERT OR REPLACE 會產生新 id，任何寫入或刪除都會改變此版本
+        """
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(id), MAX(updated_at) FROM market_caps"
+            ).fetchone()
+        return tuple(row)
+    
     # ==================== 交易對數據操作 ====================
     
     def insert_trading_pairs(self, df: pd.DataFrame) -> int:
         """插入交易對數據"""
         if df.empty:
             return 0
+        
+        # 支持大寫/小寫兩種列名格式，按列取值後轉為元組（不逐行構造 Series）
+        df = df.rename(columns=str.lower)
+        columns = ['symbol', 'exchange_a', 'exchange_b', 'market_cap', 'fr_date']
+        df = df.reindex(columns=columns).astype(object)
+        df = df.where(df.notna(), None)
+        
+        rows = [
+            # 市值為 0（無市值資料）時寫入 NULL
+            (symbol, exchange_a, exchange_b, market_cap or None, fr_date)
+            for symbol, exchange_a, exchange_b, market_cap, fr_date in df.itertuples(index=False, name=None)
+        ]
+        return self.insert_trading_pairs_rows(rows)
+    
+    def insert_trading_pairs_rows(self, rows: List[tuple]) -> int:
+        """
+        批量插入交易對數據（不經 DataFrame，單一事務 + executemany）
+
+        Args:
+            rows: (symbol, exchange_a, exchange_b, market_cap, fr_date) 元組列表，
+                  market_cap / fr_date 無值時為 None
+
+        Returns:
+            插入的記錄數
+        """
+        if not rows:
+            return 0
             
         with self.get_connection() as conn:
-            data_to_insert = []
-            
-            for _, row in df.iterrows():
-                data_to_insert.append((
-                    row.get('Symbol') or row.get('symbol'),
-                    row.get('Exchange_A') or row.get('exchange_a'),
-                    row.get('Exchange_B') or row.get('exchange_b'),
-                    row.get('Market_Cap') or row.get('market_cap'),
-                    row.get('FR_Date') or row.get('fr_date')
-                ))
-            
-            conn.executemany('''
-                INSERT OR REPLACE INTO trading_pairs 
-                (symbol, exchange_a, exchange_b, market_cap, fr_date)
-                VALUES (?, ?, ?, ?, ?)
-            ''', data_to_insert)
+            try:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO trading_pairs 
+                    (symbol, exchange_a, exchange_b, market_cap, fr_date)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ 批量插入交易對數據失敗，已回滾: {e}")
+                raise
             
-            print(f"✅ 插入交易對數據: {len(data_to_insert)} 條")
-            return len(data_to_insert)
+        print(f"✅ 插入交易對數據: {len(rows)} 條")
+        return len(rows)
     
     def get_trading_pairs(self, symbol: str = None, min_market_cap: float = None) -> pd.DataFrame:
         """查詢交易對數據"""
@@ -906,7 +968,8 @@ class DatabaseManager(FundingRateDB):
             query += " AND market_cap >= ?"
             params.append(min_market_cap)
             
-        query += " ORDER BY market_cap DESC"
+        # 排序在讀取時完成（寫入時不排序），idx_trading_pairs_market_cap_symbol 索引可直接按序掃描
+        query += " ORDER BY market_cap DESC, symbol ASC"
         
         return pd.read_sql_query(query, self.get_connection(), params=params)
     
@@ -5,6 +5,7 @@
 
 import sqlite3
 import os
+import threading
 from datetime import datetime
 
 class FundingRateDB:
@@ -18,13 +19,23 @@ class FundingRateDB:
         # 確保數據庫目錄存在
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
+        # 每個執行緒復用同一個連接，避免重複開啟數據庫
+        self._local = threading.local()
         self.init_database()
         print(f"✅ 數據庫初始化完成: {db_path}")
     
     def get_connection(self):
-        """獲取數據庫連接，返回字典式結果"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # 返回字典式結果，便於操作
+        """獲取數據庫連接（同一執行緒內復用），返回字典式結果"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row  # 返回字典式結果，便於操作
+            conn.execute("PRAGMA cache_size = -20000")  # 20MB 頁面緩存（負數表示KB）
+            # WAL + NORMAL：提交時只需一次 fsync；journal_mode 作用於整個數據庫、synchronous 作用於連接，
+            # 在建立連接時設定一次即可，寫入方法無需重複設定
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
         return conn
     
     def init_database(self):
@@ -273,17 +284,24 @@ class FundingRateDB:
     
     def _create_indexes(self, conn):
         """創建索引提升查詢性能"""
+        self._drop_redundant_funding_history_indexes(conn)
+        
         indexes = [
             # 資金費率歷史數據索引
-            "CREATE INDEX IF NOT EXISTS idx_funding_history_symbol_exchange ON funding_rate_history(symbol, exchange)",
             "CREATE INDEX IF NOT EXISTS idx_funding_history_timestamp ON funding_rate_history(timestamp_utc)",
             "CREATE INDEX IF NOT EXISTS idx_funding_history_symbol_time ON funding_rate_history(symbol, timestamp_utc)",
+            # 覆蓋索引：(symbol, exchange) 查詢、時間範圍查詢 (fetch_FR_history.check_existing_data)
+            # 及 get_diff_first_date 的自連接都只需掃描索引，不必回表讀取 funding_rate
+            "CREATE INDEX IF NOT EXISTS idx_funding_history_symbol_exchange_time ON funding_rate_history(symbol, exchange, timestamp_utc, funding_rate)",
             
             # 資金費率差異索引
             "CREATE INDEX IF NOT EXISTS idx_funding_diff_symbol ON funding_rate_diff(symbol)",
             "CREATE INDEX IF NOT EXISTS idx_funding_diff_timestamp ON funding_rate_diff(timestamp_utc)",
             "CREATE INDEX IF NOT EXISTS idx_funding_diff_exchanges ON funding_rate_diff(exchange_a, exchange_b)",
             
+            # 交易對索引（get_trading_pairs 按市值降序、symbol 升序讀取）
+            "CREATE INDEX IF NOT EXISTS idx_trading_pairs_market_cap_symbol ON trading_pairs(market_cap DESC, symbol)",
+            
             # 收益指標索引
             "CREATE INDEX IF NOT EXISTS idx_return_metrics_date ON return_metrics(date)",
             "CREATE INDEX IF NOT EXISTS idx_return_metrics_pair ON return_metrics(trading_pair)",
@@ -325,6 +343,19 @@ class FundingRateDB:
             except sqlite3.Error as e:
                 print(f"⚠️ 創建索引時出錯: {e}")
     
+    def _drop_redundant_funding_history_indexes(self, conn):
+        """
+        刪除已被覆蓋索引 idx_funding_history_symbol_exchange_time 取代的舊索引，
+        避免每次寫入 funding_rate_history 時重複維護前綴相同的多個索引
+        """
+        # 舊版的三欄 (symbol, exchange, timestamp_utc) 索引同名，需刪除後按四欄重建
+        columns = [row[2] for row in conn.execute("PRAGMA index_info(idx_funding_history_symbol_exchange_time)")]
+        if columns and 'funding_rate' not in columns:
+            conn.execute("DROP INDEX idx_funding_history_symbol_exchange_time")
+        # (symbol, exchange) 為覆蓋索引的前綴；idx_frh_sym_ex_ts_rate 為 get_diff_first_date 曾單獨建立的相同索引
+        conn.execute("DROP INDEX IF EXISTS idx_funding_history_symbol_exchange")
+        conn.execute("DROP INDEX IF EXISTS idx_frh_sym_ex_ts_rate")
+    
     def _create_views(self, conn):
         """創建有用的視圖"""
         
@@ -11,11 +11,123 @@
 - 輸入數據來自 return_metrics 表的各個ROI欄位
 - 支持 roi_1d, roi_7d, roi_14d, roi_30d 等不同時間週期的數據
 - 函式保持純數學計算，不涉及數據庫操作
+
+性能優化：
+- 每個公開函式只負責把 Series 轉為 float64 ndarray 並去除 NaN，
+  實際計算交給以 numba @njit 編譯的 _xxx_nb 核心函式
+- 未安裝 numba 時，njit 退化為不做任何事的裝飾器，結果完全相同
 """
 
 import pandas as pd
 import numpy as np
-from scipy.stats import linregress
+
+# 嘗試導入 numba，如果沒有則使用純 Python/NumPy 執行
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+def _to_clean_array(series: pd.Series) -> np.ndarray:
+    """將 Series 轉為 float64 ndarray 並去除 NaN（等同 series.dropna()）"""
+    values = np.asarray(series, dtype=np.float64)
+    return values[~np.isnan(values)]
+
+@njit(cache=True, error_model="numpy")
+def _mean_std_nb(values):
+    """單次遍歷計算平均值與樣本標準差 (ddof=1，與 pandas 一致)；不足兩筆時標準差為 NaN"""
+    n = values.shape[0]
+    mean = 0.0
+    for i in range(n):
+        mean += values[i]
+    mean /= n
+    if n < 2:
+        return mean, np.nan
+    sq = 0.0
+    for i in range(n):
+        d = values[i] - mean
+        sq += d * d
+    return mean, np.sqrt(sq / (n - 1))
+
+@njit(cache=True, error_model="numpy")
+def _trend_slope_nb(values):
+    n = values.shape[0]
+    x_mean = (n - 1) / 2.0
+    y_mean = 0.0
+    for i in range(n):
+        y_mean += values[i]
+    y_mean /= n
+    sxy = 0.0
+    sxx = 0.0
+    for i in range(n):
+        dx = i - x_mean
+        sxy += dx * (values[i] - y_mean)
+        sxx += dx * dx
+    return sxy / sxx
+
+@njit(cache=True, error_model="numpy")
+def _sharpe_ratio_nb(values, annualizing_factor):
+    mean_return, std_dev = _mean_std_nb(values)
+    if std_dev == 0 or np.isnan(std_dev):
+        return np.inf if mean_return > 0 else 0.0
+    return (mean_return / std_dev) * np.sqrt(annualizing_factor)
+
+@njit(cache=True, error_model="numpy")
+def _inv_std_dev_nb(values, epsilon, high_score):
+    mean_return, std_dev = _mean_std_nb(values)
+    if mean_return <= 0:
+        return 0.0
+    if std_dev < epsilon:
+        return high_score
+    return 1 / std_dev
+
+@njit(cache=True, error_model="numpy")
+def _win_rate_nb(values):
+    winning_days = 0
+    for i in range(values.shape[0]):
+        if values[i] > 0:
+            winning_days += 1
+    return winning_days / values.shape[0]
+
+@njit(cache=True, error_model="numpy")
+def _max_drawdown_nb(values):
+    cumulative_return = 1.0
+    running_max = -np.inf
+    max_drawdown = np.nan
+    for i in range(values.shape[0]):
+        cumulative_return *= 1 + values[i]
+        if cumulative_return > running_max:
+            running_max = cumulative_return
+        drawdown = (cumulative_return - running_max) / running_max
+        # 與 pandas .min() 一致：忽略 NaN
+        if not np.isnan(drawdown) and (np.isnan(max_drawdown) or drawdown < max_drawdown):
+            max_drawdown = drawdown
+    return max_drawdown
+
+@njit(cache=True, error_model="numpy")
+def _sortino_ratio_nb(values, annualizing_factor):
+    n = values.shape[0]
+    total = 0.0
+    n_negative = 0
+    for i in range(n):
+        total += values[i]
+        if values[i] < 0:
+            n_negative += 1
+    mean_return = total / n
+    if n_negative == 0:
+        return np.inf if mean_return > 0 else 0.0
+    negative_returns = np.empty(n_negative)
+    j = 0
+    for i in range(n):
+        if values[i] < 0:
+            negative_returns[j] = values[i]
+            j += 1
+    _, downside_std = _mean_std_nb(negative_returns)
+    if downside_std == 0 or np.isnan(downside_std):
+        return np.inf if mean_return > 0 else 0.0
+    return (mean_return / downside_std) * np.sqrt(annualizing_factor)
 
 def calculate_trend_slope(series: pd.Series, **kwargs) -> float:
     """
@@ -37,17 +149,13 @@ def calculate_trend_slope(series: pd.Series, **kwargs) -> float:
         return np.nan
     
     # 確保 series 中的 NaN 值被處理
-    series = series.dropna()
-    if len(series) < 2:
+    values = _to_clean_array(series)
+    if len(values) < 2:
         return np.nan
 
     # 修正：直接對原始數據做線性回歸，不做累積和
-    time_index = np.arange(len(series))
-    
-    # 使用scipy.stats.linregress計算斜率，它高效且穩定
-    slope, _, _, _, _ = linregress(time_index, series)
-    
-    return slope
+    # 最小二乘斜率 = Σ(x-x̄)(y-ȳ) / Σ(x-x̄)²，與 scipy.stats.linregress 相同
+    return float(_trend_slope_nb(values))
 
 def calculate_sharpe_ratio(series: pd.Series, annualizing_factor: int = 365, **kwargs) -> float:
     """
@@ -68,19 +176,13 @@ def calculate_sharpe_ratio(series: pd.Series, annualizing_factor: int = 365, **k
         3. 夏普比率 = (平均回報 / 標準差) * sqrt(年化係數)
     """
     # 確保 series 中的 NaN 值被處理
-    series = series.dropna()
-    if series.empty:
+    values = _to_clean_array(series)
+    if len(values) == 0:
         return np.nan
-        
-    mean_return = series.mean()
-    std_dev = series.std()
 
-    if std_dev == 0 or np.isnan(std_dev):
-        # 如果波動為0，且平均回報為正，給予一個極大的夏普值
-        # 如果平均回報也為0或負，則夏普為0
-        return np.inf if mean_return > 0 else 0.0
-
-    return (mean_return / std_dev) * np.sqrt(annualizing_factor)
+    # 如果波動為0，且平均回報為正，給予一個極大的夏普值
+    # 如果平均回報也為0或負，則夏普為0
+    return float(_sharpe_ratio_nb(values, float(annualizing_factor)))
 
 def calculate_inv_std_dev(series: pd.Series, epsilon: float = 1e-9, high_score: float = 1e9, **kwargs) -> float:
     """
@@ -100,23 +202,12 @@ def calculate_inv_std_dev(series: pd.Series, epsilon: float = 1e-9, high_score:
         2. 如果標準差極小，給予高分數
         3. 否則返回 1/標準差
     """
-    series = series.dropna()
-    if series.empty:
+    values = _to_clean_array(series)
+    if len(values) == 0:
         return 0.0 # 空數據返回 0
 
-    mean_return = series.mean()
-    
-    # 如果平均回報為負或零，穩定性無意義，返回 0
-    if mean_return <= 0:
-        return 0.0
-
-    std_dev = series.std()
-    
-    # 如果波動為0且平均回報為正，給予極高的、但有限的穩定性分數
-    if std_dev < epsilon:
-        return high_score
-
-    return 1 / std_dev
+    # 平均回報為負或零時返回 0；波動極小且平均回報為正時給予有限的高分
+    return float(_inv_std_dev_nb(values, float(epsilon), float(high_score)))
 
 def calculate_win_rate(series: pd.Series, **kwargs) -> float:
     """
@@ -134,12 +225,11 @@ def calculate_win_rate(series: pd.Series, **kwargs) -> float:
         2. 勝率 = 獲利天數 / 總天數
     """
     # 確保 series 中的 NaN 值被處理
-    series = series.dropna()
-    if len(series) == 0:
+    values = _to_clean_array(series)
+    if len(values) == 0:
         return 0.0
 
-    winning_days = (series > 0).sum()
-    return winning_days / len(series)
+    return float(_win_rate_nb(values))
 
 def calculate_max_drawdown(series: pd.Series, **kwargs) -> float:
     """
@@ -158,21 +248,12 @@ def calculate_max_drawdown(series: pd.Series, **kwargs) -> float:
         3. 計算當前值相對於峰值的回撤
         4. 返回最大回撤值
     """
-    series = series.dropna()
-    if series.empty:
+    values = _to_clean_array(series)
+    if len(values) == 0:
         return 0.0
     
-    # 計算累積回報
-    cumulative_return = (1 + series).cumprod()
-    
-    # 計算滾動最大值
-    running_max = cumulative_return.expanding().max()
-    
-    # 計算回撤
-    drawdown = (cumulative_return - running_max) / running_max
-    
-    # 返回最大回撤（負值）
-    return drawdown.min()
+    # 單次遍歷累積回報、滾動峰值與回撤，返回最大回撤（負值）
+    return float(_max_drawdown_nb(values))
 
 def calculate_sortino_ratio(series: pd.Series, annualizing_factor: int = 365, **kwargs) -> float:
     """
@@ -191,25 +272,12 @@ def calculate_sortino_ratio(series: pd.Series, annualizing_factor: int = 365, **
         2. 計算負回報的標準差（下行風險）
         3. 索提諾比率 = (平均回報 / 下行標準差) * sqrt(年化係數)
     """
-    series = series.dropna()
-    if series.empty:
+    values = _to_clean_array(series)
+    if len(values) == 0:
         return np.nan
     
-    mean_return = series.mean()
-    
-    # 只考慮負回報
-    negative_returns = series[series < 0]
-    
-    if len(negative_returns) == 0:
-        # 沒有負回報，給予極高分數
-        return np.inf if mean_return > 0 else 0.0
-    
-    downside_std = negative_returns.std()
-    
-    if downside_std == 0 or np.isnan(downside_std):
-        return np.inf if mean_return > 0 else 0.0
-    
-    return (mean_return / downside_std) * np.sqrt(annualizing_factor)
+    # 只考慮負回報；沒有負回報時給予極高分數
+    return float(_sortino_ratio_nb(values, float(annualizing_factor)))
 
 # --- 您未來可以在此處添加更多因子計算函式 ---
 # 例如: Calmar Ratio, Information Ratio, Beta, Alpha 等
@@ -1,12 +1,32 @@
 #!/usr/bin/env python
 import datetime
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import os
 import requests
+import sys
 import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 
 # 添加數據庫支持
 from database_operations import DatabaseManager
+from rate_limiter import RateLimiter, RATE_LIMITS
+
+log = logging.getLogger(__name__)
+
+# 嘗試導入 orjson（C 實現，解析更快），如果沒有則使用標準庫 json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # ---------------------------
 # 預設參數 (當命令列參數未提供時會使用)
@@ -16,73 +36,156 @@ DEFAULT_SYMBOL = "ETHUSDT"      # 交易對，例如 "BTCUSDT"
 DEFAULT_START_DATE = "2024-01-01"   # 起始日期 (UTC, 格式 YYYY-MM-DD)
 DEFAULT_END_DATE   = "2024-01-03"   # 結束日期 (UTC, 格式 YYYY-MM-DD)
 
-# 每次 API 抓取區間（天）及呼叫間隔
+# 每次 API 抓取區間（天）及同一交易所兩次呼叫的最小間隔
 CHUNK_DAYS = 5
-WAIT_TIME = 0.5
+# 同時抓取的區間數
+MAX_WORKERS = 4
+
+# 查詢請求範圍內已存在的整點（上界 +1 小時由 SQL 計算）
+# 固定為模組常量：同一連接上 sqlite3 的語句快取可直接復用已編譯的語句
+EXISTING_HOURS_SQL = """
+    SELECT CAST(strftime('%s', timestamp_utc) AS INTEGER) / 3600 AS hr
+    FROM funding_rate_history
+    WHERE symbol = ? AND exchange = ? AND timestamp_utc >= ? AND timestamp_utc < datetime(?, '+1 hour')
+"""
+
+# 本地快取：已彙整的每小時數據，避免重跑時重複呼叫 API
+CACHE_DIR = ".funding_cache"
+# 只快取抓取耗時超過此秒數的區間，避免小區間造成大量檔案
+CACHE_MIN_FETCH_SECONDS = 2.0
+
+# 共用 HTTP Session：保持連線 (keep-alive)，避免每次請求重新握手
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
+def resize_session_pool(pool_maxsize):
+    """
+    調整共用 SESSION 每個主機的連線池大小
+    並發呼叫方（例如 fetch_FR_history_group_v1 同時處理多個交易對）的同時請求數超過連線池時，
+    urllib3 會丟棄多出的連線並重新握手，因此需把連線池擴大到最大並發請求數
+    """
+    SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize))
+
+# ---------------------------
+# 限速與並行抓取工具
+# ---------------------------
+# 各交易所的限額 (平均間隔秒數, 突發請求數) 定義於 rate_limiter.RATE_LIMITS，與 fetch_FR_history_v2 共用
+RATE_LIMITERS = {exch: RateLimiter(interval, burst) for exch, (interval, burst) in RATE_LIMITS.items()}
+
+def split_windows(start_dt, end_dt):
+    """將 start_dt ~ end_dt 切成每段 CHUNK_DAYS 天的抓取區間"""
+    windows = []
+    current_dt = start_dt
+    while current_dt < end_dt:
+        fetch_end = min(current_dt + datetime.timedelta(days=CHUNK_DAYS), end_dt)
+        windows.append((current_dt, fetch_end))
+        current_dt = fetch_end
+    return windows
+
+def to_points(records, ts_key, ts_multiplier=1):
+    """
+    將 API 原始記錄投影為 (時間戳毫秒, 資金費率) 元組，丟棄其餘欄位
+    ts_multiplier: 時間戳單位換算為毫秒的倍數（Gate.io 為秒，需 *1000）
+    """
+    points = []
+    for item in records:
+        try:
+            ts = int(item[ts_key]) * ts_multiplier
+        except Exception as e:
+            print(f"Error parsing {ts_key}:", item.get(ts_key), e)
+            continue
+        try:
+            rate = float(item.get("fundingRate", 0))
+        except Exception as e:
+            print("Error parsing fundingRate:", item.get("fundingRate"), e)
+            rate = 0.0
+        points.append((ts, rate))
+    return points
+
+def fetch_windows_concurrently(fetch_window, start_dt, end_dt):
+    """以執行緒池並行抓取所有區間，並按時間順序合併結果"""
+    windows = split_windows(start_dt, end_dt)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda w: fetch_window(*w), windows))
+    all_data = []
+    for data in results:
+        all_data.extend(data)
+    return all_data
 
 # ---------------------------
 # 符號格式轉換函式
 # ---------------------------
+SYMBOL_ADJUSTERS = {
+    "gate.io": lambda symbol: symbol[:-4] + "_" + symbol[-4:],
+    "okx": lambda symbol: symbol[:-4] + "-" + symbol[-4:] + "-SWAP",
+}
+
+@functools.lru_cache(maxsize=1024)
 def adjust_symbol(exchange, symbol):
     """
     根據不同交易所，調整交易對格式：
       - Gate.io: "BTCUSDT" -> "BTC_USDT"
       - OKX:    "BTCUSDT" -> "BTC-USDT-SWAP"
       - Binance、Bybit 則不轉換
+    結果對同一 (exchange, symbol) 不變，故做快取；main 只需計算一次並傳入抓取函式
     """
-    exch = exchange.lower()
-    if exch == "gate.io":
-        return symbol[:-4] + "_" + symbol[-4:]
-    elif exch == "okx":
-        return symbol[:-4] + "-" + symbol[-4:] + "-SWAP"
-    else:
-        return symbol
+    adjuster = SYMBOL_ADJUSTERS.get(exchange.lower())
+    return adjuster(symbol) if adjuster else symbol
 
 # ---------------------------
 # 數據庫操作函數
 # ---------------------------
+@functools.lru_cache(maxsize=1)
+def get_db():
+    """整個進程共用一個 DatabaseManager，避免每次調用都重新初始化數據庫"""
+    return DatabaseManager()
+
 def check_existing_data(symbol, exchange, start_dt, end_dt):
     """
     檢查數據庫中已存在的資金費率數據
-    返回需要獲取的時間範圍列表
+    以 SQL 取出請求範圍內已存在的整點，與請求的每小時序列求差集，
+    返回需要獲取的連續時間範圍列表（包含前段、後段及中間的缺口）
     """
     try:
-        db = DatabaseManager()
+        db = get_db()
         
-        # 查詢現有數據的時間範圍
-        query = """
-            SELECT MIN(timestamp_utc) as min_time, MAX(timestamp_utc) as max_time, COUNT(*) as count
-            FROM funding_rate_history 
-            WHERE symbol = ? AND exchange = ?
-        """
+        # 請求範圍的首尾整點只解析一次；以「自 epoch 起的小時數」表示整點，方便做集合運算
+        range_start = pd.Timestamp(start_dt).floor("h")
+        range_end = pd.Timestamp(end_dt).floor("h")
+        start_hr = int(range_start.timestamp()) // 3600
+        end_hr = int(range_end.timestamp()) // 3600
         
         with db.get_connection() as conn:
-            result = conn.execute(query, (symbol, exchange.lower())).fetchone()
+            rows = conn.execute(EXISTING_HOURS_SQL, (
+                symbol, exchange.lower(),
+                range_start.strftime("%Y-%m-%d %H:%M:%S"), range_end.strftime("%Y-%m-%d %H:%M:%S"),
+            )).fetchall()
         
-        if not result or result[2] == 0:
+        if not rows:
             # 無現有數據，需要獲取完整範圍
             print(f"數據庫中無現有數據，需要獲取完整範圍")
             return [(start_dt, end_dt)]
         
-        existing_start = pd.to_datetime(result[0])
-        existing_end = pd.to_datetime(result[1])
-        print(f"現有數據範圍：{existing_start} ~ {existing_end}")
-        
-        # 計算需要補充的時間範圍
-        missing_ranges = []
+        existing = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        print(f"請求範圍內現有數據：{len(np.unique(existing))} / {end_hr - start_hr + 1} 小時")
         
-        # 前段缺失
-        if start_dt < existing_start:
-            missing_ranges.append((start_dt, existing_start - pd.Timedelta(hours=1)))
-            print(f"需要補充前段：{start_dt} ~ {existing_start - pd.Timedelta(hours=1)}")
+        # 計算需要補充的時間範圍：缺失整點按連續區段合併
+        missing = np.setdiff1d(np.arange(start_hr, end_hr + 1, dtype=np.int64), existing)
+        if missing.size == 0:
+            print("數據已完整，無需更新")
+            return []
         
-        # 後段缺失
-        if end_dt > existing_end:
-            missing_ranges.append((existing_end + pd.Timedelta(hours=1), end_dt))
-            print(f"需要補充後段：{existing_end + pd.Timedelta(hours=1)} ~ {end_dt}")
+        breaks = np.flatnonzero(np.diff(missing) != 1)
+        gap_starts = np.concatenate(([missing[0]], missing[breaks + 1]))
+        gap_ends = np.concatenate((missing[breaks], [missing[-1]]))
         
-        if not missing_ranges:
-            print("數據已完整，無需更新")
+        missing_ranges = []
+        for gap_start, gap_end in zip(gap_starts.tolist(), gap_ends.tolist()):
+            range_start = datetime.datetime.fromtimestamp(gap_start * 3600, datetime.timezone.utc)
+            # 區段結束取該小時的最後一秒，與 end_dt (23:59:59) 的慣例一致
+            range_end = datetime.datetime.fromtimestamp((gap_end + 1) * 3600 - 1, datetime.timezone.utc)
+            missing_ranges.append((max(range_start, start_dt), min(range_end, end_dt)))
+            print(f"需要補充：{missing_ranges[-1][0]} ~ {missing_ranges[-1][1]}")
         
         return missing_ranges
         
@@ -90,30 +193,22 @@ def check_existing_data(symbol, exchange, start_dt, end_dt):
         print(f"檢查現有數據時出錯: {e}")
         return [(start_dt, end_dt)]
 
-def save_to_database(data, exchange, symbol):
+def save_to_database(df, exchange, symbol):
     """
     將資金費率數據保存到數據庫
+    df 為 aggregate_hourly_df 的輸出 (timestamp_utc, funding_rate)，
+    直接組裝 (timestamp_utc, symbol, exchange, funding_rate) 元組批量寫入
     """
-    db_data = []
-    
-    for dt_hour, rate in data.items():
-        # 保持API原始邏輯：如果是"null"或沒有數據，保存為None
-        rate_value = None if rate == "null" else rate
-        
-        db_data.append({
-            'timestamp_utc': dt_hour,
-            'symbol': symbol,
-            'exchange': exchange,
-            'funding_rate': rate_value
-        })
-    
-    # 轉換為DataFrame
-    df = pd.DataFrame(db_data)
-    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc'])
+    # 只轉換兩個真正變化的列；symbol/exchange 為常量，不必展開成整列字符串
+    timestamps = df["timestamp_utc"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+    rates = df["funding_rate"].to_numpy(dtype=np.float64)
+    # 保持API原始邏輯：沒有數據(NaN)保存為None
+    rates = np.where(np.isnan(rates), None, rates).tolist()
+    rows = list(zip(timestamps, itertools.repeat(symbol), itertools.repeat(exchange), rates))
     
-    # 保存到數據庫
-    db = DatabaseManager()
-    inserted_count = db.insert_funding_rate_history(df)
+    # 保存到數據庫（單一事務 + executemany）
+    db = get_db()
+    inserted_count = db.insert_funding_rate_history_rows(rows)
     print(f"✅ 數據庫插入: {inserted_count} 條記錄 ({symbol}_{exchange})")
     
     return inserted_count
@@ -121,106 +216,95 @@ def save_to_database(data, exchange, symbol):
 # ---------------------------
 # 新增：檢查資料是否全為 null 的工具函式
 # ---------------------------
-def is_all_null(data):
+def is_all_null(df):
     """
-    檢查傳入的資料字典所有 funding rate 是否皆為 "null"。
+    檢查傳入的 DataFrame 所有 funding rate 是否皆為空值 (NaN)。
     若資料為空也視為全 null。
     """
-    if not data:
-        return True
-    for rate in data.values():
-        if rate != "null":
-            return False
-    return True
+    rates = df["funding_rate"].to_numpy(dtype=np.float64)
+    return rates.size == 0 or bool(np.isnan(rates).all())
 
 # ---------------------------
 # API 資金費率抓取函式
 # ---------------------------
 def fetch_binance_funding_rates(symbol, start_dt, end_dt):
-    all_data = []
-    current_dt = start_dt
-    while current_dt < end_dt:
-        fetch_end = min(current_dt + datetime.timedelta(days=CHUNK_DAYS), end_dt)
+    def fetch_window(window_start, window_end):
         params = {
             "symbol": symbol,
-            "startTime": int(current_dt.timestamp() * 1000),
-            "endTime": int(fetch_end.timestamp() * 1000),
+            "startTime": int(window_start.timestamp() * 1000),
+            "endTime": int(window_end.timestamp() * 1000),
             "limit": 1000
         }
         url = "https://fapi.binance.com/fapi/v1/fundingRate"
+        RATE_LIMITERS["binance"].wait()
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
-            all_data.extend(data)
-            print(f"[Binance] {symbol} {current_dt.strftime('%Y-%m-%d')} ~ {fetch_end.strftime('%Y-%m-%d')} 取得 {len(data)} 筆")
+            data = json_loads(response.content)
+            log.info("[Binance] %s %s ~ %s 取得 %d 筆", symbol, window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d'), len(data))
+            return to_points(data, "fundingTime")
         except Exception as e:
-            print(f"[Binance] {symbol} {current_dt.strftime('%Y-%m-%d')} 錯誤: {e}")
-        time.sleep(WAIT_TIME)
-        current_dt = fetch_end
-    return all_data
+            print(f"[Binance] {symbol} {window_start.strftime('%Y-%m-%d')} 錯誤: {e}")
+            return []
+    return fetch_windows_concurrently(fetch_window, start_dt, end_dt)
 
 def fetch_bybit_funding_rates(symbol, start_dt, end_dt, category="linear"):
-    all_data = []
-    current_dt = start_dt
-    while current_dt < end_dt:
-        fetch_end = min(current_dt + datetime.timedelta(days=CHUNK_DAYS), end_dt)
+    def fetch_window(window_start, window_end):
         params = {
             "category": category,
             "symbol": symbol,
-            "startTime": int(current_dt.timestamp() * 1000),
-            "endTime": int(fetch_end.timestamp() * 1000),
+            "startTime": int(window_start.timestamp() * 1000),
+            "endTime": int(window_end.timestamp() * 1000),
             "limit": 200
         }
         url = "https://api.bybit.com/v5/market/funding/history"
+        RATE_LIMITERS["bybit"].wait()
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
-            result = response.json()
+            result = json_loads(response.content)
             if result.get("retCode") == 0 and result.get("result", {}).get("list"):
                 data = result["result"]["list"]
-                all_data.extend(data)
-                print(f"[Bybit] {symbol} {current_dt.strftime('%Y-%m-%d')} ~ {fetch_end.strftime('%Y-%m-%d')} 取得 {len(data)} 筆")
-            else:
-                print(f"[Bybit] {symbol} {current_dt.strftime('%Y-%m-%d')} 無資料或 API 錯誤，回傳: {result}")
+                log.info("[Bybit] %s %s ~ %s 取得 %d 筆", symbol, window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d'), len(data))
+                return to_points(data, "fundingRateTimestamp")
+            print(f"[Bybit] {symbol} {window_start.strftime('%Y-%m-%d')} 無資料或 API 錯誤，回傳: {result}")
         except Exception as e:
-            print(f"[Bybit] {symbol} {current_dt.strftime('%Y-%m-%d')} 錯誤: {e}")
-        time.sleep(WAIT_TIME)
-        current_dt = fetch_end
-    return all_data
+            print(f"[Bybit] {symbol} {window_start.strftime('%Y-%m-%d')} 錯誤: {e}")
+        return []
+    return fetch_windows_concurrently(fetch_window, start_dt, end_dt)
 
-def fetch_gateio_funding_rates(symbol, start_dt, end_dt):
-    all_data = []
-    contract = adjust_symbol("gate.io", symbol)
-    current_dt = start_dt
-    while current_dt < end_dt:
-        fetch_end = min(current_dt + datetime.timedelta(days=CHUNK_DAYS), end_dt)
+def fetch_gateio_funding_rates(contract, start_dt, end_dt):
+    """
+    從 Gate.io API 獲取資金費率歷史數據
+    contract 為已轉換的 Gate.io 合約名稱，例如 "BTC_USDT"
+    """
+    def fetch_window(window_start, window_end):
         params = {
             "contract": contract,
-            "start": int(current_dt.timestamp()),  # Gate.io 使用秒
-            "end": int(fetch_end.timestamp()),
+            "start": int(window_start.timestamp()),  # Gate.io 使用秒
+            "end": int(window_end.timestamp()),
             "limit": 1000
         }
         url = "https://api.gateio.ws/api/v4/futures/usdt/funding_rate_history"
+        RATE_LIMITERS["gate.io"].wait()
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
-            all_data.extend(data)
-            print(f"[Gate.io] {contract} {current_dt.strftime('%Y-%m-%d')} ~ {fetch_end.strftime('%Y-%m-%d')} 取得 {len(data)} 筆")
+            data = json_loads(response.content)
+            log.info("[Gate.io] %s %s ~ %s 取得 %d 筆", contract, window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d'), len(data))
+            return to_points(data, "funding_time", ts_multiplier=1000)
         except Exception as e:
-            print(f"[Gate.io] {contract} {current_dt.strftime('%Y-%m-%d')} 錯誤: {e}")
-        time.sleep(WAIT_TIME)
-        current_dt = fetch_end
-    return all_data
+            print(f"[Gate.io] {contract} {window_start.strftime('%Y-%m-%d')} 錯誤: {e}")
+            return []
+    return fetch_windows_concurrently(fetch_window, start_dt, end_dt)
 
-def fetch_okx_funding_rates(symbol, start_dt, end_dt):
+def fetch_okx_funding_rates(instId, start_dt, end_dt):
     """
     從 OKX API 獲取資金費率歷史數據（使用分頁參數 after）
     此 API 僅能查詢最近三個月內的數據，故本函式從最新日期向較舊方向回溯
+    instId 為已轉換的 OKX 合約名稱，例如 "BTC-USDT-SWAP"
     """
-    all_data = []
-    instId = adjust_symbol("okx", symbol)
+    all_points = []
     start_ms = int(start_dt.timestamp() * 1000)
     end_ms = int(end_dt.timestamp() * 1000)
     params = {
@@ -229,10 +313,11 @@ def fetch_okx_funding_rates(symbol, start_dt, end_dt):
     }
     while True:
         url = "https://www.okx.com/api/v5/public/funding-rate-history"
+        RATE_LIMITERS["okx"].wait()
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
-            result = response.json()
+            result = json_loads(response.content)
         except Exception as e:
             print(f"[OKX] 請求錯誤: {e}")
             break
@@ -243,120 +328,138 @@ def fetch_okx_funding_rates(symbol, start_dt, end_dt):
         if not data:
             print("[OKX] 無更多數據")
             break
-        for record in data:
-            try:
-                ft = int(record["fundingTime"])
-            except Exception as e:
-                print("解析 fundingTime 錯誤:", record.get("fundingTime"), e)
-                continue
-            if ft > end_ms:
-                continue
-            if ft < start_ms:
-                all_data.append(record)
-                print("[OKX] 已達查詢區間下限")
-                return all_data
-            all_data.append(record)
-        last_record = data[-1]
-        last_ft = int(last_record["fundingTime"])
+        # 整頁一次轉為 int64 陣列，以布林遮罩篩選區間內記錄
+        page = to_points(data, "fundingTime")
+        if not page:
+            break
+        ft = np.fromiter((point[0] for point in page), dtype=np.int64, count=len(page))
+        in_range = np.flatnonzero((ft >= start_ms) & (ft <= end_ms))
+        all_points.extend(page[i] for i in in_range.tolist())
+        # 數據由新到舊排列：本頁已出現早於起點的記錄即可停止
+        if (ft < start_ms).any():
+            print("[OKX] 已達查詢區間下限")
+            break
+        last_ft = int(ft[-1])
         if last_ft <= start_ms:
             break
         params["after"] = last_ft
-        time.sleep(WAIT_TIME)
-    return all_data
+    return all_points
 
-def aggregate_hourly(raw_data, start_dt, end_dt):
+# 交易所 -> 抓取函式
+FETCHERS = {
+    "binance": fetch_binance_funding_rates,
+    "bybit": fetch_bybit_funding_rates,
+    "gate.io": fetch_gateio_funding_rates,
+    "okx": fetch_okx_funding_rates,
+}
+
+def aggregate_hourly_df(points, start_dt, end_dt):
     """
-    將原始資料依每1小時彙整：
-      - 每筆資料轉換成整點時間 (格式 %Y-%m-%d %H:%M:%S)
-      - 若該小時無資料，則直接記錄為 "null"，
+    將 (時間戳毫秒, 資金費率) 元組依每1小時彙整，返回 DataFrame：
+      - timestamp_utc: datetime64 (UTC) 整點時間
+      - funding_rate: float64，若該小時無資料則為 NaN，
         代表該時間點尚未結算資金費用或API無返回值。
+    以「自 epoch 起的小時數」整數陣列完成取整點、去重與補齊小時序列。
     """
-    data_points = {}
-    for item in raw_data:
-        ts = None
-        if "fundingTime" in item:  # OKX, Binance (毫秒)
-            try:
-                ts = int(item["fundingTime"])
-            except Exception as e:
-                print("Error parsing fundingTime:", item.get("fundingTime"), e)
-        elif "fundingRateTimestamp" in item:  # Bybit (毫秒)
-            try:
-                ts = int(item["fundingRateTimestamp"])
-            except Exception as e:
-                print("Error parsing fundingRateTimestamp:", item.get("fundingRateTimestamp"), e)
-        elif "funding_time" in item:  # Gate.io (秒)
-            try:
-                ts = int(item["funding_time"]) * 1000
-            except Exception as e:
-                print("Error parsing funding_time:", item.get("funding_time"), e)
-        if ts is None:
-            continue
-        dt = datetime.datetime.fromtimestamp(ts / 1000, datetime.timezone.utc)
-        dt_hour = dt.replace(minute=0, second=0, microsecond=0)
+    ts_ms = np.fromiter((point[0] for point in points), dtype=np.int64, count=len(points))
+    rates = np.fromiter((point[1] for point in points), dtype=np.float64, count=len(points))
+
+    # 取整點：毫秒時間戳整除一小時
+    hours = ts_ms // 3_600_000
+    if log.isEnabledFor(logging.DEBUG):
+        for hour, rate in zip(hours.tolist(), rates.tolist()):
+            log.debug("Parsed data point: %s -> fundingRate: %s",
+                      datetime.datetime.fromtimestamp(hour * 3600, datetime.timezone.utc), rate)
+
+    # 依照 start_dt ~ end_dt 每小時產生一筆結果，若該整點無資料則為 NaN
+    start_hr = int(start_dt.timestamp()) // 3600
+    end_hr = int(end_dt.timestamp()) // 3600
+    full_hours = np.arange(start_hr, end_hr + 1, dtype=np.int64)
+    funding_rate = np.full(full_hours.size, np.nan)
+
+    # 同一整點有多筆時保留最後一筆：反轉後 np.unique 取得的首次出現即原序列的最後一筆
+    in_range = (hours >= start_hr) & (hours <= end_hr)
+    hours, rates = hours[in_range], rates[in_range]
+    unique_hours, last_idx = np.unique(hours[::-1], return_index=True)
+    funding_rate[unique_hours - start_hr] = rates[::-1][last_idx]
+
+    return pd.DataFrame({
+        "timestamp_utc": pd.to_datetime(full_hours * 3600, unit="s", utc=True),
+        "funding_rate": funding_rate,
+    })
+
+# ---------------------------
+# 本地快取：抓取 + 彙整結果
+# ---------------------------
+def get_cache_path(exchange, symbol, range_start, range_end):
+    """依 (exchange, symbol, range_start, range_end) 產生快取檔案路徑"""
+    key = f"{exchange.lower()}|{symbol}|{range_start.isoformat()}|{range_end.isoformat()}"
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".pkl")
+
+def fetch_hourly_df(fetch_func, exchange, symbol, api_symbol, range_start, range_end):
+    """
+    抓取並彙整指定區間的每小時資金費率，結果會持久化到本地快取
+    api_symbol 為 adjust_symbol 轉換後、直接傳給抓取函式的交易對格式
+    返回 aggregate_hourly_df 的 DataFrame；API 未返回數據時返回 None
+    """
+    cache_path = get_cache_path(exchange, symbol, range_start, range_end)
+    if os.path.exists(cache_path):
         try:
-            rate = float(item.get("fundingRate", 0))
+            hourly_df = pd.read_pickle(cache_path)
+            print(f"💾 使用本地快取: {cache_path}")
+            return hourly_df
         except Exception as e:
-            print("Error parsing fundingRate:", item.get("fundingRate"), e)
-            rate = 0.0
-        # 記錄此整點的資金費率
-        data_points[dt_hour] = rate
-        print(f"Parsed data point: {dt_hour} -> fundingRate: {rate}")
-
-    # 依照 start_dt ~ end_dt 每小時產生一筆結果，若該整點無資料則記為 "null"
-    aggregated = {}
-    current = start_dt.replace(minute=0, second=0, microsecond=0)
-    while current <= end_dt:
-        ts_str = current.strftime("%Y-%m-%d %H:%M:%S")
-        if current in data_points:
-            aggregated[ts_str] = f"{data_points[current]:.8f}"
-        else:
-            aggregated[ts_str] = "null"
-        current += datetime.timedelta(hours=1)
-    return aggregated
+            print(f"⚠️ 讀取快取失敗，改為重新抓取: {e}")
+
+    fetch_start = time.monotonic()
+    points = fetch_func(api_symbol, range_start, range_end)
+    if not points:
+        return None
+    hourly_df = aggregate_hourly_df(points, range_start, range_end)
+    elapsed = time.monotonic() - fetch_start
+
+    # 只快取已結束的區間（未來/當前小時的數據可能尚未結算）及耗時較長的抓取
+    range_closed = range_end < datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    if range_closed and elapsed >= CACHE_MIN_FETCH_SECONDS and not is_all_null(hourly_df):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            hourly_df.to_pickle(tmp_path)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"⚠️ 寫入快取失敗: {e}")
+    return hourly_df
 
 # ---------------------------
 # 主程式：純數據庫操作
 # ---------------------------
-def main():
-    parser = argparse.ArgumentParser(description="抓取 Funding Rate 歷史資料並保存到數據庫")
-    parser.add_argument("--exchange", default=DEFAULT_EXCHANGE, help="交易所，例如 Binance, Bybit, Gate.io, OKX")
-    parser.add_argument("--symbol", default=DEFAULT_SYMBOL, help="交易對，例如 BTCUSDT")
-    parser.add_argument("--start_date", default=DEFAULT_START_DATE, help="起始日期 (YYYY-MM-DD, UTC)")
-    parser.add_argument("--end_date", default=DEFAULT_END_DATE, help="結束日期 (YYYY-MM-DD, UTC)")
-    args = parser.parse_args()
-
-    EXCHANGE = args.exchange
-    SYMBOL = args.symbol
-    START_DATE = args.start_date
-    END_DATE = args.end_date
-
-    start_dt = datetime.datetime.strptime(START_DATE, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
-    end_dt   = datetime.datetime.strptime(END_DATE, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+def fetch_and_save(exchange, symbol, start_date, end_date):
+    """
+    抓取單一交易對在 start_date ~ end_date (YYYY-MM-DD, UTC) 的資金費率並保存到數據庫
+    可由其他腳本直接導入調用，無需另起子進程
+    返回本次保存的記錄數
+    """
+    start_dt = datetime.datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    end_dt   = datetime.datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
     
     # 確保end_date包含當天的完整24小時數據
     end_dt = end_dt.replace(hour=23, minute=59, second=59)
 
-    print(f"開始抓取 {EXCHANGE} {SYMBOL} 從 {START_DATE} 到 {END_DATE} 的 Funding Rate 資料")
-
-    exch = EXCHANGE.lower()
-    if exch == "binance":
-        fetch_func = fetch_binance_funding_rates
-    elif exch == "bybit":
-        fetch_func = fetch_bybit_funding_rates
-    elif exch == "gate.io":
-        fetch_func = fetch_gateio_funding_rates
-    elif exch == "okx":
-        fetch_func = fetch_okx_funding_rates
-    else:
-        print(f"不支援的交易所：{EXCHANGE}")
-        return
+    print(f"開始抓取 {exchange} {symbol} 從 {start_date} 到 {end_date} 的 Funding Rate 資料")
+
+    fetch_func = FETCHERS.get(exchange.lower())
+    if fetch_func is None:
+        print(f"不支援的交易所：{exchange}")
+        return 0
+    # 交易所格式的交易對只計算一次
+    api_symbol = adjust_symbol(exchange, symbol)
 
     # 檢查數據庫中的現有數據
-    missing_ranges = check_existing_data(SYMBOL, EXCHANGE, start_dt, end_dt)
+    missing_ranges = check_existing_data(symbol, exchange, start_dt, end_dt)
     
     if not missing_ranges:
         print("數據已完整，無需更新")
-        return
+        return 0
 
     total_saved = 0
     
@@ -364,26 +467,39 @@ def main():
     for range_start, range_end in missing_ranges:
         print(f"📡 獲取數據範圍: {range_start} ~ {range_end}")
         
-        raw_data = fetch_func(SYMBOL, range_start, range_end)
+        hourly_df = fetch_hourly_df(fetch_func, exchange, symbol, api_symbol, range_start, range_end)
         
-        if not raw_data:
+        if hourly_df is None:
             print("⚠️ API未返回數據")
             continue
         
-        aggregated_data = aggregate_hourly(raw_data, range_start, range_end)
-        
-        if is_all_null(aggregated_data):
+        if is_all_null(hourly_df):
             print("⚠️ 查詢結果全為null，可能是未來日期或API異常")
             continue
         
         # 保存到數據庫
-        saved_count = save_to_database(aggregated_data, EXCHANGE, SYMBOL)
+        saved_count = save_to_database(hourly_df, exchange, symbol)
         total_saved += saved_count
 
     if total_saved > 0:
         print(f"🎉 總共保存 {total_saved} 條記錄到數據庫")
     else:
         print("ℹ️ 沒有新數據需要保存")
+    return total_saved
+
+def main():
+    parser = argparse.ArgumentParser(description="抓取 Funding Rate 歷史資料並保存到數據庫")
+    parser.add_argument("--exchange", default=DEFAULT_EXCHANGE, help="交易所，例如 Binance, Bybit, Gate.io, OKX")
+    parser.add_argument("--symbol", default=DEFAULT_SYMBOL, help="交易對，例如 BTCUSDT")
+    parser.add_argument("--start_date", default=DEFAULT_START_DATE, help="起始日期 (YYYY-MM-DD, UTC)")
+    parser.add_argument("--end_date", default=DEFAULT_END_DATE, help="結束日期 (YYYY-MM-DD, UTC)")
+    parser.add_argument("--verbose", action="store_true", help="輸出每筆解析的資金費率 (DEBUG)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(message)s", stream=sys.stdout)
+
+    fetch_and_save(args.exchange, args.symbol, args.start_date, args.end_date)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
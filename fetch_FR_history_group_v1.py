@@ -2,15 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import os
+import asyncio
 import datetime
-import subprocess
-import time
-import sys
 import argparse
+import logging
 import pandas as pd
 
-# 添加數據庫支持
-from database_operations import DatabaseManager
+# 直接導入抓取模組，在同一進程內調用，避免每個交易對都啟動一次 Python 解釋器
+import fetch_FR_history
+# 與抓取模組共用同一個 DatabaseManager 實例
+from fetch_FR_history import get_db
 
 # --------------------------------------
 # 1. 取得專案根目錄，定義相對路徑
@@ -20,7 +21,6 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 # --------------------------------------
 # 2. 檔案路徑設定（使用相對路徑）
 # --------------------------------------
-TEST_SCRIPT = os.path.join(project_root, "fetch_FR_history.py")  # 外部程式檔案
 LOG_FILE = os.path.join(project_root, "logs", "scheduler_log.txt")
 
 # 確保日誌目錄存在
@@ -29,53 +29,52 @@ os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 # --------------------------------------
 # 3. 查詢參數預設值
 # --------------------------------------
-DEFAULT_START_DATE = "2025-06-06"  # 起始日期 (UTC, 格式 YYYY-MM-DD)
-DEFAULT_END_DATE = "2025-06-10"  # 結束日期 (UTC, 格式 YYYY-MM-DD)
+# 可用環境變量 DEFAULT_START_DATE / DEFAULT_END_DATE 覆蓋（例如 minimum_test.py 的子進程模式）
+DEFAULT_START_DATE = os.environ.get("DEFAULT_START_DATE", "2025-06-06")  # 起始日期 (UTC, 格式 YYYY-MM-DD)
+DEFAULT_END_DATE = os.environ.get("DEFAULT_END_DATE", "2025-06-10")  # 結束日期 (UTC, 格式 YYYY-MM-DD)
 TOP_N = 500  # 取前 TOP_N 筆市值排名交易對
 SELECTED_EXCHANGES = ["binance", "bybit"]  # 選擇要查詢的交易所
+MAX_CONCURRENT_PAIRS = 4  # 同時處理的 (交易對, 交易所) 數量
 
 # --------------------------------------
 # 4. 日誌紀錄函式
 # --------------------------------------
+# 日誌文件由 main() 掛上的 FileHandler 寫入：整個運行期間只打開一次，結束時關閉
+# （import 本模組時不會打開任何文件）
+file_logger = logging.getLogger(__name__)
+file_logger.setLevel(logging.INFO)
+file_logger.propagate = False
+
 def log_message(msg):
     timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
     line = f"{timestamp} - {msg}"
     print(line)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    file_logger.info(line)
 
 # --------------------------------------
 # 5. 讀取 trading_pairs 數據
 # --------------------------------------
 def read_trading_pairs_from_database():
     """
-    從數據庫讀取交易對數據，回傳資料列表，每筆為 dict。
+    從數據庫讀取交易對數據，直接回傳 DataFrame（讀取失敗時為空 DataFrame）。
+    market_cap 轉為數值，缺失或無法解析時為 0；symbol 去除前後空白。
     """
     try:
-        db = DatabaseManager()
-        df = db.get_trading_pairs(min_market_cap=0)  # 獲取所有交易對
+        df = get_db().get_trading_pairs(min_market_cap=0)  # 獲取所有交易對
 
         if df.empty:
             log_message("⚠️ 數據庫中沒有交易對數據，請先運行 get_symbol_pair_v2.py")
-            return []
-
-        # 轉換為字典列表，保持與原CSV格式兼容
-        data = []
-        for _, row in df.iterrows():
-            data.append({
-                'Symbol': row['symbol'],
-                'Exchange_A': row['exchange_a'],
-                'Exchange_B': row['exchange_b'],
-                'Market_Cap': row['market_cap'] if pd.notna(row['market_cap']) else 0,
-                'FR_Date': row['fr_date'] if pd.notna(row['fr_date']) else ''
-            })
-
-        log_message(f"✅ 從數據庫讀取到 {len(data)} 筆交易對資料")
-        return data
+            return pd.DataFrame()
+
+        df['symbol'] = df['symbol'].str.strip()
+        df['market_cap'] = pd.to_numeric(df['market_cap'], errors='coerce').fillna(0)
+
+        log_message(f"✅ 從數據庫讀取到 {len(df)} 筆交易對資料")
+        return df
 
     except Exception as e:
         log_message(f"❌ 讀取交易對數據時出錯: {e}")
-        return []
+        return pd.DataFrame()
 
 # --------------------------------------
 # 6. 更新 trading_pairs 數據庫的 FR_Date 欄位
@@ -90,16 +89,13 @@ def update_trading_pairs_database(updates):
         return
 
     try:
-        db = DatabaseManager()
-
-        # 批量更新FR_Date
-        with db.get_connection() as conn:
-            for symbol, fr_date in updates.items():
-                conn.execute('''
-                    UPDATE trading_pairs 
-                    SET fr_date = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE symbol = ?
-                ''', (fr_date, symbol))
+        # 批量更新FR_Date，所有更新在同一事務中提交
+        with get_db().get_connection() as conn:
+            conn.executemany('''
+                UPDATE trading_pairs 
+                SET fr_date = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE symbol = ?
+            ''', [(fr_date, symbol) for symbol, fr_date in updates.items()])
 
             log_message(f"✅ 已更新 {len(updates)} 個交易對的 FR_Date")
 
@@ -107,100 +103,86 @@ def update_trading_pairs_database(updates):
         log_message(f"❌ 更新交易對 FR_Date 時出錯: {e}")
 
 # --------------------------------------
-# 7. 呼叫外部程式 fetch_FR_history.py（智能增量更新）
+# 7. 調用 fetch_FR_history 模組（智能增量更新）
 # --------------------------------------
-def run_funding_rate_script_for_database(exchange, symbol, target_start_date, target_end_date):
+async def fetch_for_pair(semaphore, exchange, symbol, target_start_date, target_end_date):
     """
     調用 API 獲取資金費率數據並直接存入數據庫
+    同步的抓取函式放到工作線程中執行，多個交易對的網絡等待可以重疊
     """
-    log_message(f"{symbol}_{exchange}: 獲取數據 {target_start_date} 至 {target_end_date}")
-
-    cmd = [
-        sys.executable,
-        TEST_SCRIPT,
-        "--exchange", exchange,
-        "--symbol", symbol,
-        "--start_date", target_start_date,
-        "--end_date", target_end_date
-    ]
-
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            check=True
-        )
-        log_message(f"✅ API調用成功: {target_start_date} ~ {target_end_date}")
-
-        # fetch_FR_history.py 已經直接將數據保存到數據庫，不需要處理CSV文件
-        # 檢查輸出中是否包含成功保存的信息
-        if "數據庫插入:" in result.stdout or "保存" in result.stdout:
-            log_message(f"✅ 數據已直接保存到數據庫 ({symbol}_{exchange})")
-        else:
-            log_message(f"⚠️ 未檢測到數據庫保存確認信息")
-
-        # 檢查並清理可能存在的臨時CSV文件
-        temp_filename = f"funding_rate_{exchange}_{symbol}.csv"
-        temp_filepath = os.path.join(project_root, "csv", "FR_history", temp_filename)
-
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
-            log_message(f"🗑️ 已清理臨時文件: {temp_filepath}")
-
-        time.sleep(1)  # API限制
+    async with semaphore:
+        log_message(f"{symbol}_{exchange}: 獲取數據 {target_start_date} 至 {target_end_date}")
+        try:
+            saved_count = await asyncio.to_thread(
+                fetch_FR_history.fetch_and_save, exchange, symbol, target_start_date, target_end_date
+            )
+        except Exception as e:
+            log_message(f"❌ API調用失敗 {symbol}_{exchange} {target_start_date}~{target_end_date}: {e}")
+            return False
+
+        # API 限速由 fetch_FR_history 中各交易所的令牌桶統一控制，無需在每個交易對之後固定等待
+        log_message(f"✅ API調用成功: {symbol}_{exchange} 保存 {saved_count} 條記錄")
         return True
 
-    except subprocess.CalledProcessError as e:
-        log_message(f"❌ API調用失敗 {target_start_date}~{target_end_date}: {e.stderr}")
-        return False
-    except OSError as e:
-        log_message(f"❌ 文件操作失敗: {e}")
-        return False
+async def fetch_all_pairs(work, start_date, end_date):
+    """
+    並發處理所有 (交易對, 交易所)，回傳全部交易所都成功的交易對列表
+    """
+    # 每個交易對內部再以 MAX_WORKERS 個線程並行抓取區間，共用同一個 SESSION，連線池需容納全部同時請求
+    fetch_FR_history.resize_session_pool(MAX_CONCURRENT_PAIRS * fetch_FR_history.MAX_WORKERS)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAIRS)
+    keys = [(symbol, exchange) for symbol, exchanges in work for exchange in exchanges]
+    results = await asyncio.gather(*(
+        fetch_for_pair(semaphore, exchange, symbol, start_date, end_date)
+        for symbol, exchange in keys
+    ))
+
+    failed_symbols = {symbol for (symbol, _), ok in zip(keys, results) if not ok}
+    return [symbol for symbol, _ in work if symbol not in failed_symbols]
 
 # --------------------------------------
 # 8. 收集所有市值>0的交易對及其涉及的交易所
 # --------------------------------------
 def collect_valid_symbols_and_exchanges(pairs):
     """
-    從 trading_pairs 數據中收集所有 Market_Cap > 0 的交易對，
+    從 trading_pairs DataFrame 中收集所有 market_cap > 0 的交易對，
     並記錄每個交易對涉及的所有交易所
     回傳: {symbol: set(exchanges)}
     """
-    symbol_exchanges = {}
+    valid = pairs[pairs['market_cap'] > 0]
 
-    for row in pairs:
-        try:
-            market_cap = float(row.get("Market_Cap", "0") or "0")
-            if market_cap > 0:
-                symbol = row["Symbol"].strip()
-                exchange_a = row.get("Exchange_A", "").strip()
-                exchange_b = row.get("Exchange_B", "").strip()
+    # 把 Exchange_A / Exchange_B 攤平成一列，再按交易對聚合成集合
+    exchanges = valid.melt(id_vars='symbol', value_vars=['exchange_a', 'exchange_b'], value_name='exchange')
+    exchanges['exchange'] = exchanges['exchange'].fillna('').str.strip().str.lower()
+    grouped = exchanges.groupby('symbol', sort=False)['exchange'].agg(set)
 
-                if symbol not in symbol_exchanges:
-                    symbol_exchanges[symbol] = set()
-
-                if exchange_a:
-                    symbol_exchanges[symbol].add(exchange_a.lower())
-                if exchange_b:
-                    symbol_exchanges[symbol].add(exchange_b.lower())
-        except (ValueError, TypeError) as e:
-            log_message(f"❌ 解析市值時錯誤: {e}, 資料: {row}")
-
-    return symbol_exchanges
+    return {symbol: exs - {''} for symbol, exs in grouped.items()}
 
 # --------------------------------------
 # 9. 主程式流程：智能增量更新
 # --------------------------------------
 def main():
+    args = parse_args()
+
+    # 運行期間把日誌寫入 LOG_FILE，結束（包括出錯）時關閉文件
+    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    file_logger.addHandler(file_handler)
+    try:
+        run_incremental_update(args)
+    finally:
+        file_logger.removeHandler(file_handler)
+        file_handler.close()
+
+def parse_args():
     parser = argparse.ArgumentParser(description="智能增量抓取市值>0交易對的 Funding Rate 資料")
     parser.add_argument("--start_date", default=DEFAULT_START_DATE, help="起始日期 (UTC, YYYY-MM-DD)")
     parser.add_argument("--end_date", default=DEFAULT_END_DATE, help="結束日期 (UTC, YYYY-MM-DD)")
     parser.add_argument("--top_n", type=int, default=TOP_N, help="選取市值前幾筆交易對")
-    args = parser.parse_args()
+    return parser.parse_args()
 
+def run_incremental_update(args):
+    """依命令行參數抓取前 top_n 個交易對的資金費率，並更新成功交易對的 FR_Date"""
     start_date = args.start_date
     end_date = args.end_date
     top_n = args.top_n
@@ -209,7 +191,7 @@ def main():
 
     # 讀取 trading_pairs 數據庫
     pairs = read_trading_pairs_from_database()
-    if not pairs:
+    if pairs.empty:
         log_message("❌ 無法讀取交易對數據，程序終止")
         return
 
@@ -219,50 +201,25 @@ def main():
     symbol_exchanges = collect_valid_symbols_and_exchanges(pairs)
     log_message(f"找到 {len(symbol_exchanges)} 個市值>0的交易對。")
 
-    # 按市值排序，取前 top_n 個
-    valid_pairs = [row for row in pairs if float(row.get("Market_Cap", "0") or "0") > 0]
-    try:
-        valid_pairs.sort(key=lambda r: float(r.get("Market_Cap", "0") or "0"), reverse=True)
-    except Exception as e:
-        log_message(f"❌ 排序 Market_Cap 時錯誤: {e}")
-
-    # 取出前 top_n 個交易對的 symbol (去重)
-    top_symbols = []
-    seen_symbols = set()
-    for row in valid_pairs:
-        symbol = row["Symbol"].strip()
-        if symbol not in seen_symbols and len(top_symbols) < top_n:
-            top_symbols.append(symbol)
-            seen_symbols.add(symbol)
+    # 取市值前 top_n 個交易對的 symbol (去重，每個 symbol 取其最大市值)，nlargest 只做部分排序
+    symbol_caps = pairs.loc[pairs['market_cap'] > 0].groupby('symbol', sort=False)['market_cap'].max()
+    top_symbols = symbol_caps.nlargest(top_n).index.tolist()
 
     log_message(f"選取前 {len(top_symbols)} 個交易對進行智能增量處理。")
 
-    # 處理每個交易對
-    updates = {}
-    for symbol in top_symbols:
-        log_message(f"開始智能增量處理交易對 {symbol}")
-
-        # 找到該交易對支持的交易所
-        available_exchanges = symbol_exchanges.get(symbol, set())
-        log_message(f"  可用交易所: {', '.join(sorted(available_exchanges))}")
-
-        # 選擇要查詢的交易所（與SELECTED_EXCHANGES的交集）
-        selected_exchanges = [ex for ex in SELECTED_EXCHANGES if ex in available_exchanges]
-        if not selected_exchanges:
-            log_message(f"  ⚠️ 沒有可用的選定交易所，跳過")
-            continue
-
-        log_message(f"  選擇的交易所: {', '.join(selected_exchanges)}")
+    # 一次性整理每個交易對要查詢的交易所（與SELECTED_EXCHANGES的交集），沒有可用交易所的直接剔除
+    work = [(symbol, [ex for ex in SELECTED_EXCHANGES if ex in symbol_exchanges.get(symbol, ())])
+            for symbol in top_symbols]
+    skipped = [symbol for symbol, exchanges in work if not exchanges]
+    work = [(symbol, exchanges) for symbol, exchanges in work if exchanges]
 
-        # 對每個選定的交易所獲取數據
-        symbol_success = True
-        for exchange in selected_exchanges:
-            success = run_funding_rate_script_for_database(exchange, symbol, start_date, end_date)
-            if not success:
-                symbol_success = False
+    if skipped:
+        log_message(f"⚠️ {len(skipped)} 個交易對沒有可用的選定交易所，跳過: {', '.join(skipped)}")
+    log_message(f"共 {len(work)} 個交易對、{sum(len(exchanges) for _, exchanges in work)} 個交易所組合待處理。")
 
-        if symbol_success:
-            updates[symbol] = end_date
+    # 並發獲取數據，全部交易所成功的交易對才更新 FR_Date
+    succeeded_symbols = asyncio.run(fetch_all_pairs(work, start_date, end_date))
+    updates = {symbol: end_date for symbol in succeeded_symbols}
 
     # 更新數據庫中的 FR_Date 欄位
     if updates:
@@ -1,12 +1,23 @@
 import aiohttp
 import asyncio
+import json
 import sqlite3
 from datetime import datetime, timezone, timedelta
 import time
 import ssl
+from functools import lru_cache
+from itertools import repeat
 import certifi
+import numpy as np
 import pandas as pd
 
+# 嘗試導入 orjson（C 實現，解析更快），如果沒有則使用標準庫 json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # --- 全局配置 ---
 # 將並發限制從 10 調降到 5，以避免觸發幣安的速率限制
 SEMAPHORE_LIMIT = 2  # 同時運行的最大異步任務數
@@ -25,23 +36,41 @@ sqlite3.register_adapter(datetime, adapt_datetime_iso)
 
 DB_PATH = "data/funding_rate.db"
 SUPPORTED_EXCHANGES = ['binance', 'bybit', 'okx']
+# 各交易所 API 返回記錄中的資金費率時間欄位（毫秒時間戳）
+TIMESTAMP_FIELDS = {'binance': 'fundingTime', 'bybit': 'fundingRateTimestamp', 'okx': 'fundingTime'}
 CHUNK_DAYS = 5 # 每次 API 抓取區間（天）
-WAIT_TIME = 0.5 # 每次 API 呼叫間隔
+CHUNK_CONCURRENCY = 4 # 同一交易對同時請求的區間數
+OKX_PAGE_LIMIT = 100 # OKX 每頁最多返回的記錄數
+# 每個交易所同時在途的請求數上限，取代每次呼叫後固定等待
+EXCHANGE_CONCURRENCY = {'binance': 8, 'bybit': 8, 'okx': 4}
+EXCHANGE_SEMAPHORES = {ex: asyncio.Semaphore(n) for ex, n in EXCHANGE_CONCURRENCY.items()}
+WRITE_BATCH_SYMBOLS = 20 # 寫入協程每個事務最多合併的交易對數量
+MULTI_INSERT_ROWS = 200 # 單條多值 INSERT 的行數（200×4 個參數，低於舊版 SQLite 的 999 上限）
 
 def get_connection():
-    """獲取資料庫連接"""
+    """獲取資料庫連接（讀取用）"""
     conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_write_connection():
+    """
+    獲取批量寫入專用的資料庫連接：
+    不解析欄位類型、不設 row_factory，事務由調用方以 BEGIN/COMMIT 手動控制；
+    寫入在工作線程中執行，因此允許跨線程使用（同一時間只有寫入協程在用）
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -65536")  # 64MB 頁面緩存（負數表示KB）
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
 async def get_target_pairs(conn, exchanges, top_n):
     """
     從資料庫中根據市值排名和交易所支援情況，篩選出目標交易對。
     返回一個任務列表，每個任務包含 symbol, exchange 和 list_date。
     """
-    cursor = conn.cursor()
-    tasks = []
-    
     # 構建查詢語句
     # 我們需要動態地檢查每個請求的交易所是否被支援
     placeholders = ','.join('?' for _ in exchanges)
@@ -54,126 +83,203 @@ async def get_target_pairs(conn, exchanges, top_n):
         ORDER BY market_cap_rank
     """
     
-    cursor.execute(query, (top_n,))
-    rows = cursor.fetchall()
-    
-    for row in rows:
-        for ex in exchanges:
-            # 檢查該交易所是否支援此交易對
-            if row[f'{ex}_support']:
-                # 只處理支援的交易所
-                if ex in SUPPORTED_EXCHANGES:
-                    tasks.append({
-                        "symbol": row['symbol'],
-                        "trading_pair": row['trading_pair'], # e.g., BTCUSDT
-                        "exchange": ex,
-                        "list_date": row[f'{ex}_list_date']
-                    })
-    return tasks
-
-async def save_funding_rates(conn, df, exchange, symbol):
-    """將處理過的 DataFrame (含NULL) 的資金費率數據批量存入資料庫"""
+    df = pd.read_sql(query, conn, params=(top_n,))
+
+    # 把每個交易所的 support / list_date 欄位轉成長表，每行對應一個 (交易對, 交易所)
+    # ignore_index=False 保留原行號，兩次 melt 的行順序一致，可直接對齊
+    support = df.melt(id_vars=['symbol', 'trading_pair'], value_vars=[f'{ex}_support' for ex in exchanges],
+                      var_name='exchange', value_name='supported', ignore_index=False)
+    list_dates = df.melt(value_vars=[f'{ex}_list_date' for ex in exchanges],
+                         value_name='list_date', ignore_index=False)['list_date']
+    support['exchange'] = support['exchange'].str.removesuffix('_support')
+    support['list_date'] = list_dates.to_numpy()
+
+    # 只保留支援該交易對、且本腳本支援的交易所；按市值排名與輸入的交易所順序排列
+    mask = support['supported'].fillna(0).astype(bool) & support['exchange'].isin(SUPPORTED_EXCHANGES)
+    tasks = support.loc[mask, ['symbol', 'trading_pair', 'exchange', 'list_date']].sort_index(kind='stable')
+    # 缺失的上市日期轉回 None，與逐行讀取時的結果一致
+    tasks = tasks.astype(object).where(tasks.notna(), None)
+    return tasks.to_dict(orient='records')
+
+def save_funding_rates(conn, df, exchange, symbol):
+    """將處理過的 DataFrame (含NULL) 的資金費率數據批量存入資料庫，事務由調用方控制"""
     if df.empty:
         return 0
 
-    to_insert = []
-    for timestamp_utc, row in df.iterrows():
-        # pandas.NaN 在這裡會被正確處理，sqlite3驅動會將其轉換為NULL
-        funding_rate = row['funding_rate'] if pd.notna(row['funding_rate']) else None
-        to_insert.append((
-            timestamp_utc.to_pydatetime(),  # 從 pandas Timestamp 轉換為 python datetime
-            symbol,
-            exchange,
-            funding_rate
-        ))
-
-    if not to_insert:
-        return 0
+    # 整列取出時間與費率，避免 iterrows 的逐行開銷
+    # 時間一次性向量化格式化為 ISO 8601 字串（與 adapt_datetime_iso 及 fetch_FR_history_v2 的輸出一致，
+    # 例如 '2025-01-01T05:00:00+00:00'），省去逐行 isoformat 適配；索引為 UTC 時區
+    timestamps = df.index.strftime('%Y-%m-%dT%H:%M:%S+00:00').tolist()
+    # NaN 在整個陣列上一次轉為 None，sqlite3 驅動會將 None 寫為 NULL
+    values = df['funding_rate'].to_numpy(dtype=float)
+    rates = np.where(np.isnan(values), None, values)
+    to_insert = list(zip(timestamps, repeat(symbol), repeat(exchange), rates))
+
+    # 每 MULTI_INSERT_ROWS 行合成一條多值 INSERT，減少逐行執行語句的開銷
+    inserted = 0
+    for i in range(0, len(to_insert), MULTI_INSERT_ROWS):
+        chunk = to_insert[i:i + MULTI_INSERT_ROWS]
+        cursor = conn.execute(multi_insert_sql(len(chunk)), [value for row in chunk for value in row])
+        inserted += cursor.rowcount
+    return inserted
+
+@lru_cache(maxsize=8)
+def multi_insert_sql(n_rows):
+    """
+    生成一次插入 n_rows 行的語句（按行數緩存）。
+    表上已有 UNIQUE(timestamp_utc, symbol, exchange) 的唯一索引，衝突時直接以新數據覆蓋
+    """
+    values = ', '.join(['(?, ?, ?, ?, CURRENT_TIMESTAMP)'] * n_rows)
+    return f"""
+        INSERT OR REPLACE INTO funding_rate_history (timestamp_utc, symbol, exchange, funding_rate, updated_at)
+        VALUES {values}
+    """
 
-    cursor = conn.cursor()
+def write_batch(conn, batch):
+    """
+    把一批 (df, exchange, symbol) 放在同一個事務中寫入，成功一次提交，失敗整批回滾。
+    同步函式，由寫入協程放到工作線程中執行。
+    """
+    conn.execute("BEGIN")
     try:
-        cursor.executemany("""
-            INSERT INTO funding_rate_history (timestamp_utc, symbol, exchange, funding_rate)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(timestamp_utc, symbol, exchange) DO UPDATE SET
-            funding_rate=excluded.funding_rate, updated_at=CURRENT_TIMESTAMP
-        """, to_insert)
-        conn.commit()
-        return cursor.rowcount
-    except sqlite3.Error as e:
-        print(f"❌ 資料庫儲存時出錯 ({symbol}_{exchange}): {e}")
-        conn.rollback()
-        return 0
+        results = [(exchange, symbol, save_funding_rates(conn, df, exchange, symbol))
+                   for df, exchange, symbol in batch]
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return results
+
+async def db_writer(conn, write_queue):
+    """
+    單一寫入協程：依序消費寫入佇列，把多個交易對的數據合併到同一事務提交，
+    避免各任務各自開連接、各自提交而爭搶 SQLite 的寫鎖。
+    實際的 SQLite 寫入在工作線程中執行，不阻塞事件循環上的 HTTP 請求。
+    佇列收到 None 時結束。
+    """
+    done = False
+    while not done:
+        batch = [await write_queue.get()]
+        # 佇列中已排隊的數據一併寫入，最多 WRITE_BATCH_SYMBOLS 個交易對
+        while len(batch) < WRITE_BATCH_SYMBOLS and not write_queue.empty():
+            batch.append(write_queue.get_nowait())
+        if None in batch:
+            done = True
+            batch = [item for item in batch if item is not None]
+
+        if batch:
+            try:
+                results = await asyncio.to_thread(write_batch, conn, batch)
+            except sqlite3.Error as e:
+                symbols = ', '.join(f"{symbol}_{exchange}" for _, exchange, symbol in batch)
+                print(f"❌ 資料庫儲存時出錯 ({symbols}): {e}")
+            else:
+                for exchange, symbol, inserted_count in results:
+                    print(f"✅ ({exchange.upper()}) {symbol}: 成功處理 {inserted_count} 筆數據 (含NULL)。")
+
+        for _ in range(len(batch) + done):
+            write_queue.task_done()
+
+async def fetch_one_chunk(session, exchange, symbol, trading_pair, chunk_start, chunk_end):
+    """請求單一時間區間的資金費率，並加入重試機制"""
+    params = {}
+    url = ""
+
+    if exchange == 'binance':
+        url = "https://fapi.binance.com/fapi/v1/fundingRate"
+        params.update({
+            "symbol": trading_pair,
+            "startTime": int(chunk_start.timestamp() * 1000),
+            "endTime": int(chunk_end.timestamp() * 1000),
+            "limit": 1000
+        })
+    elif exchange == 'bybit':
+        url = "https://api.bybit.com/v5/market/funding/history"
+        params.update({
+            "symbol": trading_pair,
+            "category": "linear",
+            "startTime": int(chunk_start.timestamp() * 1000),
+            "endTime": int(chunk_end.timestamp() * 1000),
+            "limit": 200
+        })
+    elif exchange == 'okx':
+        url = "https://www.okx.com/api/v5/public/funding-rate-history"
+        params = {
+            "instId": f"{symbol}-USDT-SWAP",
+            "after": int(chunk_end.timestamp() * 1000),
+            "limit": OKX_PAGE_LIMIT
+        }
+
+    # --- 新增：重試邏輯 ---
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with EXCHANGE_SEMAPHORES[exchange], session.get(url, params=params, timeout=20) as response:
+                response.raise_for_status()
+                data = json_loads(await response.read())
+
+                if exchange == 'binance':
+                    return data
+                elif exchange == 'bybit':
+                    if data.get("retCode") == 0 and data.get("result", {}).get("list"):
+                        return data["result"]["list"]
+                elif exchange == 'okx':
+                    if data.get("code") == "0":
+                        return data.get("data", [])
+                return []
+
+        # ValueError: 回應不是 JSON（例如 HTML 錯誤頁 / 維護頁），與網絡錯誤一樣重試
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if attempt < MAX_RETRIES - 1:
+                print(f"🟡 ({exchange.upper()}) {symbol} 請求失敗 (第 {attempt + 1}/{MAX_RETRIES} 次): {e}. 在 {RETRY_DELAY} 秒後重試...")
+                await asyncio.sleep(RETRY_DELAY)
+            else:
+                print(f"❌ ({exchange.upper()}) {symbol} {chunk_start.strftime('%Y-%m-%d')} 請求錯誤: {e}")
+    # --- 重試邏輯結束 ---
+    return []
+
+async def fetch_okx_funding_rates(session, symbol, trading_pair, start_dt, end_dt):
+    """
+    OKX 以 after 游標向過去分頁：從 end_dt 開始，每次以本頁最早的 fundingTime 作為下一頁的 after，
+    直到越過 start_dt 或返回不足一頁為止
+    """
+    start_ms = int(start_dt.timestamp() * 1000)
+    cursor_dt = end_dt
+    all_data = []
+    while True:
+        page = await fetch_one_chunk(session, 'okx', symbol, trading_pair, start_dt, cursor_dt)
+        if not page:
+            break
+        all_data.extend(r for r in page if int(r['fundingTime']) >= start_ms)
+        earliest_ms = min(int(r['fundingTime']) for r in page)
+        if len(page) < OKX_PAGE_LIMIT or earliest_ms <= start_ms:
+            break
+        cursor_dt = datetime.fromtimestamp(earliest_ms / 1000, tz=timezone.utc)
+    return all_data
 
 async def fetch_funding_rates_rest(session, exchange, symbol, trading_pair, start_dt, end_dt):
-    """使用 aiohttp 直接請求 REST API，並加入重試機制"""
-    all_data = []
+    """使用 aiohttp 直接請求 REST API，各時間區間並發請求後按時間順序合併"""
+    if exchange == 'okx':
+        return await fetch_okx_funding_rates(session, symbol, trading_pair, start_dt, end_dt)
+
+    chunks = []
     current_dt = start_dt
-    
     while current_dt < end_dt:
         fetch_end = min(current_dt + timedelta(days=CHUNK_DAYS), end_dt)
-        params = {}
-        url = ""
-
-        if exchange == 'binance':
-            url = "https://fapi.binance.com/fapi/v1/fundingRate"
-            params.update({
-                "symbol": trading_pair,
-                "startTime": int(current_dt.timestamp() * 1000),
-                "endTime": int(fetch_end.timestamp() * 1000),
-                "limit": 1000
-            })
-        elif exchange == 'bybit':
-            url = "https://api.bybit.com/v5/market/funding/history"
-            params.update({
-                "symbol": trading_pair,
-                "category": "linear",
-                "startTime": int(current_dt.timestamp() * 1000),
-                "endTime": int(fetch_end.timestamp() * 1000),
-                "limit": 200
-            })
-        elif exchange == 'okx':
-            url = "https://www.okx.com/api/v5/public/funding-rate-history"
-            params = {
-                "instId": f"{symbol}-USDT-SWAP",
-                "after": int(fetch_end.timestamp() * 1000),
-                "limit": 100
-            }
-        
-        # --- 新增：重試邏輯 ---
-        for attempt in range(MAX_RETRIES):
-            try:
-                async with session.get(url, params=params, timeout=20) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-
-                    if exchange == 'binance':
-                        all_data.extend(data)
-                    elif exchange == 'bybit':
-                        if data.get("retCode") == 0 and data.get("result", {}).get("list"):
-                            all_data.extend(data["result"]["list"])
-                    elif exchange == 'okx':
-                        if data.get("code") == "0":
-                             all_data.extend(data.get("data", []))
-                
-                break # 成功，跳出重試循環
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                if attempt < MAX_RETRIES - 1:
-                    print(f"🟡 ({exchange.upper()}) {symbol} 請求失敗 (第 {attempt + 1}/{MAX_RETRIES} 次): {e}. 在 {RETRY_DELAY} 秒後重試...")
-                    await asyncio.sleep(RETRY_DELAY)
-                else:
-                    print(f"❌ ({exchange.upper()}) {symbol} {current_dt.strftime('%Y-%m-%d')} 請求錯誤: {e}")
-        # --- 重試邏輯結束 ---
-
-        await asyncio.sleep(WAIT_TIME)
+        chunks.append((current_dt, fetch_end))
         current_dt = fetch_end
-        if exchange == 'okx': # OKX 是反向遍歷，拿到一次就夠了
-            break
-            
-    return all_data
 
-async def fetch_and_save_fr(session, task, start_date, end_date):
+    # 同一交易對最多 CHUNK_CONCURRENCY 個區間同時請求
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def fetch_with_semaphore(chunk_start, chunk_end):
+        async with semaphore:
+            return await fetch_one_chunk(session, exchange, symbol, trading_pair, chunk_start, chunk_end)
+
+    results = await asyncio.gather(*(fetch_with_semaphore(s, e) for s, e in chunks))
+    return [record for chunk_data in results for record in chunk_data]
+
+async def fetch_and_save_fr(session, conn, write_queue, task, start_date, end_date):
     symbol = task['symbol']
     exchange_id = task['exchange']
     trading_pair = task['trading_pair']
@@ -191,7 +297,6 @@ async def fetch_and_save_fr(session, task, start_date, end_date):
             return
 
     # 2. 智慧增量更新檢查：檢查用戶指定時間範圍內的數據完整性
-    conn = get_connection()
     cursor = conn.cursor()
     
     # 檢查用戶指定時間範圍內是否有完整數據
@@ -208,7 +313,6 @@ async def fetch_and_save_fr(session, task, start_date, end_date):
     # 如果指定時間範圍內的數據已經完整，則跳過
     if existing_days >= expected_days and expected_days > 0:
         print(f"✅ ({exchange_id.upper()}) {symbol}: 指定時間範圍 ({actual_start_date.date()} 到 {(end_date - timedelta(days=1)).date()}) 數據已完整，無需更新。")
-        conn.close()
         return
     
     # 找到需要補充的時間範圍
@@ -227,8 +331,6 @@ async def fetch_and_save_fr(session, task, start_date, end_date):
             # 從最新時間的下一個小時開始抓取
             incremental_start_date = latest_db_date + timedelta(hours=1)
             actual_start_date = max(actual_start_date, incremental_start_date)
-    
-    conn.close()
 
     if actual_start_date >= end_date:
         print(f"✅ ({exchange_id.upper()}) {symbol}: 數據已是最新，無需更新。")
@@ -245,48 +347,37 @@ async def fetch_and_save_fr(session, task, start_date, end_date):
     # 2. 將API返回的數據轉換為帶有時間索引的DataFrame，並對齊到整點小時
     api_df = None
     if api_rates:
-        processed_rates = []
-        for r in api_rates:
-            try:
-                rate_record = {}
-                ts = None
-                if exchange_id == 'binance':
-                    ts = datetime.fromtimestamp(int(r['fundingTime']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                elif exchange_id == 'bybit':
-                    ts = datetime.fromtimestamp(int(r['fundingRateTimestamp']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                elif exchange_id == 'okx':
-                    ts = datetime.fromtimestamp(int(r['fundingTime']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                
-                if ts:
-                    # 核心修正：將時間戳向下對齊到最近的整點小時
-                    rate_record['timestamp_utc'] = ts.replace(minute=0, second=0, microsecond=0)
-                    processed_rates.append(rate_record)
-
-            except (KeyError, ValueError) as e:
-                print(f"⚠️ ({exchange_id.upper()}) {symbol}: 解析API數據時跳過一筆記錄 - {e}")
-        
-        if processed_rates:
-            # 將 list of dicts 轉為 DataFrame
-            temp_df = pd.DataFrame(processed_rates)
-            # 處理同一小時內可能有多筆數據的情況，我們只保留最後一筆，確保數據的唯一性
-            api_df = temp_df.groupby('timestamp_utc').last()
-
-    # 3. 以完整時間軸為基礎，合併API數據
-    final_df = pd.DataFrame(index=hourly_index)
-    final_df.index.name = 'timestamp_utc'
+        # 整批向量化解析，取代逐筆 datetime.fromtimestamp / float 轉換
+        raw = pd.DataFrame(api_rates)
+        ts_col = TIMESTAMP_FIELDS[exchange_id]
+        if ts_col in raw.columns and 'fundingRate' in raw.columns:
+            ts = pd.to_datetime(pd.to_numeric(raw[ts_col], errors='coerce'), unit='ms', utc=True)
+            temp_df = pd.DataFrame({
+                # 核心修正：將時間戳向下對齊到最近的整點小時
+                'timestamp_utc': ts.dt.floor('h'),
+                'funding_rate': pd.to_numeric(raw['fundingRate'], errors='coerce'),
+            }).dropna()
+            skipped = len(raw) - len(temp_df)
+            if skipped:
+                print(f"⚠️ ({exchange_id.upper()}) {symbol}: 解析API數據時跳過 {skipped} 筆記錄")
+            if not temp_df.empty:
+                # 處理同一小時內可能有多筆數據的情況，我們只保留最後一筆，確保數據的唯一性
+                api_df = temp_df.groupby('timestamp_utc').last()
+        else:
+            print(f"⚠️ ({exchange_id.upper()}) {symbol}: API數據缺少 {ts_col} 或 fundingRate 欄位")
+
+    # 3. 以完整時間軸為基礎，直接按索引取出API數據（無數據的小時為NaN）
     if api_df is not None:
-        final_df = final_df.join(api_df)
+        final_df = api_df.reindex(hourly_index)
+    else:
+        final_df = pd.DataFrame({'funding_rate': float('nan')}, index=hourly_index)
+    final_df.index.name = 'timestamp_utc'
 
     # --- 邏輯結束 ---
 
     if not final_df.empty:
-        conn = get_connection()
-        inserted_count = await save_funding_rates(conn, final_df, exchange_id, symbol)
-        conn.close()
-        print(f"✅ ({exchange_id.upper()}) {symbol}: 成功處理 {inserted_count} 筆數據 (含NULL)。")
+        # 交給寫入協程統一寫入
+        await write_queue.put((final_df, exchange_id, symbol))
     else:
         print(f"ℹ️ ({exchange_id.upper()}) {symbol}: 在指定區間內未找到數據。")
 
@@ -352,16 +443,18 @@ async def main():
     # 我們透過將日期加一天，並將其作為開區間的結束點來實現
     end_date = datetime.fromisoformat(end_date_str).replace(tzinfo=timezone.utc) + timedelta(days=1)
     
-    # 建立資料庫連線
+    # 建立資料庫連線：讀取連接由所有任務共用，寫入連接只給寫入協程使用
     conn = get_connection()
+    write_conn = get_write_connection()
     
     # 1. 獲取目標任務列表
     print(f"正在從資料庫查詢 市值前 {top_n} 且支援 {', '.join(exchanges)} 的交易對...")
     tasks = await get_target_pairs(conn, exchanges, top_n)
-    conn.close()
     
     if not tasks:
         print("未找到任何符合條件的任務，程式終止。")
+        conn.close()
+        write_conn.close()
         return
         
     print(f"找到 {len(tasks)} 個任務，準備開始獲取數據...")
@@ -376,9 +469,27 @@ async def main():
     # --- 結束 ---
 
     ssl_context = ssl.create_default_context(cafile=certifi.where())
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        fetch_tasks = [run_with_semaphore(fetch_and_save_fr(session, task, start_date, end_date)) for task in tasks]
-        await asyncio.gather(*fetch_tasks)
+    write_queue = asyncio.Queue()
+    writer = asyncio.create_task(db_writer(write_conn, write_queue))
+    try:
+        # 長連接池：限制總連接數與單主機連接數，DNS 結果緩存，避免每次請求重新握手
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_context,
+            limit=50,
+            limit_per_host=10,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True,
+            keepalive_timeout=60,
+        )
+        async with aiohttp.ClientSession(connector=connector) as session:
+            fetch_tasks = [run_with_semaphore(fetch_and_save_fr(session, conn, write_queue, task, start_date, end_date)) for task in tasks]
+            await asyncio.gather(*fetch_tasks)
+    finally:
+        # 通知寫入協程結束，並等待剩餘數據寫完
+        await write_queue.put(None)
+        await writer
+        conn.close()
+        write_conn.close()
 
     print("\n🎉 所有任務執行完畢！")
 
@@ -1,11 +1,32 @@
 import aiohttp
 import asyncio
+import json
+import logging
+import queue
 import sqlite3
+import sys
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timezone, timedelta
 import time
+from itertools import repeat
 import ssl
 import certifi
-import pandas as pd
+import numpy as np
+
+from rate_limiter import RATE_LIMITS
+
+# 嘗試導入 orjson（C 實現，解析更快），如果沒有則使用標準庫 json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# 嘗試使用 uvloop（C 實現的事件循環），如果沒有則使用標準庫 asyncio 事件循環
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # --- 新增：處理 Python 3.12 的 sqlite3 日期時間 DeprecationWarning ---
 # 1. 定義一個新的 adapter，將 python datetime 物件轉換為 ISO 8601 字串
@@ -17,15 +38,66 @@ def adapt_datetime_iso(val):
 sqlite3.register_adapter(datetime, adapt_datetime_iso)
 # --- 結束 ---
 
+log = logging.getLogger(__name__)
+
 DB_PATH = "data/funding_rate.db"
 SUPPORTED_EXCHANGES = ['binance', 'bybit', 'okx']
 CHUNK_DAYS = 5 # 每次 API 抓取區間（天）
-WAIT_TIME = 0.5 # 每次 API 呼叫間隔
+CONCURRENCY_LIMIT = 10 # 同時運行的任務數量，也是每個交易所主機的最大連接數
+WRITE_BATCH_ROWS = 5000 # 寫入協程每個事務最多寫入的行數
+HOUR_MS = 3_600_000 # 一小時的毫秒數
+# 模組載入時只解析一次 CA 證書包，之後所有連接器共用同一個 SSLContext
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+class AsyncRateLimiter:
+    """
+    協程版令牌桶限速器：平均每 interval 秒放行一個請求，空閒時最多累積 burst 個令牌
+    可連續發出，取代每次請求後固定間隔的 sleep
+    """
+    def __init__(self, interval, burst=1):
+        self.interval = interval
+        self.burst = burst
+        self._next_time = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        next_time = max(now, self._next_time)
+        wait_time = next_time - (self.burst - 1) * self.interval - now
+        self._next_time = next_time + self.interval
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+    async def __aenter__(self):
+        await self.wait()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+# 各交易所的限額 (平均間隔秒數, 突發請求數) 與同步版 fetch_FR_history 共用 rate_limiter.RATE_LIMITS
+RATE_LIMITERS = {ex: AsyncRateLimiter(interval, burst) for ex, (interval, burst) in RATE_LIMITS.items()}
+
+RETRY_ATTEMPTS = 5 # 每個區間請求的最大嘗試次數
+RETRY_START_TIMEOUT = 0.5 # 指數退避的初始等待秒數（0.5, 1, 2, 4...）
+RETRY_STATUSES = {429, 500, 502, 503, 504} # 視為暫時性錯誤、需要重試的 HTTP 狀態碼
+
+WINDOW_CONCURRENCY = 4 # 每個交易所同時在途的區間請求數量
+WINDOW_SEMAPHORES = {ex: asyncio.Semaphore(WINDOW_CONCURRENCY) for ex in SUPPORTED_EXCHANGES}
 
 def get_connection():
-    """獲取資料庫連接"""
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    """
+    獲取資料庫連接。
+    批量寫入在工作線程中執行，因此允許跨線程使用（同一時間只有寫入協程在用）
+    """
+    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                           check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL + synchronous=NORMAL：提交時不必每次 fsync，寫入期間讀取不被阻塞
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256MB 記憶體映射
+    conn.execute("PRAGMA cache_size = -65536")  # 64MB 頁面緩存（負數表示KB）
     return conn
 
 async def get_target_pairs(conn, exchanges, symbol):
@@ -72,193 +144,226 @@ async def get_target_pairs(conn, exchanges, symbol):
             
     return tasks
 
-async def save_funding_rates(conn, df, exchange, symbol):
-    """將處理過的 DataFrame (含NULL) 的資金費率數據批量存入資料庫"""
-    if df.empty:
-        return 0
-
-    to_insert = []
-    for timestamp_utc, row in df.iterrows():
-        # pandas.NaN 在這裡會被正確處理，sqlite3驅動會將其轉換為NULL
-        funding_rate = row['funding_rate'] if pd.notna(row['funding_rate']) else None
-        to_insert.append((
-            timestamp_utc.to_pydatetime(),  # 從 pandas Timestamp 轉換為 python datetime
-            symbol,
-            exchange,
-            funding_rate
-        ))
-
-    if not to_insert:
-        return 0
-
-    cursor = conn.cursor()
+def save_funding_rates(conn, rows):
+    """將多個任務的資金費率行放在同一個事務中批量存入資料庫"""
     try:
-        cursor.executemany("""
+        conn.execute("BEGIN")
+        conn.executemany("""
             INSERT INTO funding_rate_history (timestamp_utc, symbol, exchange, funding_rate)
             VALUES (?, ?, ?, ?)
             ON CONFLICT(timestamp_utc, symbol, exchange) DO UPDATE SET
             funding_rate=excluded.funding_rate, updated_at=CURRENT_TIMESTAMP
-        """, to_insert)
+        """, rows)
         conn.commit()
-        return cursor.rowcount
+        return len(rows)
     except sqlite3.Error as e:
-        print(f"❌ 資料庫儲存時出錯 ({symbol}_{exchange}): {e}")
+        log.error("❌ 資料庫儲存時出錯 (%d 筆): %s", len(rows), e)
         conn.rollback()
         return 0
 
-async def fetch_funding_rates_rest(session, exchange, symbol, trading_pair, start_dt, end_dt):
-    """使用 aiohttp 直接請求 REST API，並加入重試機制"""
-    all_data = []
-    current_dt = start_dt
-    
-    while current_dt < end_dt:
-        fetch_end = min(current_dt + timedelta(days=CHUNK_DAYS), end_dt)
-        params = {"symbol": trading_pair}
-        url = ""
-
-        if exchange == 'binance':
-            url = "https://fapi.binance.com/fapi/v1/fundingRate"
-            params.update({
-                "startTime": int(current_dt.timestamp() * 1000),
-                "endTime": int(fetch_end.timestamp() * 1000),
-                "limit": 1000
-            })
-        elif exchange == 'bybit':
-            url = "https://api.bybit.com/v5/market/funding/history"
-            params.update({
-                "category": "linear",
-                "startTime": int(current_dt.timestamp() * 1000),
-                "endTime": int(fetch_end.timestamp() * 1000),
-                "limit": 200
-            })
-        elif exchange == 'okx':
-            url = "https://www.okx.com/api/v5/public/funding-rate-history"
-            params = {
-                "instId": f"{symbol}-USDT-SWAP",
-                "after": int(fetch_end.timestamp() * 1000),
-                "limit": 100
-            }
-        
-        # --- 新增：重試邏輯 ---
-        retries = 3
-        for attempt in range(retries):
+async def db_writer(conn, write_queue):
+    """
+    單一寫入協程：從佇列收集各任務的待寫入行，湊滿 WRITE_BATCH_ROWS 行或佇列暫時清空時
+    在同一事務中寫入，取代每個任務各自開連接、各自提交。佇列收到 None 時寫完剩餘數據並結束。
+    實際的 SQLite 寫入在工作線程中執行，不阻塞事件循環上的 HTTP 請求。
+    """
+    rows = []
+    done = False
+    while not done:
+        item = await write_queue.get()
+        if item is None:
+            done = True
+        else:
+            rows.extend(item)
+        if rows and (done or len(rows) >= WRITE_BATCH_ROWS or write_queue.empty()):
+            await asyncio.to_thread(save_funding_rates, conn, rows)
+            rows = []
+
+def get_latest_timestamps(conn, symbols):
+    """
+    一次分組查詢取得各 (symbol, exchange) 在資料庫中最新的時間戳（UTC 毫秒整數），
+    取代每個任務各自開連接查詢 MAX(timestamp_utc)。轉換在 SQLite 內完成，呼叫端不必再解析字串。
+    """
+    symbols = list(set(symbols))
+    if not symbols:
+        return {}
+    placeholders = ', '.join('?' * len(symbols))
+    cursor = conn.execute(f"""
+        SELECT symbol, exchange, CAST(strftime('%s', MAX(timestamp_utc)) AS INTEGER) * 1000
+        FROM funding_rate_history
+        WHERE symbol IN ({placeholders})
+        GROUP BY symbol, exchange
+    """, symbols)
+    return {(sym, ex): ts for sym, ex, ts in cursor}
+
+def retry_delay(attempt, response=None):
+    """優先使用伺服器回傳的 Retry-After（秒），否則按指數退避 RETRY_START_TIMEOUT * 2^attempt"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return max(float(retry_after), 0)
+    except (TypeError, ValueError):
+        return RETRY_START_TIMEOUT * 2 ** attempt
+
+async def fetch_one_window(session, exchange, symbol, trading_pair, window_start, window_end):
+    """使用 aiohttp 直接請求單個 [window_start, window_end) 區間的 REST API，並加入重試機制"""
+    params = {"symbol": trading_pair}
+    url = ""
+
+    if exchange == 'binance':
+        url = "https://fapi.binance.com/fapi/v1/fundingRate"
+        params.update({
+            "startTime": int(window_start.timestamp() * 1000),
+            "endTime": int(window_end.timestamp() * 1000),
+            "limit": 1000
+        })
+    elif exchange == 'bybit':
+        url = "https://api.bybit.com/v5/market/funding/history"
+        params.update({
+            "category": "linear",
+            "startTime": int(window_start.timestamp() * 1000),
+            "endTime": int(window_end.timestamp() * 1000),
+            "limit": 200
+        })
+    elif exchange == 'okx':
+        url = "https://www.okx.com/api/v5/public/funding-rate-history"
+        params = {
+            "instId": f"{symbol}-USDT-SWAP",
+            "after": int(window_end.timestamp() * 1000),
+            "limit": 100
+        }
+
+    # --- 重試邏輯：429/5xx 與網絡錯誤按指數退避重試，429 時遵守 Retry-After ---
+    async with WINDOW_SEMAPHORES[exchange]:
+        for attempt in range(RETRY_ATTEMPTS):
+            is_last = attempt == RETRY_ATTEMPTS - 1
             try:
-                async with session.get(url, params=params, timeout=20) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-
-                    if exchange == 'binance':
-                        all_data.extend(data)
-                    elif exchange == 'bybit':
-                        if data.get("retCode") == 0 and data.get("result", {}).get("list"):
-                            all_data.extend(data["result"]["list"])
-                    elif exchange == 'okx':
-                        if data.get("code") == "0":
-                             all_data.extend(data.get("data", []))
-                
-                break # 成功，跳出重試循環
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                if attempt < retries - 1:
-                    print(f"🟡 ({exchange.upper()}) {symbol} 請求失敗 (第 {attempt + 1}/{retries} 次): {e}. 在 2 秒後重試...")
-                    await asyncio.sleep(2)
-                else:
-                    print(f"❌ ({exchange.upper()}) {symbol} {current_dt.strftime('%Y-%m-%d')} 請求錯誤: {e}")
-        # --- 重試邏輯結束 ---
-
-        await asyncio.sleep(WAIT_TIME)
-        current_dt = fetch_end
-        if exchange == 'okx': # OKX 是反向遍歷，拿到一次就夠了
-            break
-            
-    return all_data
+                async with RATE_LIMITERS[exchange], session.get(url, params=params, timeout=20) as response:
+                    if response.status in RETRY_STATUSES and not is_last:
+                        delay = retry_delay(attempt, response)
+                        log.warning("🟡 (%s) %s HTTP %s (第 %d/%d 次). 在 %g 秒後重試...", exchange.upper(), symbol, response.status, attempt + 1, RETRY_ATTEMPTS, delay)
+                    else:
+                        response.raise_for_status()
+                        data = json_loads(await response.read())
+
+                        if exchange == 'binance':
+                            return data
+                        elif exchange == 'bybit':
+                            if data.get("retCode") == 0 and data.get("result", {}).get("list"):
+                                return data["result"]["list"]
+                        elif exchange == 'okx':
+                            if data.get("code") == "0":
+                                return data.get("data", [])
+                        return [] # 成功但無數據
+
+            # ValueError: 回應不是 JSON（例如 HTML 錯誤頁 / 維護頁），與網絡錯誤一樣重試
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                if is_last:
+                    log.error("❌ (%s) %s %s 請求錯誤: %s", exchange.upper(), symbol, window_start.date(), e)
+                    break
+                delay = retry_delay(attempt)
+                log.warning("🟡 (%s) %s 請求失敗 (第 %d/%d 次): %s. 在 %g 秒後重試...", exchange.upper(), symbol, attempt + 1, RETRY_ATTEMPTS, e, delay)
+
+            await asyncio.sleep(delay)
+    # --- 重試邏輯結束 ---
+    return []
 
-async def fetch_and_save_fr(session, task, start_date, end_date):
+async def fetch_funding_rates_rest(session, exchange, symbol, trading_pair, start_dt, end_dt):
+    """將 [start_dt, end_dt) 切成每段 CHUNK_DAYS 天的區間並併發請求，按時間順序合併結果"""
+    chunk = timedelta(days=CHUNK_DAYS)
+    n_windows = -(-(end_dt - start_dt) // chunk) if end_dt > start_dt else 0
+    windows = [(start_dt + i * chunk, min(start_dt + (i + 1) * chunk, end_dt)) for i in range(n_windows)]
+    if exchange == 'okx': # OKX 是反向遍歷，拿到一次就夠了
+        windows = windows[:1]
+
+    results = await asyncio.gather(*[
+        fetch_one_window(session, exchange, symbol, trading_pair, window_start, window_end)
+        for window_start, window_end in windows
+    ])
+    return [record for data in results for record in data]
+
+async def fetch_and_save_fr(session, write_queue, latest_map, task, start_date, end_date):
     symbol = task['symbol']
     exchange_id = task['exchange']
     trading_pair = task['trading_pair']
 
-    actual_start_date = start_date
+    start_ms = int(start_date.timestamp() * 1000)
+    end_ms = int(end_date.timestamp() * 1000)
 
-    # 增量更新檢查：查詢資料庫中最新的時間戳
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT MAX(timestamp_utc) FROM funding_rate_history WHERE symbol = ? AND exchange = ?",
-        (symbol, exchange_id)
-    )
-    latest_db_timestamp_str = cursor.fetchone()[0]
-    conn.close()
+    # 增量更新檢查：使用 main() 中預先查好的資料庫最新時間戳（毫秒）
+    latest_db_ms = latest_map.get((symbol, exchange_id))
 
-    if latest_db_timestamp_str:
-        latest_db_date = datetime.fromisoformat(latest_db_timestamp_str).replace(tzinfo=timezone.utc)
-        # 我們從資料庫最新時間的下一個小時開始抓取
-        incremental_start_date = latest_db_date + timedelta(hours=1)
-        # 取兩者中較晚的日期作為真正的開始日期
-        actual_start_date = max(actual_start_date, incremental_start_date)
+    if latest_db_ms is not None:
+        # 我們從資料庫最新時間的下一個小時開始抓取，取兩者中較晚的時間作為真正的開始時間
+        start_ms = max(start_ms, latest_db_ms + HOUR_MS)
 
-
-    if actual_start_date >= end_date:
-        print(f"✅ ({exchange_id.upper()}) {symbol}: 數據已是最新，無需更新。")
+    if start_ms >= end_ms:
+        log.info("✅ (%s) %s: 數據已是最新，無需更新。", exchange_id.upper(), symbol)
         return
 
-    print(f"🚀 ({exchange_id.upper()}) 開始獲取 {symbol} 從 {actual_start_date.strftime('%Y-%m-%d %H:%M:%S')} 的數據...")
+    actual_start_date = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+
+    log.info("🚀 (%s) 開始獲取 %s 從 %s 的數據...", exchange_id.upper(), symbol, actual_start_date.strftime('%Y-%m-%d %H:%M:%S'))
 
     api_rates = await fetch_funding_rates_rest(session, exchange_id, symbol, trading_pair, actual_start_date, end_date)
 
-    # --- 新增邏輯：生成完整時間軸並合併 ---
+    # --- 生成完整小時時間軸，並把API數據按整點小時放入對應的桶 ---
+    # 時間軸為 [actual_start_date, end_date) 內的每個整點，共 n_hours 個
+    n_hours = max((end_ms - HOUR_MS - start_ms) // HOUR_MS + 1, 0)
 
-    # 1. 創建完整的小時時間軸
-    # pd.date_range 的結尾是包含的，但我們的 end_date 是開區間，所以減去一小時
-    hourly_index = pd.date_range(start=actual_start_date, end=end_date - timedelta(hours=1), freq='h', tz='UTC')
-    
-    # 2. 將API返回的數據轉換為帶有時間索引的DataFrame，並對齊到整點小時
-    api_df = None
-    if api_rates:
-        processed_rates = []
-        for r in api_rates:
-            try:
-                rate_record = {}
-                ts = None
-                if exchange_id == 'binance':
-                    ts = datetime.fromtimestamp(int(r['fundingTime']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                elif exchange_id == 'bybit':
-                    ts = datetime.fromtimestamp(int(r['fundingRateTimestamp']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                elif exchange_id == 'okx':
-                    ts = datetime.fromtimestamp(int(r['fundingTime']) / 1000, tz=timezone.utc)
-                    rate_record['funding_rate'] = float(r['fundingRate'])
-                
-                if ts:
-                    # 核心修正：將時間戳向下對齊到最近的整點小時
-                    rate_record['timestamp_utc'] = ts.replace(minute=0, second=0, microsecond=0)
-                    processed_rates.append(rate_record)
-
-            except (KeyError, ValueError) as e:
-                print(f"⚠️ ({exchange_id.upper()}) {symbol}: 解析API數據時跳過一筆記錄 - {e}")
-        
-        if processed_rates:
-            # 將 list of dicts 轉為 DataFrame
-            temp_df = pd.DataFrame(processed_rates)
-            # 處理同一小時內可能有多筆數據的情況，我們只保留最後一筆，確保數據的唯一性
-            api_df = temp_df.groupby('timestamp_utc').last()
-
-    # 3. 以完整時間軸為基礎，合併API數據
-    final_df = pd.DataFrame(index=hourly_index)
-    final_df.index.name = 'timestamp_utc'
-    if api_df is not None:
-        final_df = final_df.join(api_df)
+    # 1. 解析API返回的時間（毫秒）與費率
+    ts_key = 'fundingRateTimestamp' if exchange_id == 'bybit' else 'fundingTime'
+    ts_list, rate_list = [], []
+    for r in api_rates:
+        try:
+            ts_ms = int(r[ts_key])
+            rate = float(r['fundingRate'])
+        except (KeyError, ValueError) as e:
+            log.warning("⚠️ (%s) %s: 解析API數據時跳過一筆記錄 - %s", exchange_id.upper(), symbol, e)
+            continue
+        ts_list.append(ts_ms)
+        rate_list.append(rate)
+
+    # 2. 向下對齊到整點小時後換算成桶序號，同一小時多筆數據時保留最後一筆
+    rates = np.full(n_hours, np.nan, dtype=np.float64)
+    if ts_list:
+        ts_ms = np.array(ts_list, dtype=np.int64)
+        bucket = (ts_ms - ts_ms % HOUR_MS - start_ms) // HOUR_MS
+        in_range = (bucket >= 0) & (bucket < n_hours)
+        bucket = bucket[in_range]
+        values = np.array(rate_list, dtype=np.float64)[in_range]
+        # numpy 對重複索引的賦值順序未定義：反轉後 np.unique 取得的首次出現即原序列的最後一筆
+        unique_buckets, last_idx = np.unique(bucket[::-1], return_index=True)
+        rates[unique_buckets] = values[::-1][last_idx]
 
     # --- 邏輯結束 ---
 
-    if not final_df.empty:
-        conn = get_connection()
-        inserted_count = await save_funding_rates(conn, final_df, exchange_id, symbol)
-        conn.close()
-        print(f"✅ ({exchange_id.upper()}) {symbol}: 成功處理 {inserted_count} 筆數據 (含NULL)。")
+    if n_hours > 0:
+        # 交給寫入協程，與其他任務的數據合併寫入（NaN 寫為 NULL）
+        # 整列一次轉為 Python 對象，避免逐元素索引 numpy 陣列；
+        # 時間戳直接由整數毫秒向量化格式化為 ISO 8601 字串（與 adapt_datetime_iso 的輸出一致），不再逐行建立 datetime
+        hour_ms = start_ms + np.arange(n_hours, dtype=np.int64) * HOUR_MS
+        timestamps = [ts + '+00:00' for ts in np.datetime_as_string(hour_ms.astype('datetime64[ms]'), unit='s').tolist()]
+        rate_values = np.where(np.isnan(rates), None, rates).tolist()
+        rows = list(zip(timestamps, repeat(symbol), repeat(exchange_id), rate_values))
+        await write_queue.put(rows)
+        log.info("✅ (%s) %s: 成功處理 %d 筆數據 (含NULL)。", exchange_id.upper(), symbol, len(rows))
     else:
-        print(f"ℹ️ ({exchange_id.upper()}) {symbol}: 在指定區間內未找到數據。")
+        log.info("ℹ️ (%s) %s: 在指定區間內未找到數據。", exchange_id.upper(), symbol)
+
+def start_log_listener():
+    """
+    日誌經佇列交給背景執行緒的 QueueListener 輸出到 stdout，
+    協程中的 log 呼叫只需把記錄放入佇列，不會在事件循環中等待 stdout 鎖
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    log.addHandler(QueueHandler(log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener.start()
+    return listener
 
 async def main():
     """主執行程序"""
@@ -320,7 +425,7 @@ async def main():
     end_date = datetime.fromisoformat(end_date_str).replace(tzinfo=timezone.utc) + timedelta(days=1)
     
     # 1. 建立任務列表 (不查資料庫)
-    print(f"準備為交易對 {symbol_input} 建立在 {', '.join(exchanges)} 上的抓取任務...")
+    log.info("準備為交易對 %s 建立在 %s 上的抓取任務...", symbol_input, ', '.join(exchanges))
     
     # 根據輸入決定用於API的交易對和用於資料庫的symbol
     if symbol_input.endswith("USDT"):
@@ -343,11 +448,10 @@ async def main():
         print("未建立任何任務，程式終止。")
         return
         
-    print(f"找到 {len(tasks)} 個任務，準備開始獲取數據...")
+    log.info("找到 %d 個任務，準備開始獲取數據...", len(tasks))
 
     # --- 新增：併發控制器 ---
-    # 設置一個Semaphore來限制同時運行的任務數量，例如10個
-    CONCURRENCY_LIMIT = 10
+    # 設置一個Semaphore來限制同時運行的任務數量
     semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
 
     async def run_with_semaphore(task_coro):
@@ -355,13 +459,39 @@ async def main():
             return await task_coro
     # --- 結束 ---
 
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        fetch_tasks = [run_with_semaphore(fetch_and_save_fr(session, task, start_date, end_date)) for task in tasks]
-        await asyncio.gather(*fetch_tasks)
+    # 所有寫入共用一個連接，由單一寫入協程負責
+    conn = get_connection()
+    # 增量更新所需的各 (symbol, exchange) 最新時間戳，只查詢一次
+    latest_map = get_latest_timestamps(conn, [task['symbol'] for task in tasks])
+    write_queue = asyncio.Queue()
+    writer = asyncio.create_task(db_writer(conn, write_queue))
+
+    # 整個程序只使用一個 ClientSession，連接池與 DNS 緩存在所有任務和重試之間共用
+    connector = aiohttp.TCPConnector(
+        limit=CONCURRENCY_LIMIT * 3,
+        limit_per_host=CONCURRENCY_LIMIT,
+        ttl_dns_cache=600,
+        ssl=SSL_CONTEXT,
+        enable_cleanup_closed=True,
+    )
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            fetch_tasks = [run_with_semaphore(fetch_and_save_fr(session, write_queue, latest_map, task, start_date, end_date)) for task in tasks]
+            await asyncio.gather(*fetch_tasks)
+    finally:
+        # 通知寫入協程結束，並等待剩餘數據寫完
+        await write_queue.put(None)
+        await writer
+        conn.close()
 
-    print("\n🎉 所有任務執行完畢！")
+    log.info("\n🎉 所有任務執行完畢！")
 
 if __name__ == '__main__':
     # 移除 argparse，直接運行 main
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.install()
+    log_listener = start_log_listener()
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
\ No newline at end of file
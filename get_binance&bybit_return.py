@@ -5,11 +5,43 @@
 将两个交易所的资金费用数据合并为一个对比表格
 """
 
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
 import glob
 
+# 尝试使用 pyarrow 多线程 CSV 解析引擎，如果没有安装则使用 pandas 默认的 C 引擎
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# 资金费用以 float32 保存时允许的最大绝对误差（低于 USDT 8 位小数精度）
+FLOAT32_ATOL = 1e-9
+CSV_CHUNKSIZE = 100_000  # 写出CSV时每批写入的行数
+
+# format='ISO8601' 需要 pandas >= 2.0；旧版 pandas 退回到逐列推断格式（同样统一为UTC）
+if int(pd.__version__.split('.')[0]) >= 2:
+    TIME_PARSE_KWARGS = {'format': 'ISO8601', 'utc': True, 'cache': True}
+else:
+    TIME_PARSE_KWARGS = {'utc': True, 'cache': True}
+
+# 各交易所CSV中需要读取的列 -> 统一后的列名（同时兼容旧格式列名）
+BINANCE_COLUMNS = {
+    '时间(UTC)': 'Time',
+    '时间': 'Time',  # 兼容舊格式
+    '交易对': 'Symbol',
+    '资金费用': 'Funding_Fee',
+}
+BYBIT_COLUMNS = {
+    '交易时间(UTC)': 'Time',
+    '交易时间': 'Time',  # 兼容舊格式
+    '交易对': 'Symbol',
+    '资金费用': 'Funding_Fee',
+}
+
 
 def find_csv_files(input_dir="csv/Return"):
     """
@@ -68,27 +100,42 @@ def parse_date_from_filename(filename):
         return None
 
 
-def load_and_process_binance_csv(filepath):
+def read_csv_files(filepaths, columns):
+    """
+    读取一个或多个CSV文件并纵向合并，只读取 columns 中存在的列并统一列名
+
+    Args:
+        filepaths (str | list): CSV文件路径或路径列表
+        columns (dict): 原始列名 -> 统一列名
+
+    Returns:
+        pandas.DataFrame: 合并后的数据框
+    """
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+
+    frames = []
+    for filepath in filepaths:
+        # 先只读表头，确定该文件实际使用的列名（新旧格式不同）
+        header = pd.read_csv(filepath, nrows=0).columns
+        usecols = [col for col in header if col in columns]
+        frames.append(pd.read_csv(filepath, usecols=usecols, engine=CSV_ENGINE).rename(columns=columns))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_and_process_binance_csv(filepaths):
     """
-    加载和处理币安CSV文件
+    加载和处理币安CSV文件（单个路径或路径列表）
     """
-    print(f"正在加载币安文件: {filepath}")
+    print(f"正在加载币安文件: {filepaths}")
 
-    df = pd.read_csv(filepath)
+    df = read_csv_files(filepaths, BINANCE_COLUMNS)
     print(f"币安原始数据: {len(df)} 行")
     print(f"币安列名: {list(df.columns)}")
 
-    # 重命名列以统一格式
-    df = df.rename(columns={
-        '时间(UTC)': 'Time',
-        '时间': 'Time',  # 兼容舊格式
-        '交易对': 'Symbol',
-        '资金费用': 'Funding_Fee',
-        '资产': 'Asset'
-    })
-
-    # 转换时间格式
-    df['Time'] = pd.to_datetime(df['Time'])
+    # 转换时间格式（ISO8601 向量化解析，兼容带毫秒/时区偏移的新格式与不带时区的旧格式，统一为UTC）
+    df['Time'] = pd.to_datetime(df['Time'], **TIME_PARSE_KWARGS)
 
     # 选择需要的列
     df = df[['Time', 'Symbol', 'Funding_Fee']].copy()
@@ -98,30 +145,18 @@ def load_and_process_binance_csv(filepath):
     return df
 
 
-def load_and_process_bybit_csv(filepath):
+def load_and_process_bybit_csv(filepaths):
     """
-    加载和处理Bybit CSV文件
+    加载和处理Bybit CSV文件（单个路径或路径列表）
     """
-    print(f"正在加载Bybit文件: {filepath}")
+    print(f"正在加载Bybit文件: {filepaths}")
 
-    df = pd.read_csv(filepath)
+    df = read_csv_files(filepaths, BYBIT_COLUMNS)
     print(f"Bybit原始数据: {len(df)} 行")
     print(f"Bybit列名: {list(df.columns)}")
 
-    # 重命名列以统一格式
-    df = df.rename(columns={
-        '交易时间(UTC)': 'Time',
-        '交易时间': 'Time',  # 兼容舊格式
-        '交易对': 'Symbol',
-        '资金费用': 'Funding_Fee',
-        '方向': 'Direction',
-        '数量': 'Quantity',
-        '费率': 'Fee_Rate',
-        '货币': 'Currency'
-    })
-
-    # 转换时间格式
-    df['Time'] = pd.to_datetime(df['Time'])
+    # 转换时间格式（ISO8601 向量化解析，兼容带毫秒/时区偏移的新格式与不带时区的旧格式，统一为UTC）
+    df['Time'] = pd.to_datetime(df['Time'], **TIME_PARSE_KWARGS)
 
     # 选择需要的列
     df = df[['Time', 'Symbol', 'Funding_Fee']].copy()
@@ -137,49 +172,40 @@ def merge_funding_fees(binance_df, bybit_df):
     """
     print("\n开始合并数据...")
 
-    # 创建时间和交易对的组合索引用于合并
-    binance_df['Time_Symbol'] = binance_df['Time'].dt.strftime('%Y-%m-%d %H:%M:%S') + '_' + binance_df['Symbol']
-    bybit_df['Time_Symbol'] = bybit_df['Time'].dt.strftime('%Y-%m-%d %H:%M:%S') + '_' + bybit_df['Symbol']
+    # 同一时间-交易对只保留第一条记录，再按 (Time, Symbol) 做一次外连接
+    binance_df = binance_df.drop_duplicates(['Time', 'Symbol'])
+    bybit_df = bybit_df.drop_duplicates(['Time', 'Symbol'])
+    merged_df = binance_df.merge(bybit_df, on=['Time', 'Symbol'], how='outer')
 
-    # 获取所有唯一的时间和交易对组合
-    all_time_symbols = set(binance_df['Time_Symbol'].tolist() + bybit_df['Time_Symbol'].tolist())
+    print(f"总共有 {len(merged_df)} 个唯一的时间-交易对组合")
 
-    print(f"总共有 {len(all_time_symbols)} 个唯一的时间-交易对组合")
+    # 缺少一方数据时该方记为 0，计算净资金费用 (币安 + Bybit)
+    merged_df = merged_df.rename(columns={'Binance_FF': 'Binance FF', 'Bybit_FF': 'Bybit FF'})
+    merged_df[['Binance FF', 'Bybit FF']] = merged_df[['Binance FF', 'Bybit FF']].fillna(0)
+    merged_df['Net FF'] = merged_df['Binance FF'] + merged_df['Bybit FF']
 
-    # 创建完整的数据框架
-    merged_data = []
-
-    for time_symbol in all_time_symbols:
-        time_str, symbol = time_symbol.rsplit('_', 1)
-        time_obj = pd.to_datetime(time_str)
-
-        # 查找币安数据
-        binance_row = binance_df[binance_df['Time_Symbol'] == time_symbol]
-        binance_ff = binance_row['Binance_FF'].iloc[0] if len(binance_row) > 0 else 0
-
-        # 查找Bybit数据
-        bybit_row = bybit_df[bybit_df['Time_Symbol'] == time_symbol]
-        bybit_ff = bybit_row['Bybit_FF'].iloc[0] if len(bybit_row) > 0 else 0
-
-        # 计算净资金费用 (币安 + Bybit)
-        net_ff = binance_ff + bybit_ff
-
-        merged_data.append({
-            'Time': time_obj,
-            'Symbol': symbol,
-            'Binance FF': binance_ff,
-            'Bybit FF': bybit_ff,
-            'Net FF': net_ff
-        })
-
-    # 转换为DataFrame并排序
-    merged_df = pd.DataFrame(merged_data)
+    # 排序
     merged_df = merged_df.sort_values(['Time', 'Symbol']).reset_index(drop=True)
+    merged_df = shrink_dtypes(merged_df)
 
     print(f"合并后数据: {len(merged_df)} 行")
     return merged_df
 
 
+def shrink_dtypes(merged_df):
+    """
+    压缩合并结果的内存占用：Symbol 转为 category，
+    资金费用列在 float32 误差不超过 FLOAT32_ATOL 时转为 float32（否则保留 float64）
+    """
+    merged_df['Symbol'] = merged_df['Symbol'].astype('category')
+    for col in ['Binance FF', 'Bybit FF', 'Net FF']:
+        values = merged_df[col].to_numpy()
+        values32 = values.astype(np.float32)
+        if np.allclose(values32, values, rtol=0, atol=FLOAT32_ATOL):
+            merged_df[col] = values32
+    return merged_df
+
+
 def ensure_output_directory(output_dir="csv/Return"):
     """
     确保输出目录存在，如果不存在则创建
@@ -233,7 +259,7 @@ def save_merged_data(merged_df, start_date, end_date, output_dir="csv/Return"):
 
     try:
         # 保存CSV文件
-        merged_df.to_csv(filepath, index=False, encoding='utf-8-sig')
+        merged_df.to_csv(filepath, index=False, encoding='utf-8-sig', chunksize=CSV_CHUNKSIZE)
         print(f"✓ 合并数据已保存到: {filepath}")
         return filepath
     except Exception as e:
@@ -268,24 +294,23 @@ def main():
             print("请确保已运行Bybit资金费用查询工具并生成了CSV文件")
             return
 
-        # 如果有多个文件，让用户选择或使用最新的
-        binance_file = binance_files[0] if len(binance_files) == 1 else max(binance_files, key=os.path.getctime)
-        bybit_file = bybit_files[0] if len(bybit_files) == 1 else max(bybit_files, key=os.path.getctime)
-
+        # 有多个文件时全部读取并合并（重叠部分在合并时按 时间-交易对 去重）
         print(f"\n使用文件:")
-        print(f"币安: {binance_file}")
-        print(f"Bybit: {bybit_file}")
+        print(f"币安: {binance_files}")
+        print(f"Bybit: {bybit_files}")
 
-        # 解析日期范围
-        binance_dates = parse_date_from_filename(binance_file)
-        bybit_dates = parse_date_from_filename(bybit_file)
+        # 解析日期范围（多个文件时取最早开始日期和最晚结束日期）
+        binance_ranges = [r for r in map(parse_date_from_filename, binance_files) if r]
+        bybit_ranges = [r for r in map(parse_date_from_filename, bybit_files) if r]
+        binance_dates = (min(r[0] for r in binance_ranges), max(r[1] for r in binance_ranges)) if binance_ranges else None
+        bybit_dates = (min(r[0] for r in bybit_ranges), max(r[1] for r in bybit_ranges)) if bybit_ranges else None
 
         # 加载和处理数据
         print(f"\n步骤2: 加载数据")
         print("-" * 40)
 
-        binance_df = load_and_process_binance_csv(binance_file)
-        bybit_df = load_and_process_bybit_csv(bybit_file)
+        binance_df = load_and_process_binance_csv(binance_files)
+        bybit_df = load_and_process_bybit_csv(bybit_files)
 
         # 合并数据
         print(f"\n步骤3: 合并数据")
@@ -348,7 +373,7 @@ def main():
 
 if __name__ == "__main__":
     print("请确保已安装依赖包:")
-    print("pip install pandas")
+    print("pip install pandas  (可选: pip install pyarrow 以加速CSV读取)")
     print()
 
     main()
\ No newline at end of file
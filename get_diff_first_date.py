@@ -28,6 +28,12 @@ class DiffFirstDateCalculator:
     
     def __init__(self):
         self.db = DatabaseManager()
+        # WAL 與 synchronous = NORMAL 已由 get_connection() 建立連接時設定，這裡只加上查詢用的設置（同一執行緒內復用此連接）
+        conn = self.db.get_connection()
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA mmap_size = 268435456")  # 256MB 記憶體映射
+        conn.execute("PRAGMA cache_size = -65536")  # 64MB 頁面緩存（負數表示KB）
+        # 自連接所需的覆蓋索引 idx_funding_history_symbol_exchange_time 已由 DatabaseManager 初始化時建立
         
     def get_all_trading_pairs(self):
         """獲取所有交易對"""
@@ -39,48 +45,45 @@ class DiffFirstDateCalculator:
         
         return pd.read_sql_query(query, self.db.get_connection())
     
-    def calculate_diff_first_date_for_pair(self, symbol, exchange_a, exchange_b):
+    def calculate_diff_first_dates(self, only_missing=True):
         """
-        計算特定交易對的首次資金費率差出現時間
+        一次查詢計算所有交易對的首次資金費率差出現時間
         
         Args:
-            symbol: 交易對符號
-            exchange_a: 交易所A
-            exchange_b: 交易所B
+            only_missing: 只計算 diff_first_date 為空的交易對，默認True
             
         Returns:
-            str: 首次出現資金費率差的時間 (YYYY-MM-DD HH:MM:SS)，如果沒有找到則返回None
+            dict: {交易對id: 首次出現資金費率差的時間 (YYYY-MM-DD HH:MM:SS)}，未找到的交易對不在字典中
         """
         
-        query = """
+        query = f"""
         SELECT 
-            h1.timestamp_utc,
-            h1.funding_rate as rate_a,
-            h2.funding_rate as rate_b
-        FROM funding_rate_history h1
+            tp.id,
+            MIN(h1.timestamp_utc) as diff_first_date
+        FROM trading_pairs tp
+        INNER JOIN funding_rate_history h1 
+            ON h1.symbol = tp.symbol 
+            AND h1.exchange = tp.exchange_a
         INNER JOIN funding_rate_history h2 
-            ON h1.timestamp_utc = h2.timestamp_utc 
-            AND h1.symbol = h2.symbol
-        WHERE h1.symbol = ?
-            AND h1.exchange = ?
-            AND h2.exchange = ?
-            AND h1.funding_rate IS NOT NULL
+            ON h2.symbol = tp.symbol 
+            AND h2.exchange = tp.exchange_b
+            AND h2.timestamp_utc = h1.timestamp_utc
+        WHERE h1.funding_rate IS NOT NULL
             AND h2.funding_rate IS NOT NULL
-        ORDER BY h1.timestamp_utc
-        LIMIT 1
+            {"AND tp.diff_first_date IS NULL" if only_missing else ""}
+        GROUP BY tp.id
         """
         
         with self.db.get_connection() as conn:
-            cursor = conn.execute(query, [symbol, exchange_a, exchange_b])
-            result = cursor.fetchone()
-            
-            if result:
-                return result[0]  # timestamp_utc
-            else:
-                return None
+            return dict(conn.execute(query).fetchall())
     
-    def update_diff_first_date(self, pair_id, diff_first_date):
-        """更新交易對的 diff_first_date"""
+    def update_diff_first_dates(self, updates):
+        """
+        批量更新交易對的 diff_first_date（單一事務）
+        
+        Args:
+            updates: [(diff_first_date, pair_id), ...]
+        """
         
         query = """
         UPDATE trading_pairs 
@@ -89,7 +92,7 @@ class DiffFirstDateCalculator:
         """
         
         with self.db.get_connection() as conn:
-            conn.execute(query, [diff_first_date, pair_id])
+            conn.executemany(query, updates)
     
     def calculate_all_diff_first_dates(self, force_recalculate=False):
         """
@@ -126,22 +129,23 @@ class DiffFirstDateCalculator:
         # 統計變量
         updated_count = 0
         not_found_count = 0
+        updates = []
+        
+        # 一次查詢算出所有需要處理的交易對的首次出現時間
+        diff_first_dates = self.calculate_diff_first_dates(only_missing=not force_recalculate)
         
         # 開始處理
-        for _, row in tqdm(to_process.iterrows(), total=len(to_process), desc="計算進度"):
-            pair_id = row['id']
-            symbol = row['symbol']
-            exchange_a = row['exchange_a']
-            exchange_b = row['exchange_b']
+        for row in tqdm(to_process.itertuples(index=False), total=len(to_process), desc="計算進度"):
+            pair_id = row.id
+            symbol = row.symbol
+            exchange_a = row.exchange_a
+            exchange_b = row.exchange_b
             
-            # 計算首次出現時間
-            diff_first_date = self.calculate_diff_first_date_for_pair(
-                symbol, exchange_a, exchange_b
-            )
+            diff_first_date = diff_first_dates.get(pair_id)
             
             if diff_first_date:
-                # 更新數據庫
-                self.update_diff_first_date(pair_id, diff_first_date)
+                # 先收集，循環結束後一次寫入數據庫
+                updates.append((diff_first_date, pair_id))
                 updated_count += 1
                 
                 if updated_count <= 5:  # 只顯示前5個示例
@@ -151,6 +155,10 @@ class DiffFirstDateCalculator:
                 if not_found_count <= 3:  # 只顯示前3個未找到的示例
                     print(f"⚠️ {symbol}_{exchange_a}_{exchange_b}: 未找到資金費率差數據")
         
+        # 更新數據庫
+        if updates:
+            self.update_diff_first_dates(updates)
+        
         # 輸出結果統計
         print(f"\n🎉 計算完成！")
         print(f"✅ 成功更新: {updated_count} 個交易對")
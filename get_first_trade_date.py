@@ -7,72 +7,250 @@
 import ccxt.async_support as ccxt
 import asyncio
 import argparse
+import json
+import os
+import time
 from datetime import datetime
 
-async def get_earliest_date(exchange_id: str, symbol: str, market_type: str) -> None:
+# 嘗試導入 orjson（Rust 實現，解析與序列化更快），如果沒有則使用標準庫 json
+try:
+    import orjson
+    json_loads = orjson.loads
+    def json_dumps(obj):
+        return orjson.dumps(obj, default=str)
+except ImportError:
+    json_loads = json.loads
+    def json_dumps(obj):
+        return json.dumps(obj, default=str).encode("utf-8")
+
+# 本地快取：各交易所的 markets 數據（每次 load_markets 需下載數 MB），24 小時內重跑直接讀取檔案
+MARKETS_CACHE_DIR = os.path.join("data", "cache", "markets")
+MARKETS_CACHE_TTL = 24 * 60 * 60
+
+# 同時進行的查詢數上限，避免觸發交易所的限流 / DDoS 防護
+MAX_CONCURRENT_QUERIES = 8
+# 遇到限流或網絡錯誤時的最大嘗試次數（每次等待 2^attempt 秒）
+MAX_RETRIES = 3
+
+
+def get_markets_cache_path(exchange_id: str, market_type: str) -> str:
+    """依 (交易所, 市場類型) 產生 markets 快取檔案路徑"""
+    return os.path.join(MARKETS_CACHE_DIR, f"{exchange_id}_{market_type}.json")
+
+
+def load_cached_markets(cache_path: str):
+    """讀取未過期的 markets 快取，沒有或已過期時返回 None"""
+    if not os.path.exists(cache_path):
+        return None
+    if time.time() - os.path.getmtime(cache_path) >= MARKETS_CACHE_TTL:
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            return json_loads(f.read())
+    except Exception as e:
+        print(f"⚠️ 讀取 markets 快取失敗，改為重新請求: {e}")
+        return None
+
+
+def save_cached_markets(cache_path: str, markets: dict) -> None:
+    """原子寫入 markets 快取（先寫臨時檔再替換）"""
+    try:
+        os.makedirs(MARKETS_CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_dumps(markets))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"⚠️ 寫入 markets 快取失敗: {e}")
+
+
+async def call_with_retry(func, *args, **kwargs):
     """
-    異步獲取單個交易所上特定交易對的最早K線日期
+    調用交易所 API，遇到限流 (RateLimitExceeded) 或網絡錯誤時按指數退避重試；
+    重試期間沿用同一交易所實例，復用其內部的 HTTP 連線池
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            return await func(*args, **kwargs)
+        except (ccxt.RateLimitExceeded, ccxt.NetworkError) as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = 2 ** attempt
+            print(f"  > 請求失敗 ({type(e).__name__})，{delay} 秒後重試 ({attempt + 1}/{MAX_RETRIES - 1})...")
+            await asyncio.sleep(delay)
+
+
+async def load_markets_cached(exchange, exchange_id: str, market_type: str) -> dict:
+    """
+    加載交易所 markets，優先使用本地快取；快取未命中時請求交易所並寫入快取
+
+    Returns:
+        dict: exchange.markets
+    """
+    cache_path = get_markets_cache_path(exchange_id, market_type)
+    markets = load_cached_markets(cache_path)
+    if markets is not None:
+        # 預先填入 markets，後續 load_markets / fetch_ohlcv 不再請求交易所
+        exchange.set_markets(markets)
+        return exchange.markets
+
+    markets = await call_with_retry(exchange.load_markets)
+    save_cached_markets(cache_path, markets)
+    return markets
+
+def get_listing_timestamp(market: dict):
+    """
+    從 markets 元數據中取得上市時間（毫秒），沒有時返回 None
+    (幣安合約: info.onboardDate，Bybit 合約: info.launchTime)
+    """
+    info = market.get('info') or {}
+    value = info.get('onboardDate') or info.get('launchTime')
+    try:
+        timestamp_ms = int(value)
+    except (TypeError, ValueError):
+        return None
+    return timestamp_ms if timestamp_ms > 0 else None
+
+
+def resolve_market_symbol(markets: dict, symbol: str, market_type: str):
+    """
+    在 markets 中找出要查詢的市場名稱，不存在時返回 None
+    合約模式下 ccxt 的 binance / bybit 會同時載入現貨市場，'XXX/USDT' 通常指向現貨（沒有上市時間元數據），
+    因此先嘗試合約格式 'XXX/USDT:USDT'，找不到時才退回原名稱
+    """
+    candidates = [symbol]
+    if market_type == 'future' and '/' in symbol and ':' not in symbol:
+        candidates.insert(0, f"{symbol}:{symbol.split('/')[1]}")
+    for candidate in candidates:
+        if candidate in markets:
+            return candidate
+    return None
+
+
+def create_exchange(exchange_id: str, market_type: str):
+    """
+    根據市場類型創建交易所實例
 
     Args:
         exchange_id (str): 交易所ID
-        symbol (str): 交易對符號
         market_type (str): 市場類型 ('spot' 或 'future')
     """
-    print(f"🔍 正在查詢 {exchange_id.upper()} 的 {market_type.upper()} 市場上的 {symbol}...")
+    exchange_class = getattr(ccxt, exchange_id)
     
-    try:
-        exchange_class = getattr(ccxt, exchange_id)
-        
-        # 根據市場類型配置交易所實例
-        config = {}
-        if market_type == 'future':
-            if exchange_id == 'binance':
-                # 幣安U本位合約使用 'future'
-                config = {'options': {'defaultType': 'future'}}
-            elif exchange_id == 'bybit':
-                # Bybit 永續合約使用 'swap'
-                config = {'options': {'defaultType': 'swap'}}
-            # 未來可在此處為其他交易所添加配置
-        
-        exchange = exchange_class(config)
+    # 根據市場類型配置交易所實例
+    config = {}
+    if market_type == 'future':
+        if exchange_id == 'binance':
+            # 幣安U本位合約使用 'future'
+            config = {'options': {'defaultType': 'future'}}
+        elif exchange_id == 'bybit':
+            # Bybit 永續合約使用 'swap'
+            config = {'options': {'defaultType': 'swap'}}
+        # 未來可在此處為其他交易所添加配置
+    
+    return exchange_class(config)
+
 
-        # 我們需要一個非常早的日期作為查詢起點
-        # CCXT 要求時間戳是毫秒級的
-        since = exchange.parse8601('2015-01-01T00:00:00Z')
+async def get_earliest_date(exchange, exchange_id: str, symbol: str, market_type: str, semaphore: asyncio.Semaphore) -> None:
+    """
+    異步獲取單個交易所上特定交易對的最早K線日期
+
+    Args:
+        exchange: 已加載 markets 的交易所實例（同一交易所的各查詢共用）
+        exchange_id (str): 交易所ID
+        symbol (str): 交易對符號
+        market_type (str): 市場類型 ('spot' 或 'future')
+        semaphore (asyncio.Semaphore): 限制同時進行的查詢數
+    """
+    async with semaphore:
+        print(f"🔍 正在查詢 {exchange_id.upper()} 的 {market_type.upper()} 市場上的 {symbol}...")
         
-        # 嘗試獲取日K線 ('1d')，並且只獲取第一根 (limit=1)
-        # 這是推斷最早上市日期的最高效方法
         try:
-            ohlcv = await exchange.fetch_ohlcv(symbol, '1d', since=since, limit=1)
-        except ccxt.BadSymbol:
-            # 如果通用符號失敗，嘗試Bybit等交易所的特殊格式 (e.g., xxx/USDT:USDT)
-            if '/' in symbol and market_type == 'future' and symbol.endswith('USDT'):
-                new_symbol = f"{symbol}:{symbol.split('/')[1]}"
-                print(f"  > {symbol} 未找到，自動嘗試備用名稱: {new_symbol}...")
-                # 重新賦值 symbol 以便後續打印正確的名稱
-                symbol = new_symbol 
-                ohlcv = await exchange.fetch_ohlcv(symbol, '1d', since=since, limit=1)
-            else:
-                # 如果不符合修正條件，則重新拋出異常
-                raise
-        
-        await exchange.close()
-        
-        if ohlcv:
-            first_candle = ohlcv[0]
-            timestamp_ms = first_candle[0]
-            # 將毫秒時間戳轉換為人類可讀的日期時間格式
-            date_str = datetime.utcfromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S UTC')
-            print(f"✅ {exchange_id.upper()} - {symbol}: 最早數據日期為 {date_str}")
-        else:
-            print(f"⚠️ {exchange_id.upper()} - {symbol}: 未找到任何歷史數據。可能該交易對未上市或數據不完整。")
+            markets = exchange.markets
+
+            # 直接在 markets 中檢查交易對，不存在時無需任何網絡請求
+            resolved_symbol = resolve_market_symbol(markets, symbol, market_type)
+            if resolved_symbol is None:
+                print(f"❌ {exchange_id.upper()} - {symbol}: 交易對不存在。")
+                return
+            if resolved_symbol != symbol:
+                print(f"  > {symbol} 使用合約名稱: {resolved_symbol}...")
+                symbol = resolved_symbol
+
+            # markets 元數據已帶上市時間時直接使用，無需再請求K線
+            timestamp_ms = get_listing_timestamp(markets[symbol])
+            if timestamp_ms is not None:
+                date_str = datetime.utcfromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S UTC')
+                print(f"✅ {exchange_id.upper()} - {symbol}: 最早上市日期為 {date_str} (markets 元數據)")
+                return
+
+            # 我們需要一個非常早的日期作為查詢起點
+            # CCXT 要求時間戳是毫秒級的
+            since = exchange.parse8601('2015-01-01T00:00:00Z')
             
-    except ccxt.BadSymbol as e:
-        print(f"❌ {exchange_id.upper()} - {symbol}: 交易對不存在。錯誤: {e}")
+            # 嘗試獲取日K線 ('1d')，並且只獲取第一根 (limit=1)
+            # 這是推斷最早上市日期的最高效方法
+            ohlcv = await call_with_retry(exchange.fetch_ohlcv, symbol, '1d', since=since, limit=1)
+            
+            if ohlcv:
+                first_candle = ohlcv[0]
+                timestamp_ms = first_candle[0]
+                # 將毫秒時間戳轉換為人類可讀的日期時間格式
+                date_str = datetime.utcfromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S UTC')
+                print(f"✅ {exchange_id.upper()} - {symbol}: 最早數據日期為 {date_str}")
+            else:
+                print(f"⚠️ {exchange_id.upper()} - {symbol}: 未找到任何歷史數據。可能該交易對未上市或數據不完整。")
+                
+        except ccxt.BadSymbol as e:
+            print(f"❌ {exchange_id.upper()} - {symbol}: 交易對不存在。錯誤: {e}")
+        except ccxt.NetworkError as e:
+            print(f"❌ {exchange_id.upper()} - {symbol}: 網絡錯誤。錯誤: {e}")
+        except Exception as e:
+            print(f"❌ {exchange_id.upper()} - {symbol}: 發生未知錯誤。錯誤: {e}")
+
+
+async def query_exchange(exchange_id: str, symbols: list, market_type: str, semaphore: asyncio.Semaphore) -> None:
+    """
+    在單一交易所實例上查詢多個交易對：markets 只加載一次，連線池在各查詢間復用
+
+    Args:
+        exchange_id (str): 交易所ID
+        symbols (list): 交易對符號列表
+        market_type (str): 市場類型 ('spot' 或 'future')
+        semaphore (asyncio.Semaphore): 限制同時進行的查詢數
+    """
+    exchange = None
+    try:
+        exchange = create_exchange(exchange_id, market_type)
+        async with semaphore:
+            await load_markets_cached(exchange, exchange_id, market_type)
+        await asyncio.gather(*(
+            get_earliest_date(exchange, exchange_id, symbol, market_type, semaphore) for symbol in symbols
+        ))
     except ccxt.NetworkError as e:
-        print(f"❌ {exchange_id.upper()} - {symbol}: 網絡錯誤。錯誤: {e}")
+        print(f"❌ {exchange_id.upper()}: 加載 markets 時網絡錯誤。錯誤: {e}")
     except Exception as e:
-        print(f"❌ {exchange_id.upper()} - {symbol}: 發生未知錯誤。錯誤: {e}")
+        print(f"❌ {exchange_id.upper()}: 初始化交易所時發生錯誤。錯誤: {e}")
+    finally:
+        # 無論成功或出錯都關閉交易所實例，釋放連線池
+        if exchange is not None:
+            await exchange.close()
+
+
+def normalize_symbol(symbol_input: str):
+    """
+    格式化交易對，確保是 'CVC/USDT' 或 'CVC/USDT:USDT'；無法解析時返回 None
+    """
+    symbol = symbol_input.strip()
+    if ':' not in symbol and '/' not in symbol:
+        if symbol.upper().endswith('USDT'):
+            base = symbol.upper().replace('USDT', '')
+            symbol = f"{base}/USDT"
+            print(f"  > {symbol_input} 已自動格式化為: {symbol}")
+        else:
+            print(f"無法解析的交易對格式: {symbol_input}。請使用 'BASE/QUOTE' 或 'BASE/QUOTE:QUOTE' 格式。")
+            return None
+    return symbol
 
 
 def get_user_input():
@@ -84,16 +262,9 @@ def get_user_input():
     # 獲取交易對
     symbol_input = input("請輸入要查詢的交易對 (例如 CVCUSDT 或 CVC/USDT:USDT): ").strip()
     
-    # 格式化交易對，確保是 'CVC/USDT' 或 'CVC/USDT:USDT'
-    symbol = symbol_input
-    if ':' not in symbol_input and '/' not in symbol_input:
-        if symbol_input.upper().endswith('USDT'):
-            base = symbol_input.upper().replace('USDT', '')
-            symbol = f"{base}/USDT"
-            print(f"  > 已自動格式化為: {symbol}")
-        else:
-            print(f"無法解析的交易對格式: {symbol_input}。請使用 'BASE/QUOTE' 或 'BASE/QUOTE:QUOTE' 格式。")
-            return None, None, None
+    symbol = normalize_symbol(symbol_input)
+    if symbol is None:
+        return None, None, None
 
     # 獲取交易所
     exchanges_input = input("請輸入一個或多個交易所,用空格或逗號分隔 (例如 binance bybit): ").strip().lower()
@@ -113,19 +284,46 @@ def get_user_input():
     return symbol, exchanges, market_type
 
 
+def parse_args():
+    """解析命令行參數；未提供時回退到互動式輸入"""
+    parser = argparse.ArgumentParser(description='查詢交易對在指定交易所的最早上市日期')
+    parser.add_argument('--symbols', nargs='+',
+                        help='一個或多個交易對 (例如 CVCUSDT BTC/USDT:USDT)')
+    parser.add_argument('--exchanges', nargs='+',
+                        help='一個或多個交易所 (例如 binance bybit)')
+    parser.add_argument('--market-type', choices=['spot', 'future'],
+                        help="市場類型 ('spot' 或 'future')")
+    args = parser.parse_args()
+    
+    provided = [args.symbols, args.exchanges, args.market_type]
+    if any(provided) and not all(provided):
+        parser.error('--symbols、--exchanges 與 --market-type 需同時提供')
+    return args
+
+
 async def main():
     """主函數，處理命令行參數並並發執行查詢"""
+    args = parse_args()
     
-    symbol, exchanges, market_type = get_user_input()
+    if args.symbols:
+        # 批量模式：同一進程內查詢所有 (交易對, 交易所) 組合
+        symbols = [normalize_symbol(symbol) for symbol in args.symbols]
+        symbols = [symbol for symbol in symbols if symbol]
+        exchanges = [exchange.lower() for exchange in args.exchanges]
+        market_type = args.market_type
+    else:
+        symbol, exchanges, market_type = get_user_input()
+        symbols = [symbol] if symbol else []
 
-    if not all([symbol, exchanges, market_type]):
+    if not all([symbols, exchanges, market_type]):
         print("\n未能獲取有效輸入，程序終止。")
         return
 
-    print(f"\n===== 開始查詢 {symbol} 在 {market_type.upper()} 市場的最早上市日期 =====\n")
+    print(f"\n===== 開始查詢 {', '.join(symbols)} 在 {market_type.upper()} 市場的最早上市日期 =====\n")
     
-    # 創建並發任務
-    tasks = [get_earliest_date(exchange, symbol, market_type) for exchange in exchanges]
+    # 每個交易所一個任務（共用實例與 markets），以信號量限制同時進行的查詢數
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    tasks = [query_exchange(exchange, symbols, market_type, semaphore) for exchange in exchanges]
     await asyncio.gather(*tasks)
     
     print("\n===== 查詢完畢 =====\n")
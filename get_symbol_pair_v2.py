@@ -1,11 +1,48 @@
 import os
-import pandas as pd
-import time
+import re
+import sys
+import pickle
+from collections import defaultdict
+from itertools import combinations
+from operator import itemgetter
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
 from database_operations import DatabaseManager
 
+log = logging.getLogger(__name__)
+
 # 獲取項目根目錄
 project_root = os.path.dirname(os.path.abspath(__file__))
 
+# 本地快取：{symbol: max_market_cap} 字典，市值表數據版本不變時直接讀取，不再讀表與聚合
+MARKET_CAPS_CACHE_PATH = os.path.join("data", "cache", "market_caps.pkl")
+
+def load_cached_market_caps(version):
+    """讀取與數據版本一致的市值快取，沒有或版本不符時返回 None"""
+    if not os.path.exists(MARKET_CAPS_CACHE_PATH):
+        return None
+    try:
+        with open(MARKET_CAPS_CACHE_PATH, "rb") as f:
+            cached = pickle.load(f)
+    except Exception as e:
+        log_message(f"⚠️ 讀取市值快取失敗，改為從數據庫讀取: {e}")
+        return None
+    if cached.get('version') != version:
+        return None
+    return cached['data']
+
+def save_cached_market_caps(version, market_cap_dict):
+    """原子寫入市值快取（先寫臨時檔再替換）"""
+    try:
+        os.makedirs(os.path.dirname(MARKET_CAPS_CACHE_PATH), exist_ok=True)
+        tmp_path = MARKET_CAPS_CACHE_PATH + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({'version': version, 'data': market_cap_dict}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, MARKET_CAPS_CACHE_PATH)
+    except Exception as e:
+        log_message(f"⚠️ 寫入市值快取失敗: {e}")
+
 def load_market_caps_from_database():
     """
     從數據庫讀取市值資料，並將 {SYMBOL(大寫): 最大 market_cap} 存入字典。
@@ -14,6 +51,14 @@ def load_market_caps_from_database():
         dict: {symbol: max_market_cap}
     """
     db = DatabaseManager()
+    
+    # 市值表未變更時直接使用快取
+    version = db.get_market_caps_version()
+    market_cap_dict = load_cached_market_caps(version)
+    if market_cap_dict is not None:
+        log_message(f"💾 市值資料未變更，使用本地快取，共 {len(market_cap_dict)} 個 symbol")
+        return market_cap_dict
+    
     df = db.get_market_caps()
     
     if df.empty:
@@ -23,140 +68,157 @@ def load_market_caps_from_database():
     log_message("=== 數據庫市值數據 ===")
     log_message(f"總共有 {len(df)} 個幣種的市值資料")
     
-    # 顯示前5名作為示例
-    top_5 = df.head(5)
-    for _, row in top_5.iterrows():
-        symbol = str(row['symbol']).upper()
-        market_cap = row['market_cap']
-        if pd.notna(market_cap):
-            log_message(f"  {symbol}: ${market_cap:,.0f}")
-    
-    # 建立 {symbol: market_cap} 字典
-    market_cap_dict = {}
-    for _, row in df.iterrows():
-        symbol = str(row['symbol']).upper()
-        market_cap = row['market_cap']
-        
-        if pd.notna(market_cap) and market_cap > 0:
-            # 如果已存在該 symbol，取較大的 market_cap
-            if symbol in market_cap_dict:
-                market_cap_dict[symbol] = max(market_cap_dict[symbol], market_cap)
-            else:
-                market_cap_dict[symbol] = market_cap
+    # 統一大寫 symbol，只保留有效（非空且大於0）的市值
+    df = df.assign(symbol=df['symbol'].astype(str).str.upper())
+    df = df[df['market_cap'].notna() & (df['market_cap'] > 0)]
+    
+    # 顯示市值前5名作為示例
+    for symbol, market_cap in df.nlargest(5, 'market_cap')[['symbol', 'market_cap']].itertuples(index=False):
+        log_message(f"  {symbol}: ${market_cap:,.0f}")
+    
+    # 建立 {symbol: market_cap} 字典，同一 symbol 有多筆時取較大的 market_cap
+    market_cap_dict = df.groupby('symbol', sort=False)['market_cap'].max().to_dict()
+    save_cached_market_caps(version, market_cap_dict)
     
     log_message(f"✅ 從數據庫讀取市值資料，共 {len(market_cap_dict)} 個 symbol")
     return market_cap_dict
 
-def log_message(msg):
-    """打印日誌消息"""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {msg}")
+# 打印日誌消息（時間戳由 logging.Formatter 統一添加）
+log_message = log.info
+
+def start_log_listener():
+    """
+    日誌經佇列交給背景執行緒的 QueueListener 格式化並輸出到 stdout，
+    log_message 呼叫只需把記錄放入佇列
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    listener = QueueListener(log_queue, stream_handler)
+    log.addHandler(QueueHandler(log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener.start()
+    return listener
+
+# 計價幣種後綴（與 extract_base_symbol 的順序一致），後綴前至少保留一個字元
+QUOTE_SUFFIX_PATTERN = r'(?<=.)(?:USDT|USDC|BUSD|USD|BTC|ETH)$'
+QUOTE_SUFFIX_RE = re.compile(QUOTE_SUFFIX_PATTERN)
 
 def extract_base_symbol(trading_pair):
     """
     從交易對中提取基礎幣種
     例：BTCUSDT -> BTC, ETHUSDT -> ETH
     """
-    # 移除常見的計價幣種後綴
-    quote_currencies = ['USDT', 'USDC', 'BUSD', 'USD', 'BTC', 'ETH']
-    
-    for quote in quote_currencies:
-        if trading_pair.endswith(quote):
-            base = trading_pair[:-len(quote)]
-            if base:  # 確保提取後不為空
-                return base.upper()
-    
-    # 如果沒有匹配到常見後綴，返回原字符串
-    return trading_pair.upper()
+    # 移除常見的計價幣種後綴（預編譯正則，一次匹配）；沒有匹配到常見後綴時返回原字符串
+    return QUOTE_SUFFIX_RE.sub('', trading_pair, count=1).upper()
+
+# 各交易所支持的交易對（模組載入時建立一次，不可變，可在多次調用間直接共用）
+BINANCE_SYMBOLS = frozenset({
+    'BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT',
+    'DOGEUSDT', 'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSD',
+    'XLMUSDT', 'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT',
+    'NEARUSDT', 'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT',
+    'AXSUSDT', 'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT',
+    '1INCHUSDT', 'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT',
+    'COMPUSDT', 'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
+    'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
+})
+BYBIT_SYMBOLS = frozenset({
+    'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
+    'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
+    'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
+    'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
+    'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
+    'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
+    'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
+    'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
+})
+OKX_SYMBOLS = frozenset({
+    'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
+    'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
+    'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
+    'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
+    'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
+    'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
+    'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
+    'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
+})
+GATEIO_SYMBOLS = frozenset({
+    'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
+    'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
+    'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
+    'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
+    'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
+    'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
+    'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
+    'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
+})
+
+SYMBOLS_BY_EXCHANGE = {
+    'binance': BINANCE_SYMBOLS,
+    'bybit': BYBIT_SYMBOLS,
+    'okx': OKX_SYMBOLS,
+    'gate.io': GATEIO_SYMBOLS,
+}
+
+# 交易對 -> 基礎幣種（對所有交易所交易對的並集只提取一次）
+BASE_SYMBOL_BY_PAIR = {
+    symbol: extract_base_symbol(symbol)
+    for symbol in frozenset().union(*SYMBOLS_BY_EXCHANGE.values())
+}
 
 def get_unique_symbols_by_exchange():
     """
     取得各交易所的獨特交易對 symbols
     """
-    symbols_by_exchange = {
-        'binance': set([
-            'BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT',
-            'DOGEUSDT', 'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSD',
-            'XLMUSDT', 'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT',
-            'NEARUSDT', 'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT',
-            'AXSUSDT', 'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT',
-            '1INCHUSDT', 'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT',
-            'COMPUSDT', 'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
-            'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
-        ]),
-        'bybit': set([
-            'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
-            'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
-            'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
-            'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
-            'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
-            'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
-            'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
-            'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
-        ]),
-        'okx': set([
-            'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
-            'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
-            'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
-            'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
-            'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
-            'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
-            'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
-            'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
-        ]),
-        'gate.io': set([
-            'BTCUSDT', 'ETHUSDT', 'XRPUSDT', 'ADAUSDT', 'SOLUSDT', 'DOTUSDT', 'DOGEUSDT',
-            'AVAXUSDT', 'SHIBUSDT', 'LTCUSDT', 'LINKUSDT', 'UNIUSDT', 'BCHUSDT', 'XLMUSDT',
-            'ATOMUSDT', 'FILUSDT', 'ICPUSDT', 'VETUSDT', 'ETCUSDT', 'TRXUSDT', 'NEARUSDT',
-            'ALGOUSDT', 'AAVEUSDT', 'MKRUSDT', 'THETAUSDT', 'XMRUSDT', 'EOSUSDT', 'AXSUSDT',
-            'SANDUSDT', 'MANAUSDT', 'GRTUSDT', 'ENJUSDT', 'CHZUSDT', 'SNXUSDT', '1INCHUSDT',
-            'CRVUSDT', 'BATUSDT', 'ZENUSDT', 'ZRXUSDT', 'OMGUSDT', 'SUSHIUSDT', 'COMPUSDT',
-            'YFIUSDT', 'ALPHAUSDT', 'SKLUSDT', 'STORJUSDT', 'AUDIOUSDT', 'CTKUSDT',
-            'AKROUSDT', 'CTSIUSDT', 'DATAUSDT', 'HBARUSDT', 'OCEANUSDT', 'BNTUSDT'
-        ])
-    }
-    
-    return symbols_by_exchange
+    return SYMBOLS_BY_EXCHANGE
 
 def generate_trading_pairs(market_caps):
     """
     生成所有可能的交易對套利組合
     """
     symbols_by_exchange = get_unique_symbols_by_exchange()
-    all_exchanges = list(symbols_by_exchange.keys())
-    
-    pair_data = []
+    # 交易所順序決定 Exchange_A / Exchange_B（排在前面的為 A）
+    exchanges = list(symbols_by_exchange)
     
     log_message("=" * 50)
     log_message("開始生成交易對套利組合...")
     
-    # 計算所有可能的兩兩交易所組合
-    for i in range(len(all_exchanges)):
-        for j in range(i + 1, len(all_exchanges)):
-            exchange_a = all_exchanges[i]
-            exchange_b = all_exchanges[j]
-            
-            # 找到兩個交易所共同支持的 symbols
-            common_symbols = symbols_by_exchange[exchange_a] & symbols_by_exchange[exchange_b]
-            
-            log_message(f"交易所組合: {exchange_a.upper()} ↔ {exchange_b.upper()}")
-            log_message(f"  共同支持的交易對: {len(common_symbols)} 個")
-            
-            for symbol in common_symbols:
-                # 從交易對中提取基礎幣種 (如從 BTCUSDT 提取 BTC)
-                base_symbol = extract_base_symbol(symbol)
-                market_cap = market_caps.get(base_symbol, 0)
-                
-            pair_data.append({
-                    'Symbol': symbol,
-                    'Exchange_A': exchange_a,
-                    'Exchange_B': exchange_b,
-                    'Market_Cap': market_cap
-                })
-                
-                # 如果有市值資料，顯示一些範例
-                if market_cap > 0:
-                    log_message(f"    {symbol} ({base_symbol}): ${market_cap:,.0f}")
+    # 倒排 symbol -> 支持它的交易所（按交易所順序），每個 (交易所, symbol) 只訪問一次
+    exchanges_by_symbol = defaultdict(list)
+    for exchange in exchanges:
+        for symbol in symbols_by_exchange[exchange]:
+            exchanges_by_symbol[symbol].append(exchange)
+    
+    # 每個 symbol 直接展開其交易所的兩兩組合，不需對每個交易所組合做集合交集
+    pairs_by_combination = {combination: [] for combination in combinations(exchanges, 2)}
+    for symbol, symbol_exchanges in exchanges_by_symbol.items():
+        if len(symbol_exchanges) < 2:
+            continue
+        # 從交易對中提取基礎幣種 (如從 BTCUSDT 提取 BTC)，並對應市值
+        base_symbol = BASE_SYMBOL_BY_PAIR[symbol]
+        market_cap = market_caps.get(base_symbol, 0)
+        for combination in combinations(symbol_exchanges, 2):
+            pairs_by_combination[combination].append((symbol, base_symbol, market_cap))
+    
+    pair_data = []
+    for (exchange_a, exchange_b), pairs in pairs_by_combination.items():
+        if not pairs:
+            continue
+        log_message(f"交易所組合: {exchange_a.upper()} ↔ {exchange_b.upper()}")
+        log_message(f"  共同支持的交易對: {len(pairs)} 個")
+        
+        # 只輸出一行市值摘要（有市值的數量 + 市值最高者），不逐筆打印
+        with_cap = [pair for pair in pairs if pair[2] > 0]
+        if with_cap:
+            top_symbol, top_base_symbol, top_market_cap = max(with_cap, key=itemgetter(2))
+            log_message(f"  有市值資料: {len(with_cap)} 個，最高: {top_symbol} ({top_base_symbol}) ${top_market_cap:,.0f}")
+        
+        pair_data.extend(
+            {'Symbol': symbol, 'Exchange_A': exchange_a, 'Exchange_B': exchange_b, 'Market_Cap': market_cap}
+            for symbol, _, market_cap in pairs
+        )
     
     log_message("=" * 50)
     log_message(f"✅ 生成完成，總共 {len(pair_data)} 個套利組合")
@@ -169,14 +231,16 @@ def save_to_database(data):
         log_message("❌ 沒有數據可保存")
         return
 
-    df = pd.DataFrame(data)
-    
-    # 依市值排序（高 → 低），相同市值再按 Symbol 排序
-    df = df.sort_values(['Market_Cap', 'Symbol'], ascending=[False, True])
+    # 直接轉為元組列表，單一事務 executemany 寫入；市值為 0（無市值資料）時寫入 NULL
+    # 不在寫入前排序：讀取時由 get_trading_pairs 的 ORDER BY market_cap DESC, symbol 排序
+    rows = [
+        (pair['Symbol'], pair['Exchange_A'], pair['Exchange_B'], pair['Market_Cap'] or None, None)
+        for pair in data
+    ]
     
     # 保存到數據庫
     db = DatabaseManager()
-    inserted_count = db.insert_trading_pairs(df)
+    inserted_count = db.insert_trading_pairs_rows(rows)
     
     log_message(f"✅ 已保存交易對數據到數據庫，共 {inserted_count} 筆套利組合")
 
@@ -198,4 +262,8 @@ def main():
     save_to_database(pair_data)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    log_listener = start_log_listener()
+    try:
+        main()
+    finally:
+        log_listener.stop()
\ No newline at end of file
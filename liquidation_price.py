@@ -1,3 +1,25 @@
+import sys
+import argparse
+import numpy as np
+
+
+def calculate_liquidation_batch(long_entries, short_entries, leverages):
+    """
+    向量化計算多組爆倉價（numpy 廣播，任一參數可為單個數值）
+
+    Returns:
+        tuple: (做多進場價, 做空進場價, 槓桿倍數, 做多爆倉價, 做空爆倉價)，均為等長 numpy 數組
+    """
+    long_entries, short_entries, leverages = np.broadcast_arrays(
+        np.asarray(long_entries, dtype=float),
+        np.asarray(short_entries, dtype=float),
+        np.asarray(leverages, dtype=float),
+    )
+    long_liquidations = long_entries * (1 - 1 / leverages)
+    short_liquidations = short_entries * (1 + 1 / leverages)
+    return long_entries, short_entries, leverages, long_liquidations, short_liquidations
+
+
 def calculate_liquidation_prices():
     """
     計算做多和做空的爆倉價格
@@ -48,56 +70,127 @@ def calculate_liquidation_prices():
         print(f"發生錯誤: {e}")
 
 
-def batch_calculate():
+def read_batch_input():
     """
-    批量計算多組數據
-    """
-    print("=== 批量計算模式 ===")
-    print("輸入格式: 做多進場價,做空進場價,槓桿")
-    print("輸入 'quit' 結束")
-    print()
+    讀取多行互動輸入（格式: 做多進場價,做空進場價,槓桿），輸入 quit 或 EOF 結束
 
+    Returns:
+        np.ndarray: 形狀為 (N, 3) 的數組
+    """
+    rows = []
     while True:
-        user_input = input("請輸入數據 (或輸入 quit 結束): ").strip()
+        try:
+            user_input = input("請輸入數據 (或輸入 quit 結束): ").strip()
+        except EOFError:
+            break
 
         if user_input.lower() == 'quit':
             break
+        if not user_input:
+            continue
 
-        try:
-            values = user_input.split(',')
-            if len(values) != 3:
-                print("錯誤：請輸入三個數值，用逗號分隔")
-                continue
+        values = user_input.split(',')
+        if len(values) != 3:
+            print("錯誤：請輸入三個數值，用逗號分隔")
+            continue
 
-            long_entry = float(values[0].strip())
-            short_entry = float(values[1].strip())
-            leverage = float(values[2].strip())
+        try:
+            rows.append([float(value.strip()) for value in values])
+        except ValueError as e:
+            print(f"輸入錯誤: {e}")
 
-            # 計算爆倉價
-            long_liquidation = long_entry * (1 - 1 / leverage)
-            short_liquidation = short_entry * (1 + 1 / leverage)
+    return np.array(rows, dtype=float).reshape(-1, 3)
 
-            print(f"做多: {long_entry} → 爆倉價 {long_liquidation:.4f}")
-            print(f"做空: {short_entry} → 爆倉價 {short_liquidation:.4f}")
-            print("-" * 40)
 
-        except (ValueError, ZeroDivisionError) as e:
-            print(f"輸入錯誤: {e}")
-        except Exception as e:
-            print(f"發生錯誤: {e}")
+def batch_calculate(csv_path=None):
+    """
+    批量計算多組數據：先讀入全部輸入（CSV 檔案或多行貼上），再一次向量化計算並輸出
 
+    Args:
+        csv_path: CSV 檔案路徑（每行 做多進場價,做空進場價,槓桿），為 None 時從互動輸入讀取
+    """
+    print("=== 批量計算模式 ===")
+    if csv_path:
+        try:
+            data = np.loadtxt(csv_path, delimiter=',', ndmin=2)
+        except (OSError, ValueError) as e:
+            print(f"讀取 CSV 失敗: {e}")
+            return
+    else:
+        print("輸入格式: 做多進場價,做空進場價,槓桿（可一次貼上多行）")
+        print("輸入 'quit' 結束")
+        print()
+        data = read_batch_input()
+
+    if data.size == 0:
+        print("沒有可計算的數據")
+        return
+    if data.shape[1] != 3:
+        print("錯誤：每行需要三個數值，用逗號分隔")
+        return
+
+    # 槓桿為 0 的行無法計算，跳過
+    zero_leverage = data[:, 2] == 0
+    if zero_leverage.any():
+        print(f"錯誤：{int(zero_leverage.sum())} 組數據的槓桿倍數為 0，已跳過")
+        data = data[~zero_leverage]
+
+    results = calculate_liquidation_batch(data[:, 0], data[:, 1], data[:, 2])
+    np.savetxt(sys.stdout, np.column_stack(results), fmt='%.4f', delimiter=',',
+               header='做多進場價,做空進場價,槓桿,做多爆倉價,做空爆倉價', comments='')
+
+
+def parse_args():
+    """解析命令行參數；未提供時回退到互動式選單"""
+    parser = argparse.ArgumentParser(description='爆倉價計算器')
+    parser.add_argument('--long-entry', type=float, nargs='+', help='一個或多個做多進場價')
+    parser.add_argument('--short-entry', type=float, nargs='+', help='一個或多個做空進場價')
+    parser.add_argument('--leverage', type=float, nargs='+', help='一個或多個槓桿倍數（單個數值時套用到所有組）')
+    parser.add_argument('--csv', help='批量計算的 CSV 檔案（每行 做多進場價,做空進場價,槓桿）')
+    args = parser.parse_args()
+
+    provided = [args.long_entry, args.short_entry, args.leverage]
+    if any(provided) and not all(provided):
+        parser.error('--long-entry、--short-entry 與 --leverage 需同時提供')
+    if args.long_entry:
+        if min(args.long_entry + args.short_entry) <= 0:
+            parser.error('進場價必須大於 0')
+        if min(args.leverage) <= 0:
+            parser.error('槓桿倍數必須大於 0')
+    return parser, args
+
+
+def run_cli(parser, args):
+    """非互動模式：一次計算命令行傳入的所有組合"""
+    try:
+        results = calculate_liquidation_batch(args.long_entry, args.short_entry, args.leverage)
+    except ValueError:
+        parser.error('參數數量不一致：各參數需數量相同，或只提供單個數值')
 
-if __name__ == "__main__":
-    print("請選擇模式:")
-    print("1. 單次計算")
-    print("2. 批量計算")
+    for long_entry, short_entry, leverage, long_liquidation, short_liquidation in zip(*(r.tolist() for r in results)):
+        print(f"槓桿 {leverage}x")
+        print(f"做多: {long_entry} → 爆倉價 {long_liquidation:.4f}")
+        print(f"做空: {short_entry} → 爆倉價 {short_liquidation:.4f}")
+        print("-" * 40)
 
-    choice = input("請輸入選擇 (1 或 2): ").strip()
 
-    if choice == "1":
-        calculate_liquidation_prices()
-    elif choice == "2":
-        batch_calculate()
+if __name__ == "__main__":
+    parser, args = parse_args()
+    if args.csv:
+        batch_calculate(args.csv)
+    elif args.long_entry:
+        run_cli(parser, args)
     else:
-        print("無效選擇，使用單次計算模式")
-        calculate_liquidation_prices()
\ No newline at end of file
+        print("請選擇模式:")
+        print("1. 單次計算")
+        print("2. 批量計算")
+
+        choice = input("請輸入選擇 (1 或 2): ").strip()
+
+        if choice == "1":
+            calculate_liquidation_prices()
+        elif choice == "2":
+            batch_calculate()
+        else:
+            print("無效選擇，使用單次計算模式")
+            calculate_liquidation_prices()
\ No newline at end of file
@@ -1,72 +1,177 @@
 import sqlite3
 import os
+import json
+import hashlib
 from pycoingecko import CoinGeckoAPI
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import math # 導入 math 模塊
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import RateLimiter
+
+# 嘗試導入 orjson（Rust 實現，解析與序列化更快），如果沒有則使用標準庫 json
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    def json_dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+# 嘗試導入 httpx 及 HTTP/2 支持 (h2)，如果沒有則使用 requests（HTTP/1.1 keep-alive 連線池）
+try:
+    import httpx
+    import h2  # noqa: F401  httpx 的 http2=True 需要此套件
+except ImportError:
+    httpx = None
 
 DB_PATH = "data/funding_rate.db"
 
+# 本地快取：CoinGecko 每頁的原始響應，TTL 內重跑時直接讀取檔案，不再請求 API
+CACHE_DIR = ".coingecko_cache"
+# 快取有效秒數，可用環境變量 COINGECKO_CACHE_TTL 覆蓋；設為 0 則停用快取
+CACHE_TTL = int(os.environ.get("COINGECKO_CACHE_TTL", 3600))
+
+COINGECKO_MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+# 同時請求的頁數
+MAX_WORKERS = 4
+# CoinGecko 免費方案限額 30 次 / 分鐘 -> 平均每 2 秒一個請求
+COINGECKO_RATE_LIMITER = RateLimiter(60 / 30, burst=MAX_WORKERS)
+# 共用 HTTP 客戶端：
+# - 有 httpx[http2] 時，所有頁請求以 HTTP/2 多路復用在同一條 TCP/TLS 連線上
+# - 否則使用 requests Session，各頁請求復用同一組 keep-alive 連線，只需一次 TLS 握手
+# REQUEST_ERRORS 含 ValueError：json_loads 解析非 JSON 回應（例如 HTML 錯誤頁）失敗時，與請求錯誤同樣處理
+if httpx is not None:
+    SESSION = httpx.Client(
+        http2=True,
+        headers={'Accept': 'application/json'},
+        limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+    )
+    REQUEST_ERRORS = (httpx.HTTPError, requests.exceptions.RequestException, ValueError)
+else:
+    SESSION = requests.Session()
+    SESSION.headers.update({'Accept': 'application/json'})
+    SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+    REQUEST_ERRORS = (requests.exceptions.RequestException, ValueError)
+# 單次請求超時秒數
+REQUEST_TIMEOUT = 10
+# 遇到 429 時的最大重試次數（每次等待 2^attempt 秒，或遵守 Retry-After）
+MAX_RETRIES = 3
+
 def get_connection():
     """獲取數據庫連接"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
     return conn
 
+def get_cache_path(url, params):
+    """依 (url, params) 產生快取檔案路徑"""
+    key = url + "|" + json.dumps(params, sort_keys=True)
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+def load_cached_page(cache_path):
+    """讀取未過期的快取頁面，沒有或已過期時返回 None"""
+    if CACHE_TTL <= 0 or not os.path.exists(cache_path):
+        return None
+    if time.time() - os.path.getmtime(cache_path) >= CACHE_TTL:
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            return json_loads(f.read())
+    except Exception as e:
+        print(f"⚠️ 讀取快取失敗，改為重新請求: {e}")
+        return None
+
+def save_cached_page(cache_path, data):
+    """原子寫入快取頁面（先寫臨時檔再替換）"""
+    if CACHE_TTL <= 0:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_dumps(data))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"⚠️ 寫入快取失敗: {e}")
+
+def fetch_page(page, per_page):
+    """
+    獲取單頁市值數據（優先使用本地快取），遇到 429 時按指數退避重試。
+    請求失敗時拋出 REQUEST_ERRORS 中的異常。
+    """
+    params = {
+        'vs_currency': 'usd',
+        'order': 'market_cap_desc',
+        'per_page': per_page,
+        'page': page,
+        'sparkline': 'false'
+    }
+
+    cache_path = get_cache_path(COINGECKO_MARKETS_URL, params)
+    data = load_cached_page(cache_path)
+    if data is not None:
+        print(f"💾 第 {page} 頁使用本地快取: {cache_path}")
+        return data
+
+    for attempt in range(MAX_RETRIES + 1):
+        COINGECKO_RATE_LIMITER.wait()
+        print(f"正在請求第 {page} 頁，獲取 {per_page} 筆數據...")
+        response = SESSION.get(COINGECKO_MARKETS_URL, params=params, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 429 and attempt < MAX_RETRIES:
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            print(f"🟡 第 {page} 頁觸發限速 (429)，{delay:g} 秒後重試 ({attempt + 1}/{MAX_RETRIES})...")
+            time.sleep(delay)
+            continue
+        response.raise_for_status()  # 如果請求失敗則拋出異常
+        data = json_loads(response.content)
+        if data:
+            save_cached_page(cache_path, data)
+        return data
+
 def fetch_top_n_coins(n=200):
     """
     從 CoinGecko API 獲取市值排名前 N 的幣種數據，支持分頁。
+    各頁以執行緒池並行請求（受 COINGECKO_RATE_LIMITER 限速），再按頁碼順序合併。
     """
     print(f"正在從 CoinGecko API 獲取市值排名前 {n} 的幣種數據...")
-    all_coins = []
-    per_page = 250  # CoinGecko API 每頁最多 250 筆
+    # 所有頁使用相同的 per_page，分頁偏移才正確（CoinGecko 每頁最多 250 筆），多取的部分最後截掉
+    per_page = min(250, n)
     total_pages = math.ceil(n / per_page)
-    
-    for page in range(1, total_pages + 1):
-        remaining = n - len(all_coins)
-        current_per_page = min(per_page, remaining)
-        
-        if current_per_page <= 0:
-            break
 
-        url = "https://api.coingecko.com/api/v3/coins/markets"
-        params = {
-            'vs_currency': 'usd',
-            'order': 'market_cap_desc',
-            'per_page': current_per_page,
-            'page': page,
-            'sparkline': False
-        }
-        
-        try:
-            # 添加延遲以避免被 API 限制
-            if page > 1:
-                time.sleep(1) # 短暫延遲
-            
-            print(f"正在請求第 {page}/{total_pages} 頁，獲取 {current_per_page} 筆數據...")
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # 如果請求失敗則拋出異常
-            data = response.json()
-
-            if not data:
-                print(f"✅ 第 {page} 頁無數據，查詢結束。")
-                break
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            pages = list(executor.map(lambda page: fetch_page(page, per_page), range(1, total_pages + 1)))
+    except REQUEST_ERRORS as e:
+        print(f"❌ API 請求失敗: {e}")
+        return None # 返回 None 表示失敗
 
-            all_coins.extend(data)
-            print(f"✅ 成功獲取 {len(data)} 筆數據。目前總數: {len(all_coins)}")
+    all_coins = []
+    for page, data in enumerate(pages, start=1):
+        if not data:
+            print(f"✅ 第 {page} 頁無數據，查詢結束。")
+            break
+        all_coins.extend(data)
+        print(f"✅ 第 {page}/{total_pages} 頁成功獲取 {len(data)} 筆數據。目前總數: {len(all_coins)}")
 
-        except requests.exceptions.RequestException as e:
-            print(f"❌ API 請求失敗: {e}")
-            return None # 返回 None 表示失敗
-    
     return all_coins[:n] # 確保最終返回的數量不超過 N
 
-def clear_market_cap_data(conn):
-    """清空所有現有交易對的市值相關數據"""
-    print("正在清空舊的市值排名數據...")
+def clear_market_cap_data(conn, coins_data):
+    """
+    清空不在本次 API 結果中的交易對的市值相關數據
+    （本次結果內的 symbol 隨後由 upsert_coins_data 覆蓋，無需先清空；已為空的記錄也不再重寫）
+    """
+    print("正在清空已跌出排名的市值數據...")
+    incoming = sorted({coin.get('symbol', '').upper() for coin in coins_data})
     cursor = conn.cursor()
     try:
+        # symbol 集合以單個 JSON 參數傳入，不受 SQLite 綁定參數數量上限限制
         cursor.execute("""
             UPDATE trading_pair 
             SET 
@@ -74,62 +179,58 @@ def clear_market_cap_data(conn):
                 market_cap_rank = NULL,
                 total_volume = NULL,
                 updated_at = ?
-        """, (datetime.now().isoformat(),))
+            WHERE symbol NOT IN (SELECT value FROM json_each(?))
+                AND (market_cap IS NOT NULL OR market_cap_rank IS NOT NULL OR total_volume IS NOT NULL)
+        """, (datetime.now().isoformat(), json.dumps(incoming)))
         print(f"✅ {cursor.rowcount} 筆記錄的市值數據已被清空。")
         conn.commit()
     except sqlite3.Error as e:
         print(f"❌ 清空市值數據時發生資料庫錯誤: {e}")
         conn.rollback()
 
-def upsert_coin_data(conn, coin):
-    """更新或插入新的幣種數據 (Upsert)"""
-    cursor = conn.cursor()
-    symbol = coin.get('symbol', '').upper()
-    trading_pair = f"{symbol}USDT"
+def upsert_coins_data(conn, coins_data):
+    """
+    批量更新或插入幣種數據 (Upsert)，在單一事務中完成。
+    返回成功處理的筆數（失敗時整批回滾，返回 0）。
+    """
     now = datetime.now().isoformat()
+    rows = []
+    for coin in coins_data:
+        symbol = coin.get('symbol', '').upper()
+        rows.append((
+            symbol,
+            f"{symbol}USDT",
+            coin.get('market_cap'),
+            coin.get('market_cap_rank'),
+            coin.get('total_volume'),
+            now
+        ))
 
     try:
-        # 查找現有記錄
-        cursor.execute("SELECT id FROM trading_pair WHERE symbol = ?", (symbol,))
-        existing_record = cursor.fetchone()
-
-        if existing_record:
-            # 更新現有記錄
-            cursor.execute("""
-                UPDATE trading_pair
-                SET 
-                    market_cap = ?,
-                    market_cap_rank = ?,
-                    total_volume = ?,
-                    updated_at = ?
-                WHERE id = ?
-            """, (
-                coin.get('market_cap'),
-                coin.get('market_cap_rank'),
-                coin.get('total_volume'),
-                now,
-                existing_record['id']
-            ))
-        else:
-            # 插入新記錄
-            cursor.execute("""
+        with conn:
+            # 插入資料庫中尚不存在的 symbol
+            conn.executemany("""
                 INSERT INTO trading_pair (
                     symbol, trading_pair, market_cap, market_cap_rank, total_volume, 
                     created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                symbol,
-                trading_pair,
-                coin.get('market_cap'),
-                coin.get('market_cap_rank'),
-                coin.get('total_volume'),
-                now,
-                now
-            ))
-        return True
+                )
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?6
+                WHERE NOT EXISTS (SELECT 1 FROM trading_pair WHERE symbol = ?1)
+            """, rows)
+            # 更新所有 symbol 的市值數據（同一 symbol 出現多次時以後者為準）
+            conn.executemany("""
+                UPDATE trading_pair
+                SET 
+                    market_cap = ?3,
+                    market_cap_rank = ?4,
+                    total_volume = ?5,
+                    updated_at = ?6
+                WHERE symbol = ?1
+            """, rows)
+        return len(rows)
     except sqlite3.Error as e:
-        print(f"❌ 更新/插入 Symbol: {symbol} 時發生資料庫錯誤: {e}")
-        return False
+        print(f"❌ 批量更新/插入幣種數據時發生資料庫錯誤: {e}")
+        return 0
 
 def main():
     """主執行程序"""
@@ -157,21 +258,15 @@ def main():
     # 連接資料庫
     conn = get_connection()
     
-    # 清空舊排名
-    clear_market_cap_data(conn)
+    # 清空已跌出排名的舊數據
+    clear_market_cap_data(conn, coins_data)
     
     # 更新/插入新數據
-    success_count = 0
-    failure_count = 0
     print(f"開始處理 {len(coins_data)} 筆幣種數據...")
-    for coin in coins_data:
-        if upsert_coin_data(conn, coin):
-            success_count += 1
-        else:
-            failure_count += 1
+    success_count = upsert_coins_data(conn, coins_data)
+    failure_count = len(coins_data) - success_count
     
-    # 提交事務並關閉連線
-    conn.commit()
+    # 關閉連線
     conn.close()
     
     print("\n----- 更新完成 -----")
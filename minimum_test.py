@@ -12,18 +12,45 @@
 5. calculate_FR_return_list
 6. strategy_ranking (全部策略)
 7. backtest_v2 (全部策略, 2025-06-01 到 2025-06-05)
+
+默認在同一進程內 import 各腳本並調用其 main()，省去每步的解釋器啟動開銷；
+加上 --subprocess 參數則改為每步啟動獨立的 python3 子進程（隔離性更好）
+各步驟輸出寫入 logs/minimum_test/<模組名>.log
+注意：步驟超時（timeout）只在 --subprocess 模式下生效，進程內模式無法中斷卡住的步驟
 """
 
 import os
 import sys
+import io
+import importlib
+import logging
+import traceback
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import redirect_stdout, redirect_stderr
 from datetime import datetime
 import tempfile
-import shutil
+
+# 各步驟輸出的日誌目錄（每步一個 <module>.log）
+STEP_LOG_DIR = "logs/minimum_test"
+# 步驟失敗時從日誌檔末尾讀取的字節數，作為錯誤信息
+LOG_TAIL_BYTES = 4096
+
+# 各步驟的前置依賴（步驟 -> 必須先完成的步驟），依賴全部完成後才開始執行
+# 目前流程為單一鏈條；將來加入互不依賴的分支（例如按交易所拆分抓取）時，子進程模式下會並行執行
+STEP_DEPENDENCIES = {
+    'coingecko_market_cap': [],
+    'get_symbol_pair_v2': ['coingecko_market_cap'],
+    'fetch_FR_history_group_v1': ['get_symbol_pair_v2'],
+    'calculate_FR_diff_v1': ['fetch_FR_history_group_v1'],
+    'calculate_FR_return_list': ['calculate_FR_diff_v1'],
+    'strategy_ranking': ['calculate_FR_return_list'],
+    'backtest_v2': ['strategy_ranking'],
+}
 
 class MinimumTestRunner:
-    def __init__(self):
+    def __init__(self, use_subprocess=False):
         self.start_time = datetime.now()
         self.test_dates = {
             'start_date': '2024-01-01',
@@ -32,6 +59,8 @@ class MinimumTestRunner:
         self.results = []
         self.current_step = 0
         self.total_steps = 7
+        # True: 每步啟動子進程執行；False: 在同一進程內調用模組的 main()
+        self.use_subprocess = use_subprocess
         
     def print_header(self):
         """打印測試工具標題"""
@@ -41,6 +70,7 @@ class MinimumTestRunner:
         print(f"📅 測試日期範圍: {self.test_dates['start_date']} ~ {self.test_dates['end_date']}")
         print(f"🕐 開始時間: {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"📊 總步驟數: {self.total_steps}")
+        print(f"⚙️  執行模式: {'子進程' if self.use_subprocess else '進程內調用'}")
         print("=" * 80)
         print()
         
@@ -52,105 +82,127 @@ class MinimumTestRunner:
         print(f"   ⏰ {datetime.now().strftime('%H:%M:%S')}")
         print("-" * 60)
         
-    def run_command_with_input(self, command, input_text=None, timeout=300):
-        """執行命令並可選擇提供輸入"""
+    def run_command_with_input(self, command, log_path, input_text=None, timeout=300, env=None):
+        """
+        執行命令並可選擇提供輸入（env 為子進程的環境變量，默認繼承當前環境）
+        子進程的 stdout / stderr 直接寫入日誌檔，不在記憶體中緩存
+        :param command: 命令參數列表，例如 [sys.executable, 'xxx.py']，不經過 shell 直接執行
+        :param log_path: 子進程輸出的日誌檔路徑
+        :return: (return_code, '', 錯誤信息)；失敗時錯誤信息為日誌檔末尾內容
+        """
         try:
-            if input_text:
-                # 使用 Popen 來處理需要輸入的命令
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            with open(log_path, 'wb') as log_file:
                 process = subprocess.Popen(
                     command,
-                    shell=True,
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
+                    shell=False,
+                    stdin=subprocess.PIPE if input_text else None,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
                     text=True,
-                    cwd=os.getcwd()
+                    cwd=os.getcwd(),
+                    env=env
                 )
-                stdout, stderr = process.communicate(input=input_text, timeout=timeout)
-                return_code = process.returncode
-            else:
-                # 簡單命令執行
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout,
-                    cwd=os.getcwd()
-                )
-                stdout = result.stdout
-                stderr = result.stderr
-                return_code = result.returncode
+                try:
+                    process.communicate(input=input_text, timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                    return -1, '', f'命令執行超時 ({timeout}秒)，輸出見 {log_path}'
             
-            return return_code, stdout, stderr
+            if process.returncode != 0:
+                return process.returncode, '', f'輸出見 {log_path}\n{self.read_log_tail(log_path)}'
+            return process.returncode, '', ''
             
-        except subprocess.TimeoutExpired:
-            return -1, '', f'命令執行超時 ({timeout}秒)'
         except Exception as e:
             return -1, '', f'執行錯誤: {str(e)}'
     
-    def modify_file_dates(self, filename, start_date_var, end_date_var, start_date, end_date):
-        """修改文件中的日期參數"""
-        if not os.path.exists(filename):
-            print(f"❌ 文件不存在: {filename}")
-            return False
-            
-        try:
-            # 備份原文件
-            backup_file = f"{filename}.backup"
-            shutil.copy2(filename, backup_file)
-            
-            # 讀取文件內容
-            with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 替換日期參數
-            original_content = content
-            if start_date_var in content:
-                # 尋找並替換 DEFAULT_START_DATE 或 START_DATE
-                import re
-                pattern = rf'{start_date_var}\s*=\s*"[^"]*"'
-                replacement = f'{start_date_var} = "{start_date}"'
-                content = re.sub(pattern, replacement, content)
-            
-            if end_date_var in content:
-                # 尋找並替換 DEFAULT_END_DATE 或 END_DATE
-                import re
-                pattern = rf'{end_date_var}\s*=\s*"[^"]*"'
-                replacement = f'{end_date_var} = "{end_date}"'
-                content = re.sub(pattern, replacement, content)
-            
-            # 如果有修改，寫入文件
-            if content != original_content:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                print(f"✅ 已修改 {filename} 的日期參數")
-                return True
-            else:
-                print(f"⚠️  {filename} 中未找到需要修改的日期參數")
-                return True
-                
-        except Exception as e:
-            print(f"❌ 修改文件失敗: {e}")
-            # 恢復備份
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, filename)
-            return False
+    def read_log_tail(self, log_path, size=LOG_TAIL_BYTES):
+        """讀取日誌檔最後 size 個字節（只 seek 到末尾讀取，不載入整個檔案）"""
+        with open(log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - size))
+            return f.read().decode('utf-8', errors='replace')
     
-    def restore_file(self, filename):
-        """恢復文件的原始版本"""
-        backup_file = f"{filename}.backup"
-        if os.path.exists(backup_file):
-            shutil.copy2(backup_file, filename)
-            os.remove(backup_file)
-            print(f"✅ 已恢復 {filename} 的原始內容")
+    def run_module_in_process(self, module_name, argv=None, input_text=None, kwargs=None):
+        """
+        在當前進程內 import 模組並調用其 main()，返回 (return_code, '', 錯誤信息)
+        模組的 stdout / stderr / logging 輸出直接寫入 STEP_LOG_DIR/<module>.log，不在記憶體中緩存；
+        失敗時錯誤信息為日誌檔末尾內容
+        注意：進程內調用無法強制中斷，timeout 只在 --subprocess 模式下生效
+        :param argv: 傳給模組 argparse 的命令行參數列表
+        :param input_text: 模擬的標準輸入內容（供 input() 讀取）
+        :param kwargs: 直接傳給 main() 的關鍵字參數
+        """
+        log_path = os.path.join(STEP_LOG_DIR, f"{module_name}.log")
+        os.makedirs(STEP_LOG_DIR, exist_ok=True)
+        root_logger = logging.getLogger()
+        original_level = root_logger.level
+        original_argv = sys.argv
+        original_stdin = sys.stdin
+
+        with open(log_path, 'w', encoding='utf-8', buffering=1) as log_file:
+            # 模組使用 logging 輸出時，也一併寫入日誌檔
+            log_handler = logging.StreamHandler(log_file)
+            log_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+            sys.argv = [f"{module_name}.py"] + list(argv or [])
+            sys.stdin = io.StringIO(input_text or '')
+            root_logger.addHandler(log_handler)
+            root_logger.setLevel(logging.INFO)
+            try:
+                with redirect_stdout(log_file), redirect_stderr(log_file):
+                    module = importlib.import_module(module_name)
+                    module.main(**(kwargs or {}))
+                return_code = 0
+            except SystemExit as e:
+                # argparse 或腳本內的 exit()/sys.exit()
+                if e.code is None or isinstance(e.code, int):
+                    return_code = e.code or 0
+                else:
+                    log_file.write(f'{e.code}\n')
+                    return_code = 1
+            except Exception:
+                log_file.write(f'執行錯誤: {traceback.format_exc()}')
+                return_code = 1
+            finally:
+                sys.argv = original_argv
+                sys.stdin = original_stdin
+                root_logger.removeHandler(log_handler)
+                root_logger.setLevel(original_level)
+
+        if return_code != 0:
+            return return_code, '', f'輸出見 {log_path}\n{self.read_log_tail(log_path)}'
+        return return_code, '', ''
+
+    def run_step(self, module_name, input_text=None, timeout=300, argv=None, kwargs=None, env=None):
+        """
+        依執行模式運行單一步驟
+        - 進程內模式：argv / kwargs 直接傳給模組（timeout、env 不適用，卡住的步驟不會被中斷）
+        - 子進程模式：以當前解釋器 (sys.executable) 執行 <module>.py 並傳入 argv 與環境變量 env，
+          超過 timeout 秒即終止子進程
+        兩種模式的輸出都寫入 STEP_LOG_DIR/<module>.log
+        """
+        if not self.use_subprocess:
+            return self.run_module_in_process(module_name, argv=argv, input_text=input_text, kwargs=kwargs)
+
+        command = [sys.executable, f"{module_name}.py"] + list(argv or [])
+        log_path = os.path.join(STEP_LOG_DIR, f"{module_name}.log")
+        return self.run_command_with_input(command, log_path, input_text=input_text, timeout=timeout, env=env)
+
+    def get_date_env(self):
+        """子進程使用的環境變量：以 DEFAULT_START_DATE / DEFAULT_END_DATE 傳入測試日期"""
+        return {
+            **os.environ,
+            'DEFAULT_START_DATE': self.test_dates['start_date'],
+            'DEFAULT_END_DATE': self.test_dates['end_date']
+        }
     
     def step1_coingecko_market_cap(self):
         """步驟1: 執行 coingecko_market_cap，輸入3"""
         self.print_step("coingecko_market_cap", "獲取前3名市值的加密貨幣")
         
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 coingecko_market_cap.py",
+        return_code, stdout, stderr = self.run_step(
+            "coingecko_market_cap",
             input_text="3\n",
             timeout=120
         )
@@ -175,8 +227,8 @@ class MinimumTestRunner:
         """步驟2: 執行 get_symbol_pair_v2"""
         self.print_step("get_symbol_pair_v2", "生成交易對列表")
         
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 get_symbol_pair_v2.py",
+        return_code, stdout, stderr = self.run_step(
+            "get_symbol_pair_v2",
             timeout=60
         )
         
@@ -200,27 +252,15 @@ class MinimumTestRunner:
         """步驟3: 執行 fetch_FR_history_group_v1"""
         self.print_step("fetch_FR_history_group_v1", f"獲取資金費率歷史數據 ({self.test_dates['start_date']} ~ {self.test_dates['end_date']})")
         
-        # 修改日期參數
-        file_modified = self.modify_file_dates(
-            'fetch_FR_history_group_v1.py',
-            'DEFAULT_START_DATE',
-            'DEFAULT_END_DATE',
-            self.test_dates['start_date'],
-            self.test_dates['end_date']
-        )
-        
-        if not file_modified:
-            self.results.append({
-                'step': 'fetch_FR_history_group_v1',
-                'success': False,
-                'output': '',
-                'error': '無法修改日期參數'
-            })
-            return False
-        
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 fetch_FR_history_group_v1.py",
-            timeout=300
+        # 進程內模式以命令行參數傳入日期，子進程模式以環境變量傳入
+        return_code, stdout, stderr = self.run_step(
+            "fetch_FR_history_group_v1",
+            timeout=300,
+            argv=None if self.use_subprocess else [
+                '--start_date', self.test_dates['start_date'],
+                '--end_date', self.test_dates['end_date']
+            ],
+            env=self.get_date_env()
         )
         
         success = return_code == 0
@@ -236,9 +276,6 @@ class MinimumTestRunner:
         else:
             print(f"❌ fetch_FR_history_group_v1 執行失敗: {stderr}")
         
-        # 恢復原始文件
-        self.restore_file('fetch_FR_history_group_v1.py')
-        
         print()
         return success
     
@@ -246,8 +283,8 @@ class MinimumTestRunner:
         """步驟4: 執行 calculate_FR_diff_v1"""
         self.print_step("calculate_FR_diff_v1", "計算交易所間資金費率差異")
         
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 calculate_FR_diff_v1.py",
+        return_code, stdout, stderr = self.run_step(
+            "calculate_FR_diff_v1",
             timeout=120
         )
         
@@ -271,8 +308,8 @@ class MinimumTestRunner:
         """步驟5: 執行 calculate_FR_return_list"""
         self.print_step("calculate_FR_return_list", "計算各時間週期收益率")
         
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 calculate_FR_return_list.py",
+        return_code, stdout, stderr = self.run_step(
+            "calculate_FR_return_list",
             timeout=120
         )
         
@@ -296,8 +333,8 @@ class MinimumTestRunner:
         """步驟6: 執行 strategy_ranking，輸入7"""
         self.print_step("strategy_ranking", "執行全部策略排名")
         
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 strategy_ranking.py",
+        return_code, stdout, stderr = self.run_step(
+            "strategy_ranking",
             input_text="7\n",
             timeout=180
         )
@@ -322,28 +359,16 @@ class MinimumTestRunner:
         """步驟7: 執行 backtest_v2"""
         self.print_step("backtest_v2", f"執行回測 ({self.test_dates['start_date']} ~ {self.test_dates['end_date']})")
         
-        # 修改日期參數
-        file_modified = self.modify_file_dates(
-            'backtest_v2.py',
-            'START_DATE',
-            'END_DATE',
-            self.test_dates['start_date'],
-            self.test_dates['end_date']
-        )
-        
-        if not file_modified:
-            self.results.append({
-                'step': 'backtest_v2',
-                'success': False,
-                'output': '',
-                'error': '無法修改日期參數'
-            })
-            return False
-        
-        return_code, stdout, stderr = self.run_command_with_input(
-            "python3 backtest_v2.py",
+        # 進程內模式直接把日期傳給 backtest_v2.main()，子進程模式以環境變量傳入
+        return_code, stdout, stderr = self.run_step(
+            "backtest_v2",
             input_text="7\n",
-            timeout=300
+            timeout=300,
+            kwargs=None if self.use_subprocess else {
+                'start_date': self.test_dates['start_date'],
+                'end_date': self.test_dates['end_date']
+            },
+            env=self.get_date_env()
         )
         
         success = return_code == 0
@@ -359,9 +384,6 @@ class MinimumTestRunner:
         else:
             print(f"❌ backtest_v2 執行失敗: {stderr}")
         
-        # 恢復原始文件
-        self.restore_file('backtest_v2.py')
-        
         print()
         return success
     
@@ -398,27 +420,65 @@ class MinimumTestRunner:
         
         print("=" * 80)
     
+    def run_steps(self, steps):
+        """
+        按 STEP_DEPENDENCIES 調度執行步驟：前置步驟全部完成後即提交執行
+        - 子進程模式：互不依賴的步驟在執行緒池中並行（各自等待自己的子進程）
+        - 進程內模式：各步驟共用 sys.argv / stdout，且 matplotlib、asyncio 等需在主執行緒運行，
+          因此在主執行緒按依賴順序逐個直接調用
+        :param steps: {步驟名稱: 步驟函數}，按期望的提交順序排列
+        """
+        pending = dict(steps)
+        completed = set()
+
+        if not self.use_subprocess:
+            while pending:
+                ready = [name for name in pending
+                         if all(dep in completed for dep in STEP_DEPENDENCIES.get(name, []))]
+                if not ready:
+                    raise ValueError(f"步驟依賴無法滿足: {', '.join(pending)}")
+                name = ready[0]
+                if not pending.pop(name)():
+                    print(f"⚠️  步驟失敗，但繼續執行後續步驟...")
+                    print()
+                completed.add(name)
+            return
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            while pending or running:
+                ready = [name for name in pending
+                         if all(dep in completed for dep in STEP_DEPENDENCIES.get(name, []))]
+                for name in ready:
+                    running[executor.submit(pending.pop(name))] = name
+
+                if not running:
+                    raise ValueError(f"步驟依賴無法滿足: {', '.join(pending)}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    completed.add(running.pop(future))
+                    if not future.result():
+                        print(f"⚠️  步驟失敗，但繼續執行後續步驟...")
+                        print()
+
     def run_all_tests(self):
         """執行所有測試步驟"""
         self.print_header()
         
         try:
             # 執行各個步驟
-            steps = [
-                self.step1_coingecko_market_cap,
-                self.step2_get_symbol_pair_v2,
-                self.step3_fetch_fr_history,
-                self.step4_calculate_fr_diff,
-                self.step5_calculate_fr_return,
-                self.step6_strategy_ranking,
-                self.step7_backtest_v2
-            ]
+            steps = {
+                'coingecko_market_cap': self.step1_coingecko_market_cap,
+                'get_symbol_pair_v2': self.step2_get_symbol_pair_v2,
+                'fetch_FR_history_group_v1': self.step3_fetch_fr_history,
+                'calculate_FR_diff_v1': self.step4_calculate_fr_diff,
+                'calculate_FR_return_list': self.step5_calculate_fr_return,
+                'strategy_ranking': self.step6_strategy_ranking,
+                'backtest_v2': self.step7_backtest_v2
+            }
             
-            for step_func in steps:
-                success = step_func()
-                if not success:
-                    print(f"⚠️  步驟失敗，但繼續執行後續步驟...")
-                    print()
+            self.run_steps(steps)
             
             self.print_summary()
             
@@ -427,7 +487,6 @@ class MinimumTestRunner:
             self.print_summary()
         except Exception as e:
             print(f"\n❌ 測試過程中發生未預期錯誤: {e}")
-            import traceback
             traceback.print_exc()
             self.print_summary()
 
@@ -439,7 +498,7 @@ def main():
     
     print("🚀 準備開始最小範圍測試...")
     print("📝 測試範圍: 2024-01-01 ~ 2024-01-05 (5天)")
-    print("⚠️  注意: 此測試會修改部分腳本的日期參數，執行完後會自動恢復")
+    use_subprocess = '--subprocess' in sys.argv[1:]
     print()
     
     response = input("是否開始測試? (y/N): ").strip().lower()
@@ -447,7 +506,7 @@ def main():
         print("❌ 測試已取消")
         return
     
-    runner = MinimumTestRunner()
+    runner = MinimumTestRunner(use_subprocess=use_subprocess)
     runner.run_all_tests()
 
 if __name__ == "__main__":
@@ -4,6 +4,10 @@ import shutil
 import datetime
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 不移動的系統檔案
+SYSTEM_FILES = frozenset({'.DS_Store', 'Thumbs.db', '.gitkeep'})
 
 
 def get_yesterday_date():
@@ -41,20 +45,13 @@ def should_move_file(file_name, directory_name):
     Returns:
         布林值，True表示應該移動
     """
-    # 排除系統檔案
-    system_files = ['.DS_Store', 'Thumbs.db', '.gitkeep']
-    if file_name in system_files:
-        return False
-    
-    # 排除隱藏檔案
-    if file_name.startswith('.'):
-        return False
-    
-    # 只移動CSV檔案
-    return file_name.endswith('.csv')
+    # 排除系統檔案和隱藏檔案，只移動CSV檔案
+    return (file_name not in SYSTEM_FILES
+            and not file_name.startswith('.')
+            and file_name.endswith('.csv'))
 
 
-def move_files_to_folder(base_path, target_folder, directory_name):
+def move_files_to_folder(base_path, target_folder, directory_name, log=print):
     """
     將基礎路徑中的相關檔案移動到目標資料夾中
     
@@ -62,44 +59,54 @@ def move_files_to_folder(base_path, target_folder, directory_name):
         base_path: 基礎路徑
         target_folder: 目標資料夾路徑
         directory_name: 目錄名稱（用於檔案過濾）
+        log: 輸出函數，默認為 print
     
     Returns:
         移動的檔案數量
     """
     if not os.path.exists(base_path):
-        print(f"⚠️ 路徑不存在，跳過: {base_path}")
+        log(f"⚠️ 路徑不存在，跳過: {base_path}")
         return 0
     
     moved_count = 0
     skipped_count = 0
     
-    # 獲取基礎路徑中的所有檔案（不包括子資料夾）
-    for item in os.listdir(base_path):
-        item_path = os.path.join(base_path, item)
+    # 獲取基礎路徑中的所有項目（先取得完整列表，移動過程中不受目錄變化影響）
+    # DirEntry 已帶有檔案類型，is_file() 通常不需要額外的 stat 調用
+    with os.scandir(base_path) as it:
+        entries = list(it)
+    
+    for entry in entries:
+        item = entry.name
         
         # 只處理檔案，不處理資料夾
-        if os.path.isfile(item_path):
+        if entry.is_file():
             if should_move_file(item, directory_name):
                 try:
                     destination = os.path.join(target_folder, item)
-                    shutil.move(item_path, destination)
-                    print(f"✅ 移動檔案: {item} -> {target_folder}")
+                    try:
+                        # 目標資料夾在同一目錄下（同一檔案系統），直接 rename
+                        os.replace(entry.path, destination)
+                    except OSError:
+                        # 跨檔案系統等特殊情況，退回 shutil.move（必要時複製後刪除）
+                        shutil.move(entry.path, destination)
+                    log(f"✅ 移動檔案: {item} -> {target_folder}")
                     moved_count += 1
                 except Exception as e:
-                    print(f"❌ 移動檔案失敗: {item}, 錯誤: {e}")
+                    log(f"❌ 移動檔案失敗: {item}, 錯誤: {e}")
             else:
-                print(f"⏩ 跳過檔案: {item} (不符合移動條件)")
+                log(f"⏩ 跳過檔案: {item} (不符合移動條件)")
                 skipped_count += 1
         else:
-            print(f"📁 跳過資料夾: {item}")
+            log(f"📁 跳過資料夾: {item}")
     
     if skipped_count > 0:
-        print(f"ℹ️ 跳過了 {skipped_count} 個不相關檔案")
+        log(f"ℹ️ 跳過了 {skipped_count} 個不相關檔案")
     
     return moved_count
 
 
-def archive_directory(directory_name, folder_name, project_root):
+def archive_directory(directory_name, folder_name, project_root, log=print):
     """
     歸檔指定目錄的檔案到指定資料夾
     
@@ -107,29 +114,42 @@ def archive_directory(directory_name, folder_name, project_root):
         directory_name: 目錄名稱 (如 "FR_history")
         folder_name: 資料夾名稱 (如 "backup_0606")
         project_root: 專案根目錄
+        log: 輸出函數，默認為 print（並行處理時傳入 list.append 以緩存輸出）
     
     Returns:
         移動的檔案數量
     """
     base_path = os.path.join(project_root, "csv", directory_name)
     
-    print(f"\n📂 處理目錄: {base_path}")
+    log(f"\n📂 處理目錄: {base_path}")
     
     # 創建目標資料夾
     target_folder = create_folder(base_path, folder_name)
-    print(f"📁 創建資料夾: {target_folder}")
+    log(f"📁 創建資料夾: {target_folder}")
     
     # 移動檔案
-    moved_count = move_files_to_folder(base_path, target_folder, directory_name)
+    moved_count = move_files_to_folder(base_path, target_folder, directory_name, log)
     
     if moved_count > 0:
-        print(f"✅ 成功移動 {moved_count} 個檔案到 {target_folder}")
+        log(f"✅ 成功移動 {moved_count} 個檔案到 {target_folder}")
     else:
-        print(f"ℹ️ 沒有符合條件的檔案需要移動")
+        log(f"ℹ️ 沒有符合條件的檔案需要移動")
     
     return moved_count
 
 
+def archive_directory_buffered(directory_name, folder_name, project_root):
+    """
+    歸檔指定目錄，並將輸出緩存起來（供多執行緒並行歸檔時按目錄順序打印）
+    
+    Returns:
+        (移動的檔案數量, 輸出行列表)
+    """
+    lines = []
+    moved_count = archive_directory(directory_name, folder_name, project_root, log=lines.append)
+    return moved_count, lines
+
+
 def get_folder_name(args):
     """
     獲取要使用的資料夾名稱
@@ -204,16 +224,20 @@ def main():
         "Backtest"
     ]
     
-    total_moved = 0
+    # 各目錄本次移動的檔案數量
+    moved_by_dir = {}
     
-    # 處理每個目錄
-    for directory in directories:
-        if args.dry_run:
+    if args.dry_run:
+        # 預覽每個目錄
+        for directory in directories:
             base_path = os.path.join(project_root, "csv", directory)
             if os.path.exists(base_path):
-                all_files = [f for f in os.listdir(base_path) if os.path.isfile(os.path.join(base_path, f))]
-                relevant_files = [f for f in all_files if should_move_file(f, directory)]
-                skipped_files = [f for f in all_files if not should_move_file(f, directory)]
+                with os.scandir(base_path) as it:
+                    all_files = [entry.name for entry in it if entry.is_file()]
+                relevant_files = []
+                skipped_files = []
+                for f in all_files:
+                    (relevant_files if should_move_file(f, directory) else skipped_files).append(f)
                 
                 print(f"\n📂 {directory}: 發現 {len(all_files)} 個檔案")
                 
@@ -232,23 +256,28 @@ def main():
                 print(f"   👉 將創建資料夾: {os.path.join(base_path, folder_name)}")
             else:
                 print(f"\n📂 {directory}: 目錄不存在")
-        else:
-            moved_count = archive_directory(directory, folder_name, project_root)
-            total_moved += moved_count
+    else:
+        # 各目錄互不相關，以執行緒池並行歸檔（檔案移動主要是 I/O），輸出按目錄順序打印
+        with ThreadPoolExecutor(max_workers=len(directories)) as executor:
+            results = executor.map(
+                lambda directory: archive_directory_buffered(directory, folder_name, project_root),
+                directories
+            )
+            for directory, (moved_count, lines) in zip(directories, results):
+                for line in lines:
+                    print(line)
+                moved_by_dir[directory] = moved_count
     
     if args.dry_run:
         print(f"\n🔍 預覽完成 - 移除 --dry-run 參數來實際執行")
     else:
+        total_moved = sum(moved_by_dir.values())
         print(f"\n🎉 歸檔完成！總共移動了 {total_moved} 個檔案到資料夾 {folder_name}")
         
-        # 顯示最終結果
+        # 顯示最終結果（使用歸檔時統計的數量，不再重新掃描目標資料夾）
         print("\n📊 歸檔結果摘要:")
         for directory in directories:
-            base_path = os.path.join(project_root, "csv", directory)
-            target_folder = os.path.join(base_path, folder_name)
-            if os.path.exists(target_folder):
-                archived_files = [f for f in os.listdir(target_folder) if os.path.isfile(os.path.join(target_folder, f))]
-                print(f"   📁 {directory}/{folder_name}: {len(archived_files)} 個檔案")
+            print(f"   📁 {directory}/{folder_name}: {moved_by_dir[directory]} 個檔案")
 
 
 if __name__ == "__main__":
@@ -46,39 +46,45 @@ def prepare_test_data():
     conn = None
     try:
         conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
 
         print("正在植入完整的測試資料...")
 
-        for record in TEST_DATA:
-            # Step 1: Ensure the symbol exists.
-            cursor.execute(
-                "INSERT OR IGNORE INTO trading_pair (symbol, trading_pair) VALUES (?, ?)",
-                (record["symbol"], record["trading_pair"])
+        rows = [
+            (
+                record["symbol"],
+                record["trading_pair"],
+                record["binance_support"],
+                record["binance_list_date"],
+                record["bybit_support"],
+                record["bybit_list_date"]
             )
+            for record in TEST_DATA
+        ]
 
-            # Step 2: Update the record with the pre-filled test data.
-            cursor.execute(
+        # Both batches run in a single transaction (committed on success, rolled back on error).
+        with conn:
+            # Step 1: Ensure every symbol exists.
+            conn.executemany(
+                "INSERT OR IGNORE INTO trading_pair (symbol, trading_pair) VALUES (?1, ?2)",
+                [row[:2] for row in rows]
+            )
+
+            # Step 2: Update the records with the pre-filled test data.
+            conn.executemany(
                 """
                 UPDATE trading_pair
                 SET
-                    binance_support = ?,
-                    binance_list_date = ?,
-                    bybit_support = ?,
-                    bybit_list_date = ?
+                    binance_support = ?3,
+                    binance_list_date = ?4,
+                    bybit_support = ?5,
+                    bybit_list_date = ?6
                 WHERE
-                    symbol = ?
+                    symbol = ?1
                 """,
-                (
-                    record["binance_support"],
-                    record["binance_list_date"],
-                    record["bybit_support"],
-                    record["bybit_list_date"],
-                    record["symbol"]
-                )
+                rows
             )
-
-        conn.commit()
         
         print(f"\n成功植入或更新了 {len(TEST_DATA)} 筆測試資料。")
         print("資料庫已準備就緒，您可以直接運行 'fetch_FR_history_group_v2.py'。")
@@ -0,0 +1,38 @@
+"""
+共用的請求限速工具
+各抓取腳本（fetch_FR_history.py、fetch_FR_history_v2.py、market_cap_trading_pair.py 等）從此處導入，
+不必導入整個抓取腳本；各交易所的限額也只在這裡維護一份
+"""
+
+import threading
+import time
+
+# 各交易所公開的資金費率接口限額 -> (平均間隔秒數, 突發請求數)
+#   Binance: 500 次 / 5 分鐘 / IP；Bybit: 600 次 / 5 秒 / IP；Gate.io: 200 次 / 10 秒；OKX: 10 次 / 2 秒
+RATE_LIMITS = {
+    "binance": (0.6, 5),
+    "bybit": (0.1, 10),
+    "gate.io": (0.1, 10),
+    "okx": (0.2, 5),
+}
+
+
+class RateLimiter:
+    """
+    執行緒安全的令牌桶限速器：平均每 interval 秒放行一個請求，空閒時最多累積 burst 個令牌
+    可連續發出；不必等待上一個請求返回。burst=1 時即兩次請求至少間隔 interval 秒
+    """
+    def __init__(self, interval, burst=1):
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            next_time = max(now, self._next_time)
+            wait_time = next_time - (self.burst - 1) * self.interval - now
+            self._next_time = next_time + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
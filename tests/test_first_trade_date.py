@@ -0,0 +1,53 @@
+# tests/test_first_trade_date.py
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("ccxt")
+import get_first_trade_date  # noqa: E402
+
+# 合約模式下 ccxt 同時載入的現貨與永續市場（現貨 info 沒有上市時間）
+MARKETS = {
+    'CVC/USDT': {'symbol': 'CVC/USDT', 'spot': True, 'contract': False, 'info': {}},
+    'CVC/USDT:USDT': {'symbol': 'CVC/USDT:USDT', 'spot': False, 'contract': True,
+                      'info': {'onboardDate': '1569398400000'}},
+}
+
+
+class FakeExchange:
+    """只提供 markets 的交易所，任何網絡請求都會讓測試失敗"""
+
+    def __init__(self, markets):
+        self.markets = markets
+
+    async def fetch_ohlcv(self, *args, **kwargs):
+        raise AssertionError("markets 已有上市時間，不應請求K線")
+
+
+def test_future_prefers_contract_market():
+    assert get_first_trade_date.resolve_market_symbol(MARKETS, 'CVC/USDT', 'future') == 'CVC/USDT:USDT'
+
+
+def test_future_falls_back_to_plain_symbol():
+    spot_only = {'CVC/USDT': MARKETS['CVC/USDT']}
+    assert get_first_trade_date.resolve_market_symbol(spot_only, 'CVC/USDT', 'future') == 'CVC/USDT'
+
+
+def test_spot_keeps_spot_market():
+    assert get_first_trade_date.resolve_market_symbol(MARKETS, 'CVC/USDT', 'spot') == 'CVC/USDT'
+
+
+def test_missing_symbol_returns_none():
+    assert get_first_trade_date.resolve_market_symbol(MARKETS, 'ABC/USDT', 'future') is None
+
+
+def test_future_lookup_uses_listing_date_without_request(capsys):
+    asyncio.run(get_first_trade_date.get_earliest_date(
+        FakeExchange(MARKETS), 'binance', 'CVC/USDT', 'future', asyncio.Semaphore(1)
+    ))
+    output = capsys.readouterr().out
+    assert '最早上市日期為 2019-09-25' in output